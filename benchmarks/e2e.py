@@ -0,0 +1,412 @@
+#!/usr/bin/python3
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""End-to-end benchmarks of TerminalActivity under a virtual X server.
+
+Usage:
+
+    python3 benchmarks/e2e.py [--output results.json]
+    python3 benchmarks/e2e.py --compare old.json new.json
+
+The activity is started in a child process, under Xvfb and a private
+D-Bus session, with a throw-away HOME, Sugar profile and activity root.
+The Journal is replaced by a stub, so no datastore service is needed.
+Xvfb, dbus-run-session, VTE and sugar3 must be installed.
+
+Results are written as JSON: one entry per measurement with its value
+and unit, plus the git commit they were taken from.
+"""
+
+import argparse
+import json
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+BUNDLE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Size of the file printed with cat, in bytes
+CAT_SIZE = 16 * 1024 * 1024
+
+# Window titles set by the title churn benchmark
+TITLE_COUNT = 10000
+
+# Tabs and lines per tab of the write_file and read_file benchmarks
+SESSION_SIZES = ((1, 1000), (5, 1000), (10, 10000))
+
+NEW_TABS = 10
+
+# Triggers enabled for the second cat run; none of them match
+TRIGGER_COUNT = 50
+
+# Commands echoed to measure latency while another tab burns resources
+ECHO_COUNT = 50
+
+# Started in a tab to compete with the activity for CPU and memory; the
+# memory burner stops growing at 1 GiB and then keeps touching it. It
+# runs in a session of its own, which is killed afterwards, because
+# /bin/sh does not hang up background jobs when its tab closes.
+BURNER = ('for i in 1 2 3 4; do (while :; do :; done) & done; '
+          'python3 -c "b = [bytearray(1 << 20) for i in range(1024)]\n'
+          'while True: [m.__setitem__(0, 1) for m in b]"')
+
+TIMEOUT = 120
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=BUNDLE_PATH,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _start_xvfb():
+    """Start Xvfb on a free display and return (process, display)."""
+    read_fd, write_fd = os.pipe()
+    xvfb = subprocess.Popen(
+        ['Xvfb', '-displayfd', str(write_fd), '-screen', '0',
+         '1280x1024x24', '-nolisten', 'tcp'],
+        pass_fds=(write_fd,), stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        display = f.readline().strip()
+    if not display:
+        xvfb.kill()
+        raise RuntimeError('Xvfb did not start')
+    return xvfb, ':' + display
+
+
+def _stub_environment(root):
+    """Return an environment for the activity rooted in a temporary dir."""
+    home = os.path.join(root, 'home')
+    activity_root = os.path.join(root, 'activity')
+    for path in (home,
+                 os.path.join(activity_root, 'instance'),
+                 os.path.join(activity_root, 'data'),
+                 os.path.join(activity_root, 'tmp')):
+        os.makedirs(path)
+
+    environ = dict(os.environ)
+    environ.update({
+        'HOME': home,
+        'SHELL': '/bin/sh',
+        'SUGAR_PROFILE': 'benchmark',
+        'SUGAR_BUNDLE_PATH': BUNDLE_PATH,
+        'SUGAR_BUNDLE_ID': 'org.laptop.Terminal',
+        'SUGAR_BUNDLE_NAME': 'Terminal',
+        'SUGAR_BUNDLE_VERSION': '0',
+        'SUGAR_ACTIVITY_ROOT': activity_root,
+        'PYTHONPATH': BUNDLE_PATH,
+    })
+    return environ
+
+
+def run():
+    """Run the benchmarks in a child process and return the results."""
+    if shutil.which('Xvfb') is None:
+        raise RuntimeError('Xvfb is not installed')
+
+    root = tempfile.mkdtemp(prefix='terminal-bench-')
+    xvfb, display = _start_xvfb()
+    try:
+        environ = _stub_environment(root)
+        environ['DISPLAY'] = display
+        output = os.path.join(root, 'results.json')
+
+        argv = [sys.executable, os.path.abspath(__file__),
+                '--child', output, '--started', repr(time.time())]
+        if shutil.which('dbus-run-session') is not None:
+            argv = ['dbus-run-session', '--'] + argv
+        subprocess.check_call(argv, env=environ, cwd=BUNDLE_PATH,
+                              timeout=TIMEOUT * 10)
+
+        with open(output) as f:
+            results = json.load(f)
+    finally:
+        xvfb.kill()
+        xvfb.wait()
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {'commit': _git_commit(),
+            'timestamp': time.time(),
+            'python': sys.version.split()[0],
+            'results': results}
+
+
+class _Bench(object):
+    """The benchmarks themselves, run inside the child process."""
+
+    def __init__(self, started):
+        # terminal selects the Gtk and Vte versions, so import it first
+        import limits
+        import sugarterm
+        import terminal
+        import triggers
+
+        from gi.repository import GLib
+        from gi.repository import Gtk
+
+        from sugar3.activity.activityhandle import ActivityHandle
+        from sugar3.datastore import datastore
+
+        def write(ds_object, *args, **kwargs):
+            # Stub Journal: accept everything, store nothing
+            ds_object.object_id = 'benchmark'
+            reply_handler = kwargs.get('reply_handler')
+            if reply_handler is not None:
+                GLib.idle_add(reply_handler, ds_object.object_id)
+
+        datastore.write = write
+
+        self._sugarterm = sugarterm
+        self._triggers = triggers
+        self._limits = limits
+        self._gtk = Gtk
+        self._glib = GLib
+        self.results = {}
+
+        self._activity = terminal.TerminalActivity(
+            ActivityHandle(activity_id='benchmark'))
+        self._activity.show_all()
+        self._record('cold_start_to_first_prompt',
+                     self._wait_for_prompt(self._page(0).vt) - started, 's')
+
+    def _record(self, name, value, unit):
+        self.results[name] = {'value': value, 'unit': unit}
+
+    def _page(self, index):
+        return self._activity._notebook.get_nth_page(index)
+
+    def _wait(self, condition):
+        # Wake up regularly so the timeout is noticed without events
+        wakeup = self._glib.timeout_add(50, lambda: True)
+        deadline = time.monotonic() + TIMEOUT
+        try:
+            while not condition():
+                if time.monotonic() > deadline:
+                    raise RuntimeError('benchmark timed out')
+                self._gtk.main_iteration_do(True)
+        finally:
+            self._glib.source_remove(wakeup)
+        return time.time()
+
+    def _wait_for_prompt(self, vt):
+        changed = []
+        handler_id = vt.connect('contents-changed',
+                                lambda vt: changed.append(True))
+        now = self._wait(lambda: changed)
+        vt.disconnect(handler_id)
+        return now
+
+    def _run_to_exit(self, command):
+        """Run command in a new tab and return the seconds until it exits.
+        """
+        index = self._activity._create_tab(None)
+        vt = self._page(index).vt
+        self._wait_for_prompt(vt)
+        exited = []
+        vt.connect('child-exited', lambda vt, status: exited.append(True))
+        start = time.time()
+        vt.feed_child('exec sh -c %s\n' % shlex.quote(command))
+        return self._wait(lambda: exited) - start
+
+    def new_tab(self):
+        latencies = []
+        for i in range(NEW_TABS):
+            start = time.time()
+            index = self._activity._create_tab(None)
+            latencies.append(
+                self._wait_for_prompt(self._page(index).vt) - start)
+        self._record('new_tab_latency_mean', sum(latencies) / NEW_TABS, 's')
+        self._record('new_tab_latency_max', max(latencies), 's')
+        while self._activity._notebook.get_n_pages() > 1:
+            self._activity._close_tab(1)
+
+    def cat(self):
+        path = os.path.join(os.environ['HOME'], 'cat.txt')
+        line = b'The quick brown fox jumps over the lazy dog 0123456789\n'
+        with open(path, 'wb') as f:
+            f.write(line * (CAT_SIZE // len(line)))
+        size = os.path.getsize(path)
+        elapsed = self._run_to_exit('cat %s' % path)
+        throughput = size / elapsed / 1024 / 1024
+        self._record('cat_throughput', throughput, 'MiB/s')
+
+        # The same without flood mode, which no rate can then reach
+        flood_rows = self._sugarterm.FLOOD_ROWS
+        self._sugarterm.FLOOD_ROWS = float('inf')
+        try:
+            elapsed = self._run_to_exit('cat %s' % path)
+        finally:
+            self._sugarterm.FLOOD_ROWS = flood_rows
+        flood_off = size / elapsed / 1024 / 1024
+        self._record('cat_throughput_flood_off', flood_off, 'MiB/s')
+        self._record('flood_speedup',
+                     (throughput - flood_off) / flood_off * 100, '%')
+
+        # The same with triggers, which tabs created from now on use
+        trigger_list = [
+            self._triggers.Trigger('build', 'BUILD FAILED'),
+            self._triggers.Trigger('segv', 'Segmentation fault')]
+        trigger_list += [
+            self._triggers.Trigger('t%d' % i, 'no match %d [a-z]+ here' % i)
+            for i in range(TRIGGER_COUNT - len(trigger_list))]
+        self._activity._triggers = self._triggers.TriggerEngine(
+            trigger_list, lambda *args: None)
+        elapsed = self._run_to_exit('cat %s' % path)
+        with_triggers = size / elapsed / 1024 / 1024
+        self._record('cat_throughput_%d_triggers' % TRIGGER_COUNT,
+                     with_triggers, 'MiB/s')
+        self._record('trigger_slowdown',
+                     (throughput - with_triggers) / throughput * 100, '%')
+
+    def _echo_latency(self, vt):
+        """Return the mean seconds for a command's output to show."""
+        latencies = []
+        for i in range(ECHO_COUNT):
+            start = time.time()
+            vt.feed_child('echo %d\n' % i)
+            latencies.append(self._wait_for_prompt(vt) - start)
+        return sum(latencies) / len(latencies)
+
+    def contention(self):
+        """Measure echo latency next to a CPU and memory burner tab.
+
+        The burner runs once with the limits of terminalrc, and once
+        niced with its memory limited, as in the shell_* options.
+        """
+        index = self._activity._create_tab(None)
+        vt = self._page(index).vt
+        self._wait_for_prompt(vt)
+        self._record('echo_latency_idle', self._echo_latency(vt), 's')
+
+        default_limits = self._activity._limits
+        for name, shell_limits in (
+                ('default', default_limits),
+                ('limited', self._limits.ShellLimits(
+                    nice=19, ionice=(3, 0), memory=512 * 1024 * 1024))):
+            self._activity._limits = shell_limits
+            burner = self._activity._create_tab(None, select=False)
+            burner_vt = self._page(burner).vt
+            self._wait_for_prompt(burner_vt)
+            pid_path = os.path.join(os.environ['HOME'], 'burner.pid')
+            burner_vt.feed_child('setsid sh -c %s\n' % shlex.quote(
+                'echo $$ > %s.tmp; mv %s.tmp %s; %s' % (
+                    pid_path, pid_path, pid_path, BURNER)))
+            self._wait(lambda: os.path.exists(pid_path))
+            time.sleep(1)
+            try:
+                self._record('echo_latency_%s_burner' % name,
+                             self._echo_latency(vt), 's')
+            finally:
+                # The shell lets its background jobs run, so kill them
+                with open(pid_path) as f:
+                    os.killpg(int(f.read()), signal.SIGKILL)
+                os.unlink(pid_path)
+            self._activity._close_tab(burner)
+            self._wait(lambda: burner_vt.child_exited)
+        self._activity._limits = default_limits
+        self._activity._close_tab(index)
+
+    def title_churn(self):
+        elapsed = self._run_to_exit(
+            'i=0; while [ $i -lt %d ]; do printf "\\033]0;%%d\\007" $i; '
+            'i=$((i+1)); done' % TITLE_COUNT)
+        self._record('title_churn', TITLE_COUNT / elapsed, 'titles/s')
+
+    def save_restore(self):
+        activity = self._activity
+        activity.metadata['mime_type'] = 'text/plain'
+        path = os.path.join(os.environ['HOME'], 'session.json')
+        for tabs, lines in SESSION_SIZES:
+            while activity._notebook.get_n_pages() < tabs:
+                activity._create_tab(None)
+            for i in range(tabs):
+                vt = self._page(i).vt
+                vt.set_scrollback_lines(lines)
+                for n in range(lines):
+                    vt.feed(b'line %d of the benchmark session\r\n' % n)
+            self._wait(lambda: not self._gtk.events_pending())
+
+            name = '%dx%d' % (tabs, lines)
+            start = time.perf_counter()
+            activity.write_file(path)
+            self._record('write_file_%s' % name,
+                         time.perf_counter() - start, 's')
+            self._record('write_file_size_%s' % name,
+                         os.path.getsize(path), 'bytes')
+
+            start = time.perf_counter()
+            activity.read_file(path)
+            self._record('read_file_%s' % name,
+                         time.perf_counter() - start, 's')
+
+    def run(self):
+        self.new_tab()
+        self.cat()
+        self.contention()
+        self.title_churn()
+        self.save_restore()
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)['results']
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    for name in sorted(set(old) & set(new)):
+        before = old[name]['value']
+        after = new[name]['value']
+        change = (after - before) / before * 100 if before else 0
+        print('%-32s %12.4g %12.4g %+7.1f%% %s' % (
+            name, before, after, change, new[name]['unit']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--started', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.child:
+        bench = _Bench(args.started)
+        bench.run()
+        with open(args.child, 'w') as f:
+            json.dump(bench.results, f)
+    else:
+        results = json.dumps(run(), indent=1)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(results)
+        else:
+            print(results)
+
+
+if __name__ == '__main__':
+    main()
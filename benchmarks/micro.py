@@ -0,0 +1,338 @@
+#!/usr/bin/python3
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Micro-benchmarks of the Python side of TerminalActivity, display-free.
+
+Usage:
+
+    python3 benchmarks/micro.py [--output results.json] [--rounds N]
+    python3 benchmarks/micro.py --compare old.json new.json
+
+gi, VTE, Gtk and sugar3 are replaced by the stand-ins of standins.py,
+so this runs on any Linux box with Python 3 and nothing else. What is
+measured is the activity's own code: session serialization, file link
+lookup, terminalrc handling, link matching, notebook bookkeeping and
+resource sampling, with synthetic sessions of several sizes.
+
+Each benchmark reports the best time of its rounds, and the peak memory
+allocated by one more round traced with tracemalloc. Results use the
+JSON format of e2e.py, which compares them the same way. The run exits
+with status 1 if the resource monitor samples over its budget.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import standins
+from e2e import _git_commit
+from e2e import compare
+
+# Runs of each benchmark; the fastest is reported
+ROUNDS = 5
+
+# Tabs and lines per tab of the write_file and read_file benchmarks
+SESSION_SIZES = ((1, 1000), (5, 1000), (10, 10000))
+
+# Candidates looked up per is_file_on_local_server run, and the lines
+# of the file searched for "file::function" candidates
+FILE_CANDIDATES = 1000
+SOURCE_SIZES = (100, 10000)
+
+# Trigger sections in terminalrc for the read_config benchmark
+CONFIG_SIZES = (0, 100, 1000)
+
+# Link matches resolved per handleTerminalMatch run
+MATCH_COUNT = 100000
+
+# Tabs opened, looked up, resized and closed by the notebook benchmark
+NOTEBOOK_SIZES = (10, 100)
+
+# Tabs sampled by the resource monitor benchmark, each running a shell
+# with one child
+MONITOR_TABS = 30
+
+# Options SugarTerminal reads with _get_conf, with their defaults
+CONF_OPTIONS = (('cursor_blink', False), ('bell', False),
+                ('scrollback_lines', 1000), ('scroll_on_keystroke', True),
+                ('scroll_on_output', False), ('emulation', 'xterm'),
+                ('visible_bell', False), ('font', 'Monospace'),
+                ('bracketed_paste', True), ('shell_integration', True))
+
+
+class _Bench(object):
+
+    def __init__(self, scratch, rounds):
+        standins.install(scratch)
+        # terminal imports everything else, so import it first
+        import terminal
+
+        from sugar3.activity.activityhandle import ActivityHandle
+
+        logging.getLogger('Terminal').setLevel(logging.WARNING)
+        self._scratch = scratch
+        self._rounds = rounds
+        self.results = {}
+        # Benchmarks over their budget
+        self.failures = []
+        self._activity = terminal.TerminalActivity(
+            ActivityHandle(activity_id='benchmark'))
+        self._vt = self._activity._notebook.get_nth_page(0).vt
+
+    def _record(self, name, value, unit):
+        self.results[name] = {'value': value, 'unit': unit}
+
+    def _measure(self, name, func, setup=None):
+        """Record the best time of func and its peak memory use."""
+        times = []
+        for i in range(self._rounds):
+            if setup is not None:
+                setup()
+            gc.collect()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        self._record(name, min(times), 's')
+
+        if setup is not None:
+            setup()
+        gc.collect()
+        # Tracing slows the round down, so what it logs of its own time,
+        # like the resource monitor's budget warning, means nothing
+        logging.disable(logging.WARNING)
+        tracemalloc.start()
+        try:
+            func()
+            current_, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            logging.disable(logging.NOTSET)
+        self._record(name + '_peak_memory', peak, 'bytes')
+
+    def _check_budget(self, name, budget):
+        """Fail the run if the best time of name is over budget."""
+        value = self.results[name]['value']
+        if value > budget:
+            self.failures.append('%s took %.1fms, over the budget of '
+                                 '%.1fms' % (name, value * 1000,
+                                             budget * 1000))
+
+    def _set_tabs(self, count):
+        activity = self._activity
+        while activity._notebook.get_n_pages() < count:
+            activity._create_tab(None, select=False)
+        while activity._notebook.get_n_pages() > count:
+            activity._close_tab(activity._notebook.get_n_pages() - 1)
+
+    def save_restore(self):
+        activity = self._activity
+        activity.metadata['mime_type'] = 'text/plain'
+        path = os.path.join(self._scratch, 'session.json')
+        for tabs, lines in SESSION_SIZES:
+            def fill():
+                self._set_tabs(tabs)
+                for box in activity.get_tabs():
+                    box.vt.set_scrollback_lines(lines)
+                    for n in range(lines):
+                        box.vt.feed(
+                            b'line %d of the benchmark session\r\n' % n)
+
+            name = '%dx%d' % (tabs, lines)
+            fill()
+            self._measure('write_file_' + name,
+                          lambda: activity.write_file(path))
+            self._record('write_file_size_' + name,
+                         os.path.getsize(path), 'bytes')
+            self._measure('read_file_' + name,
+                          lambda: activity.read_file(path))
+        self._set_tabs(1)
+
+    def file_lookup(self):
+        home = os.environ['HOME']
+        vt = self._vt
+        for size in SOURCE_SIZES:
+            source = os.path.join(home, 'source%d.py' % size)
+            with open(source, 'w') as f:
+                for i in range(size - 1):
+                    f.write('x%d = %d\n' % (i, i))
+                f.write('def target():\n')
+            candidates = [source,
+                          os.path.basename(source),
+                          '%s:12' % source,
+                          '%s:12:3' % source,
+                          '%s::target' % os.path.basename(source),
+                          'missing.py:1',
+                          'not a file name']
+            candidates = (candidates * FILE_CANDIDATES)[:FILE_CANDIDATES]
+
+            def lookup():
+                for text in candidates:
+                    vt.is_file_on_local_server(text)
+
+            self._measure('is_file_on_local_server_%d' % size, lookup)
+
+    def config(self):
+        vt = self._vt
+        conf_file = os.path.join(self._scratch, 'profile', 'terminalrc')
+        for size in CONFIG_SIZES:
+            with open(conf_file, 'w') as f:
+                f.write('[terminal]\n')
+                for option, default in CONF_OPTIONS:
+                    f.write('%s = %s\n' % (option, default))
+                for i in range(size):
+                    f.write('[trigger t%d]\npattern = no match %d\n'
+                            'action = notify\n' % (i, i))
+            self._measure('read_config_%d' % size, vt.read_config)
+
+        def get_conf():
+            for option, default in CONF_OPTIONS:
+                vt._get_conf(vt.conf, option, default)
+                vt._get_conf(vt.conf, 'unset_' + option, default)
+
+        self._measure('get_conf', lambda: [get_conf() for i in range(1000)])
+        os.unlink(conf_file)
+
+    def matches(self):
+        vt = self._vt
+        matched = [('example.org/%d' % i, i % 6)
+                   for i in range(MATCH_COUNT)]
+
+        def resolve():
+            for match in matched:
+                vt.handleTerminalMatch(match)
+
+        self._measure('handle_terminal_match', resolve)
+
+    def notebook(self):
+        activity = self._activity
+        notebook = activity._notebook
+        for size in NOTEBOOK_SIZES:
+            def cycle():
+                boxes = activity.open_tabs(size)
+                for box in activity.get_tabs():
+                    activity.get_tab(activity.get_tab_id(box))
+                # A resize redraws the tabs
+                notebook.width = 0
+                notebook.emit('draw', None)
+                activity.close_tabs(boxes)
+
+            self._measure('notebook_%d_tabs' % size, cycle)
+
+    def monitor(self):
+        from monitor import MONITOR_BUDGET
+
+        activity = self._activity
+        monitor = activity._monitor
+        self._set_tabs(MONITOR_TABS)
+        processes = []
+        try:
+            for box in activity.get_tabs():
+                process = subprocess.Popen(
+                    ['/bin/sh', '-c', 'sleep 600 & wait'],
+                    start_new_session=True)
+                processes.append(process)
+                box.pid = process.pid
+            # Wait for the shells to start their child
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline and not all(
+                    _has_children(process.pid) for process in processes):
+                time.sleep(0.01)
+
+            # The first samples open the /proc files, later ones re-read
+            name = 'monitor_first_sample_%d_tabs' % MONITOR_TABS
+            self._measure(name, monitor.sample, setup=monitor.close)
+            self._check_budget(name, MONITOR_BUDGET)
+            monitor.close()
+            monitor.sample()
+            while monitor.opening:
+                monitor.sample()
+            name = 'monitor_sample_%d_tabs' % MONITOR_TABS
+            self._measure(name, monitor.sample)
+            self._check_budget(name, MONITOR_BUDGET)
+        finally:
+            monitor.close()
+            for process in processes:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+            self._set_tabs(1)
+
+    def run(self):
+        self.save_restore()
+        self.file_lookup()
+        self.config()
+        self.matches()
+        self.notebook()
+        self.monitor()
+
+
+def _has_children(pid):
+    with open('/proc/%d/task/%d/children' % (pid, pid)) as f:
+        return bool(f.read().split())
+
+
+def run(rounds=ROUNDS):
+    scratch = tempfile.mkdtemp(prefix='terminal-micro-')
+    try:
+        bench = _Bench(scratch, rounds)
+        bench.run()
+    finally:
+        standins.uninstall()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {'commit': _git_commit(),
+            'timestamp': time.time(),
+            'python': sys.version.split()[0],
+            'results': bench.results,
+            'failures': bench.failures}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files')
+    parser.add_argument('--rounds', type=int, default=ROUNDS,
+                        help='runs of each benchmark (default %d)' % ROUNDS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args.rounds)
+    results = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(results)
+    else:
+        print(results)
+    for failure in report['failures']:
+        print('FAIL %s' % failure, file=sys.stderr)
+    sys.exit(1 if report['failures'] else 0)
+
+
+if __name__ == '__main__':
+    main()
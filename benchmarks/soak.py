@@ -0,0 +1,361 @@
+#!/usr/bin/python3
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Soak checks of TerminalActivity for leaks, display-free.
+
+Usage:
+
+    python3 benchmarks/soak.py [--cycles N] [--clicks N]
+
+The activity runs on the stand-ins of standins.py, with a small main
+loop that runs the timeouts and idle callbacks they drop, and with real
+shells, each in its own session on its own PTY. When a shell exits, its
+terminal emits child-exited, and destroying a terminal closes its PTY,
+as with VTE.
+
+Each check repeats an action many times and fails if a count measured
+after the first repetition keeps growing afterwards, or if a process of
+a closed tab is still running. It prints one line per check and exits
+with status 1 if any check failed.
+"""
+
+import argparse
+import fcntl
+import gc
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import termios
+import time
+
+import standins
+
+# Right clicks on each tab, and tabs clicked on
+RIGHT_CLICKS = 2000
+CLICKED_TABS = 3
+
+# Times tabs are opened and closed, and tabs opened each time
+TAB_CYCLES = 20
+CYCLE_TABS = 10
+
+# Seconds the main loop is given to reap the shells of closed tabs
+REAP_TIMEOUT = 10
+
+
+class _Loop(object):
+    """The main loop and the VTE child watches that stand-ins lack."""
+
+    def __init__(self):
+        self._sources = {}
+        self._next_id = 1
+        self._children = {}
+        self.sessions = set()
+
+    def install(self):
+        from gi.repository import GLib
+
+        GLib.timeout_add = self.timeout_add
+        GLib.timeout_add_seconds = self.timeout_add_seconds
+        GLib.idle_add = self.idle_add
+        GLib.io_add_watch = self.io_add_watch
+        GLib.source_remove = self.source_remove
+        loop = self
+
+        def spawn_sync(terminal, *args, **kwargs):
+            return loop._spawn(terminal, *args, **kwargs)
+
+        standins.Terminal.spawn_sync = spawn_sync
+        standins.Terminal.get_pty = _get_pty
+        standins.Terminal.destroy = _destroy
+
+    def _add(self, interval, callback, args):
+        source_id = self._next_id
+        self._next_id += 1
+        self._sources[source_id] = [time.monotonic() + interval, interval,
+                                    callback, args]
+        return source_id
+
+    def timeout_add(self, interval, callback, *args, **kwargs):
+        return self._add(interval / 1000, callback, args)
+
+    def timeout_add_seconds(self, interval, callback, *args, **kwargs):
+        return self._add(interval, callback, args)
+
+    def idle_add(self, callback, *args, **kwargs):
+        return self._add(0, callback, args)
+
+    def io_add_watch(self, fd, priority, condition, callback, *args):
+        # PTYs are always writable here
+        return self._add(0, callback, (fd, condition) + args)
+
+    def source_remove(self, source_id):
+        return self._sources.pop(source_id, None) is not None
+
+    def _spawn(self, terminal, pty_flags, working_directory, argv, envv,
+               spawn_flags, child_setup, child_setup_data,
+               cancellable=None):
+        master, slave = os.openpty()
+
+        def set_controlling_terminal():
+            fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+
+        env = dict(os.environ)
+        env.update(entry.split('=', 1) for entry in envv)
+        # A background job in its own process group, which a SIGHUP to
+        # the shell's group does not reach
+        process = subprocess.Popen(
+            ['/bin/sh', '-c', 'set -m; sleep 600 & sleep 600'],
+            cwd=working_directory, env=env, stdin=slave, stdout=slave,
+            stderr=slave, start_new_session=True,
+            preexec_fn=set_controlling_terminal)
+        os.close(slave)
+        terminal._soak_pty = _Pty(master)
+        self._children[process] = terminal
+        self.sessions.add(process.pid)
+        return True, process.pid
+
+    def iterate(self):
+        now = time.monotonic()
+        for source_id, source in list(self._sources.items()):
+            if source_id not in self._sources or source[0] > now:
+                continue
+            due_, interval, callback, args = source
+            if callback(*args):
+                source[0] = now + interval
+            else:
+                self._sources.pop(source_id, None)
+        for process, terminal in list(self._children.items()):
+            status = process.poll()
+            if status is not None:
+                del self._children[process]
+                terminal.emit('child-exited', status)
+
+    def run_until(self, predicate, timeout):
+        deadline = time.monotonic() + timeout
+        while not predicate() and time.monotonic() < deadline:
+            self.iterate()
+            time.sleep(0.01)
+        return predicate()
+
+    @property
+    def children(self):
+        return len(self._children)
+
+    def kill_all(self):
+        """Kill whatever is left of the shells, so that none outlive us."""
+        # A shell may be forking a job while its session is listed
+        deadline = time.monotonic() + REAP_TIMEOUT
+        pids = _session_processes(self.sessions)
+        while pids and time.monotonic() < deadline:
+            for pid in pids:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            for process in self._children:
+                process.poll()
+            time.sleep(0.01)
+            pids = _session_processes(self.sessions)
+        for process in self._children:
+            process.wait()
+
+
+def _session_processes(sessions):
+    """Return the pids of the live processes in any of sessions."""
+    pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % name) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may hold spaces, the fields after it do not
+        fields = stat[stat.rindex(')') + 2:].split()
+        if fields[0] != 'Z' and int(fields[3]) in sessions:
+            pids.append(int(name))
+    return pids
+
+
+class _Pty(object):
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def get_fd(self):
+        return self.fd
+
+
+def _get_pty(terminal):
+    return terminal.__dict__.get('_soak_pty')
+
+
+def _destroy(terminal):
+    pty = terminal.__dict__.pop('_soak_pty', None)
+    if pty is not None:
+        os.close(pty.fd)
+
+
+class _RightClick(object):
+
+    button = 3
+    x = 0
+    y = 0
+
+    def __init__(self):
+        from gi.repository import Gdk
+
+        self.type = Gdk.EventType.BUTTON_PRESS
+
+    def get_state(self):
+        return 0
+
+
+def _count_handlers():
+    gc.collect()
+    return sum(len(obj.__dict__.get('_standin_handlers', ()))
+               for obj in gc.get_objects()
+               if isinstance(obj, standins.GObject))
+
+
+def _count_palette_widgets():
+    import palette
+
+    gc.collect()
+    return sum(1 for obj in gc.get_objects()
+               if isinstance(obj, (palette.TerminalPalette,
+                                   palette.ContentInvoker,
+                                   palette.PaletteMenuItem)))
+
+
+class _Soak(object):
+
+    def __init__(self, scratch, loop):
+        standins.install(scratch)
+        self._loop = loop
+        self._loop.install()
+        # terminal imports everything else, so import it first
+        import terminal
+        import logging
+
+        from sugar3.activity.activityhandle import ActivityHandle
+
+        logging.getLogger('Terminal').setLevel(logging.WARNING)
+        self.failed = False
+        self._activity = terminal.TerminalActivity(
+            ActivityHandle(activity_id='soak'))
+
+    def _report(self, name, counts):
+        """Check that counts did not grow after the first repetition."""
+        ok = True
+        for what, values in counts.items():
+            if max(values[1:]) > values[1]:
+                ok = False
+        if max(counts.get('processes left', [0])):
+            ok = False
+        self.failed = self.failed or not ok
+        print('%s %s: %s' % ('ok' if ok else 'FAIL', name, ', '.join(
+            '%s %s' % (what, ' -> '.join(str(v) for v in values))
+            for what, values in counts.items())))
+
+    def right_clicks(self, clicks):
+        activity = self._activity
+        boxes = activity.open_tabs(CLICKED_TABS)
+        counts = {'handlers': [_count_handlers()],
+                  'palette widgets': [_count_palette_widgets()]}
+        for n in range(4):
+            for box in boxes:
+                vt = box.vt
+                vt.match_check_event = lambda event: ('example.org', 0)
+                for i in range(clicks // 4):
+                    vt.button_press(vt, _RightClick())
+            counts['handlers'].append(_count_handlers())
+            counts['palette widgets'].append(_count_palette_widgets())
+        activity.close_tabs(boxes)
+        self._reap()
+        self._report('%d right clicks on %d tabs' % (clicks, len(boxes)),
+                     counts)
+
+    def tab_cycles(self, cycles):
+        activity = self._activity
+        counts = {'handlers': [_count_handlers()],
+                  'palette widgets': [_count_palette_widgets()],
+                  'fds': [self._count_fds()],
+                  'processes left': [0]}
+        for n in range(cycles):
+            boxes = activity.open_tabs(CYCLE_TABS)
+            sessions = set(box.pid for box in boxes)
+            for box in boxes:
+                box.vt.get_content_invoker().popup_for(None)
+            activity.close_tabs(boxes)
+            left = self._reap(sessions)
+            counts['handlers'].append(_count_handlers())
+            counts['palette widgets'].append(_count_palette_widgets())
+            counts['fds'].append(self._count_fds())
+            counts['processes left'].append(len(left))
+        self._report('%d times %d tabs opened and closed' % (
+            cycles, CYCLE_TABS), counts)
+
+    def _count_fds(self):
+        # The resource monitor keeps the /proc files of running tabs open,
+        # and closes those of closed tabs on its next sample
+        self._activity._monitor.sample()
+        return len(os.listdir('/proc/self/fd'))
+
+    def _reap(self, sessions=()):
+        """Run the loop until the shells and sessions of closed tabs end.
+
+        Return the pids still running in those sessions.
+        """
+        # Only the first tab stays open
+        def done():
+            return self._loop.children <= 1 and \
+                not _session_processes(sessions)
+
+        self._loop.run_until(done, REAP_TIMEOUT)
+        return _session_processes(sessions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cycles', type=int, default=TAB_CYCLES,
+                        help='times tabs are opened and closed '
+                        '(default %d)' % TAB_CYCLES)
+    parser.add_argument('--clicks', type=int, default=RIGHT_CLICKS,
+                        help='right clicks on each tab '
+                        '(default %d)' % RIGHT_CLICKS)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='terminal-soak-')
+    loop = _Loop()
+    try:
+        soak = _Soak(scratch, loop)
+        soak.right_clicks(args.clicks)
+        soak.tab_cycles(args.cycles)
+    finally:
+        loop.kill_all()
+        standins.uninstall()
+        shutil.rmtree(scratch, ignore_errors=True)
+    sys.exit(1 if soak.failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,577 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Stand-ins for gi, sugar3, dbus and cairo, to import the activity
+without them.
+
+install() puts modules in sys.modules that are just real enough for the
+Python side of the activity to run without a display, VTE or Sugar:
+
+ - Vte.Terminal keeps the text fed to it as rows, with a scrollback
+   limit, and "spawns" a helper process that ignores SIGHUP, so the
+   /proc lookups and the reaper of closed tabs have a live pid
+ - Gtk.Notebook keeps its pages and current page, and emits switch-page
+ - Activity, env and the terminalrc paths point to a scratch directory
+ - palette Invokers start without a palette, like the real ones
+ - GObject signals are connected and emitted synchronously
+
+Everything else accepts any call and returns a permissive placeholder.
+The main loop never runs: idle and timeout callbacks are dropped.
+Nothing here is used by the activity itself.
+"""
+
+import collections
+import importlib.machinery
+import itertools
+import os
+import signal
+import subprocess
+import sys
+import types
+
+BUNDLE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages whose attributes are submodules rather than classes
+_PACKAGES = ('gi', 'gi.repository', 'sugar3', 'sugar3.activity',
+             'sugar3.graphics', 'sugar3.datastore', 'dbus')
+
+_source_ids = itertools.count(1)
+_handler_ids = itertools.count(1)
+
+
+class _Anything(object):
+    """Whatever a stand-in has no better answer for."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return _Anything()
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return _Anything()
+
+    def __getitem__(self, key):
+        return _Anything()
+
+    def __iter__(self):
+        return iter(())
+
+    def __or__(self, other):
+        return self
+
+    __ror__ = __and__ = __rand__ = __or__
+
+
+class _StandInType(type):
+    """Class attributes that are not defined are enum values or methods.
+    """
+
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if name.isupper():
+            return 0
+        if name == 'new' or name.startswith('new_'):
+            return lambda *args, **kwargs: cls()
+        return _Anything()
+
+
+class _Props(object):
+
+    def __init__(self, owner):
+        object.__setattr__(self, '_owner', owner)
+
+    def __getattr__(self, name):
+        return self._owner.get_property(name)
+
+    def __setattr__(self, name, value):
+        self._owner.set_property(name, value)
+
+
+class _Allocation(object):
+
+    def __init__(self, width, height):
+        self.x = 0
+        self.y = 0
+        self.width = width
+        self.height = height
+
+
+class GObject(object, metaclass=_StandInType):
+    """Base of every stand-in class, like GObject.GObject.
+
+    Subclasses often skip __init__ (widgets call GObject.GObject.__init__
+    directly), so state is created on first use.
+    """
+
+    # Methods hasattr() must not find, as on the real class
+    _missing = ()
+
+    def __init__(self, *args, **kwargs):
+        for name, value in kwargs.items():
+            self.set_property(name, value)
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in type(self)._missing:
+            raise AttributeError(name)
+        return _Anything()
+
+    def _state(self, name, factory):
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            return self.__dict__.setdefault(name, factory())
+
+    @property
+    def props(self):
+        return _Props(self)
+
+    def get_property(self, name):
+        return self._state('_standin_props', dict).get(
+            name.replace('-', '_'))
+
+    def set_property(self, name, value):
+        self._state('_standin_props', dict)[name.replace('-', '_')] = value
+
+    def connect(self, signal_name, callback, *data):
+        handler_id = next(_handler_ids)
+        self._state('_standin_handlers', dict)[handler_id] = (
+            signal_name, callback, data)
+        return handler_id
+
+    connect_after = connect
+
+    def disconnect(self, handler_id):
+        self._state('_standin_handlers', dict).pop(handler_id, None)
+
+    def handler_is_connected(self, handler_id):
+        return handler_id in self._state('_standin_handlers', dict)
+
+    def disconnect_by_func(self, callback):
+        handlers = self._state('_standin_handlers', dict)
+        for handler_id, handler in list(handlers.items()):
+            if handler[1] == callback:
+                del handlers[handler_id]
+
+    def handler_block(self, handler_id):
+        pass
+
+    def handler_unblock(self, handler_id):
+        pass
+
+    def emit(self, signal_name, *args):
+        result = None
+        handlers = self._state('_standin_handlers', dict)
+        for name, callback, data in list(handlers.values()):
+            if name == signal_name:
+                result = callback(self, *(args + data))
+        return result
+
+    def get_allocation(self):
+        return _Allocation(800, 600)
+
+
+class _NotebookState(object):
+
+    def __init__(self):
+        self.pages = []
+        self.labels = []
+        self.current = -1
+
+
+class Notebook(GObject):
+
+    def _pages(self):
+        return self._state('_standin_notebook', _NotebookState)
+
+    def append_page(self, child, label=None):
+        state = self._pages()
+        state.pages.append(child)
+        state.labels.append(label)
+        if state.current == -1:
+            self.set_current_page(0)
+        return len(state.pages) - 1
+
+    def remove_page(self, index):
+        state = self._pages()
+        del state.pages[index]
+        del state.labels[index]
+        if not state.pages:
+            state.current = -1
+        elif index < state.current:
+            # The current page stays the same, at a new index
+            state.current -= 1
+        elif index == state.current:
+            state.current = min(index, len(state.pages) - 1)
+            self.emit('switch-page', state.pages[state.current],
+                      state.current)
+
+    def get_n_pages(self):
+        return len(self._pages().pages)
+
+    def get_nth_page(self, index):
+        pages = self._pages().pages
+        if 0 <= index < len(pages):
+            return pages[index]
+        return None
+
+    def page_num(self, child):
+        for i, page in enumerate(self._pages().pages):
+            if page is child:
+                return i
+        return -1
+
+    def get_tab_label(self, child):
+        state = self._pages()
+        return state.labels[self.page_num(child)]
+
+    def get_current_page(self):
+        return self._pages().current
+
+    def set_current_page(self, index):
+        state = self._pages()
+        if index < 0 or index >= len(state.pages):
+            index = len(state.pages) - 1
+        if index != state.current:
+            state.current = index
+            self.emit('switch-page', state.pages[index], index)
+
+    def get_property(self, name):
+        if name == 'page':
+            return self.get_current_page()
+        return GObject.get_property(self, name)
+
+    def set_property(self, name, value):
+        if name == 'page':
+            self.set_current_page(value)
+        else:
+            GObject.set_property(self, name, value)
+
+
+class FontDescription(GObject):
+
+    def __init__(self, name='Monospace 12'):
+        GObject.__init__(self)
+        self._size = 12 * 1024
+
+    def get_size(self):
+        return self._size
+
+    def set_size(self, size):
+        self._size = size
+
+    def to_string(self):
+        return 'Monospace %d' % (self._size // 1024)
+
+
+class Adjustment(GObject):
+
+    def __init__(self, lower, upper, page_size):
+        GObject.__init__(self)
+        self._lower = lower
+        self._upper = upper
+        self._page_size = page_size
+
+    def get_lower(self):
+        return float(self._lower)
+
+    def get_upper(self):
+        return float(self._upper)
+
+    def get_page_size(self):
+        return float(self._page_size)
+
+    def get_value(self):
+        return float(max(self._lower, self._upper - self._page_size))
+
+
+class _Screen(object):
+
+    def __init__(self):
+        self.rows = collections.deque([''])
+        # Row number of rows[0], counted since the terminal started
+        self.first_row = 0
+        self.scrollback_lines = 1000
+        self.font = FontDescription()
+        self.title = None
+
+
+class Terminal(GObject):
+    """Keeps the text fed to it; 24 rows of 80 columns plus scrollback."""
+
+    _missing = ('fork_command_full', 'set_emulation')
+
+    ROWS = 24
+    COLUMNS = 80
+
+    def _screen(self):
+        return self._state('_standin_screen', _Screen)
+
+    def feed(self, data):
+        screen = self._screen()
+        text = data.decode('utf-8', 'replace') if isinstance(
+            data, bytes) else data
+        lines = text.replace('\r\n', '\n').replace('\r', '').split('\n')
+        screen.rows[-1] += lines[0]
+        screen.rows.extend(lines[1:])
+        excess = len(screen.rows) - screen.scrollback_lines - self.ROWS
+        for i in range(excess):
+            screen.rows.popleft()
+        if excess > 0:
+            screen.first_row += excess
+
+    def feed_child_binary(self, data):
+        pass
+
+    def set_scrollback_lines(self, lines):
+        self._screen().scrollback_lines = max(0, lines)
+        self.feed(b'')
+
+    def get_cursor_position(self):
+        screen = self._screen()
+        return len(screen.rows[-1]), screen.first_row + len(screen.rows) - 1
+
+    def get_row_count(self):
+        return self.ROWS
+
+    def get_column_count(self):
+        return self.COLUMNS
+
+    def get_vadjustment(self):
+        screen = self._screen()
+        return Adjustment(screen.first_row,
+                          screen.first_row + max(len(screen.rows),
+                                                 self.ROWS),
+                          self.ROWS)
+
+    def get_text_format(self, text_format):
+        return '\n'.join(self._screen().rows)
+
+    def get_text(self, is_selected=None, data=None):
+        return self.get_text_format(0), []
+
+    def get_text_range_format(self, text_format, start_row, start_col,
+                              end_row, end_col):
+        screen = self._screen()
+        start = max(0, start_row - screen.first_row)
+        end = max(0, end_row - screen.first_row + 1)
+        text = '\n'.join(itertools.islice(screen.rows, start, end)) + '\n'
+        return text, len(text)
+
+    def get_text_range(self, start_row, start_col, end_row, end_col,
+                       is_selected=None, data=None):
+        return self.get_text_range_format(
+            0, start_row, start_col, end_row, end_col)[0], []
+
+    def get_font(self):
+        return self._screen().font
+
+    def set_font(self, font_desc):
+        self._screen().font = font_desc
+
+    def get_window_title(self):
+        return self._screen().title
+
+    def get_pty(self):
+        return None
+
+    def get_has_selection(self):
+        return False
+
+    def spawn_sync(self, pty_flags, working_directory, argv, envv,
+                   spawn_flags, child_setup, child_setup_data,
+                   cancellable=None):
+        return True, shell_pid()
+
+
+class Invoker(GObject):
+
+    palette = None
+
+
+class Activity(GObject):
+
+    def __init__(self, handle=None, *args, **kwargs):
+        GObject.__init__(self)
+        self.metadata = {'mime_type': '', 'title': 'Terminal Activity'}
+        self.shared_activity = None
+
+    def _Window__key_press_cb(self, window, event):
+        return False
+
+    def get_activity_root(self):
+        return get_activity_root()
+
+    def get_bundle_id(self):
+        return 'org.laptop.Terminal'
+
+
+class _StandInModule(types.ModuleType):
+    """Creates whatever attribute is asked for on first use."""
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self.__name__ in _PACKAGES:
+            value = _load_module('%s.%s' % (self.__name__, name))
+        elif name.isupper():
+            value = 0
+        elif name[:1].isupper():
+            value = _StandInType(name, (GObject,),
+                                 {'__module__': self.__name__})
+        else:
+            value = _Anything()
+        setattr(self, name, value)
+        return value
+
+
+def _load_module(name):
+    module = sys.modules.get(name)
+    if module is None:
+        module = _StandInModule(name)
+        if name in _PACKAGES:
+            module.__path__ = []
+        sys.modules[name] = module
+        parent, sep_, child = name.rpartition('.')
+        if parent:
+            setattr(_load_module(parent), child, module)
+    return module
+
+
+class _Finder(object):
+    """Serves stand-ins for every module of the replaced packages."""
+
+    def find_spec(self, name, path=None, target=None):
+        if name.split('.')[0] in ('gi', 'sugar3', 'dbus', 'cairo'):
+            return importlib.machinery.ModuleSpec(name, self)
+        return None
+
+    def create_module(self, spec):
+        return _load_module(spec.name)
+
+    def exec_module(self, module):
+        pass
+
+
+_scratch = None
+_shell = None
+
+
+def get_activity_root():
+    return os.path.join(_scratch, 'activity')
+
+
+def _ignore_sighup():
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+
+def shell_pid():
+    """Return the pid of the process standing in for every shell.
+
+    It ignores SIGHUP from before it starts, as closed tabs are sent one
+    right away, and is only killed by uninstall().
+    """
+    global _shell
+    if _shell is None:
+        _shell = subprocess.Popen(
+            [sys.executable, '-c', 'import signal; signal.pause()'],
+            cwd=os.environ['HOME'], stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, preexec_fn=_ignore_sighup,
+            start_new_session=True)
+    return _shell.pid
+
+
+def _timeout_add(*args, **kwargs):
+    return next(_source_ids)
+
+
+class _GLibError(Exception):
+
+    def __init__(self, message=''):
+        Exception.__init__(self, message)
+        self.message = message
+
+
+def install(scratch):
+    """Install the stand-ins, with HOME and the Sugar profile in scratch.
+    """
+    global _scratch
+    _scratch = scratch
+    for name in ('home', 'profile', 'activity/instance', 'activity/data',
+                 'activity/tmp'):
+        os.makedirs(os.path.join(scratch, name), exist_ok=True)
+    os.environ['HOME'] = os.path.join(scratch, 'home')
+    os.environ['SHELL'] = '/bin/sh'
+    os.environ['SUGAR_BUNDLE_PATH'] = BUNDLE_PATH
+    os.environ['SUGAR_BUNDLE_VERSION'] = '0'
+    os.environ['SUGAR_ACTIVITY_ROOT'] = get_activity_root()
+
+    sys.meta_path.insert(0, _Finder())
+
+    gi = _load_module('gi')
+    gi.require_version = lambda namespace, version: None
+
+    glib = _load_module('gi.repository.GLib')
+    glib.idle_add = _timeout_add
+    glib.timeout_add = _timeout_add
+    glib.timeout_add_seconds = _timeout_add
+    glib.io_add_watch = _timeout_add
+    glib.source_remove = lambda source_id: True
+    glib.Error = _GLibError
+    glib.markup_escape_text = lambda text, length=-1: text
+    glib.format_size = lambda size: '%d bytes' % size
+
+    _load_module('gi.repository.GObject').GObject = GObject
+    _load_module('gi.repository.Gtk').Notebook = Notebook
+    _load_module('gi.repository.Gtk').Adjustment = Adjustment
+    _load_module('gi.repository.Gdk').keyval_name = lambda keyval: None
+    _load_module('sugar3.graphics.palettewindow').Invoker = Invoker
+
+    pango = _load_module('gi.repository.Pango')
+    pango.SCALE = 1024
+    pango.FontDescription = FontDescription
+
+    vte = _load_module('gi.repository.Vte')
+    vte.MAJOR_VERSION = 0
+    vte.MINOR_VERSION = 76
+    vte.Terminal = Terminal
+
+    activity = _load_module('sugar3.activity.activity')
+    activity.Activity = Activity
+    activity.get_bundle_path = lambda: BUNDLE_PATH
+    activity.get_activity_root = get_activity_root
+    activity.J_DBUS_SERVICE = 'org.laptop.Journal'
+    activity.J_DBUS_PATH = '/org/laptop/Journal'
+    activity.J_DBUS_INTERFACE = 'org.laptop.Journal'
+
+    env = _load_module('sugar3.env')
+    env.get_profile_path = lambda path=None: os.path.join(
+        scratch, 'profile', path or '')
+
+    if BUNDLE_PATH not in sys.path:
+        sys.path.insert(0, BUNDLE_PATH)
+
+
+def uninstall():
+    """Stop the process standing in for the shells."""
+    global _shell
+    if _shell is not None:
+        _shell.send_signal(signal.SIGKILL)
+        _shell.wait()
+        _shell = None
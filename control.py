@@ -0,0 +1,321 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""A Unix socket for driving the activity from scripts.
+
+Clients send one JSON object per line and get one JSON reply per line,
+carrying the same "id" as the request:
+
+    {"id": 1, "op": "list_tabs"}
+    {"id": 2, "op": "open_tabs", "count": 10}
+    {"id": 3, "op": "close_tabs", "tabs": ["<tab>", ...]}
+    {"id": 4, "op": "execute", "tabs": ["<tab>", ...], "command": "ls"}
+    {"id": 5, "op": "get_text", "tab": "<tab>", "start_row": 0,
+     "end_row": 100}
+    {"id": 6, "op": "subscribe", "tab": "<tab>"}
+    {"id": 7, "op": "unsubscribe", "tab": "<tab>"}
+    {"id": 8, "op": "pty_stats"}
+
+Tabs are named by the ids returned by list_tabs and open_tabs. A
+subscribed client also gets {"event": "output", "tab": ..., "text": ...}
+lines with each row of output once it is complete, and
+{"event": "closed", "tab": ...} when the tab goes away. pty_stats
+replies with the throughput and latency counters of each tab.
+
+Everything runs on the GLib main loop and the socket never blocks it.
+"""
+
+import errno
+import json
+import logging
+import os
+import socket
+
+from gi.repository import GLib
+
+log = logging.getLogger('Terminal')
+
+# A client that lets this many bytes of replies pile up is dropped
+CONTROL_MAX_BUFFER = 4 * 1024 * 1024
+
+# Most tabs one open_tabs request may open
+CONTROL_MAX_OPEN_TABS = 100
+
+
+class _Client(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.input = b''
+        self.output = bytearray()
+        self.read_id = None
+        self.write_id = None
+        self.subscriptions = set()
+
+
+class _Subscription(object):
+    """Sends the rows a terminal completes to the subscribed clients."""
+
+    def __init__(self, terminal):
+        self.terminal = terminal
+        self.clients = set()
+        self.row = terminal.get_cursor_position()[1]
+        self.idle_id = None
+        self.handler_ids = []
+
+
+class ControlServer(object):
+
+    def __init__(self, activity, path):
+        self._activity = activity
+        self._path = path
+        self._listener = None
+        self._accept_id = None
+        self._clients = []
+        self._subscriptions = {}
+
+    def start(self):
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self._path)
+        os.chmod(self._path, 0o600)
+        self._listener.listen()
+        self._listener.setblocking(False)
+        self._accept_id = GLib.io_add_watch(
+            self._listener.fileno(), GLib.PRIORITY_DEFAULT,
+            GLib.IOCondition.IN, self.__accept_cb)
+        log.debug('control socket listening on %s', self._path)
+
+    def close(self):
+        for client in list(self._clients):
+            self._drop_client(client)
+        if self._listener is not None:
+            GLib.source_remove(self._accept_id)
+            self._listener.close()
+            self._listener = None
+            os.unlink(self._path)
+
+    def __accept_cb(self, fd, condition):
+        try:
+            sock, address_ = self._listener.accept()
+        except BlockingIOError:
+            return True
+        sock.setblocking(False)
+        client = _Client(sock)
+        client.read_id = GLib.io_add_watch(
+            sock.fileno(), GLib.PRIORITY_DEFAULT,
+            GLib.IOCondition.IN | GLib.IOCondition.HUP,
+            self.__read_cb, client)
+        self._clients.append(client)
+        return True
+
+    def __read_cb(self, fd, condition, client):
+        try:
+            data = client.sock.recv(65536)
+        except BlockingIOError:
+            return True
+        except OSError:
+            data = b''
+        if not data:
+            client.read_id = None
+            self._drop_client(client)
+            return False
+
+        client.input += data
+        lines = client.input.split(b'\n')
+        client.input = lines.pop()
+        # Requests that arrived together are handled in one go, so the
+        # notebook is redrawn once after all of them
+        for line in lines:
+            if line.strip() and client in self._clients:
+                self._handle(client, line)
+        return client in self._clients
+
+    def _handle(self, client, line):
+        request = {}
+        try:
+            request = json.loads(line.decode('utf-8'))
+            handler = getattr(self, '_op_%s' % request.get('op'), None)
+            if handler is None:
+                raise ValueError('unknown op %r' % request.get('op'))
+            reply = handler(client, request)
+        except (ValueError, LookupError, TypeError, AttributeError,
+                OSError, GLib.Error) as e:
+            # Every request gets a reply, whatever failed
+            reply = {'ok': False, 'error': str(e)}
+            if not isinstance(request, dict):
+                request = {}
+        else:
+            reply['ok'] = True
+        if 'id' in request:
+            reply['id'] = request['id']
+        self._send(client, reply)
+
+    def _get_tab(self, tab_id):
+        box = self._activity.get_tab(tab_id)
+        if box is None:
+            raise KeyError('no tab %r' % tab_id)
+        return box
+
+    def _op_list_tabs(self, client, request):
+        return {'tabs': [self._describe(box)
+                         for box in self._activity.get_tabs()]}
+
+    def _op_open_tabs(self, client, request):
+        count = int(request.get('count', 1))
+        if not 0 <= count <= CONTROL_MAX_OPEN_TABS:
+            raise ValueError('count must be from 0 to %d' %
+                             CONTROL_MAX_OPEN_TABS)
+        boxes = self._activity.open_tabs(count)
+        return {'tabs': [self._describe(box) for box in boxes]}
+
+    def _op_close_tabs(self, client, request):
+        self._activity.close_tabs(
+            [self._get_tab(tab_id) for tab_id in request['tabs']])
+        return {}
+
+    def _op_execute(self, client, request):
+        command = request['command']
+        if not isinstance(command, str) or not command:
+            raise ValueError('command must be a non-empty string')
+        for box in [self._get_tab(tab_id) for tab_id in request['tabs']]:
+            box.vt.execute_command(command)
+        return {}
+
+    def _op_get_text(self, client, request):
+        vt = self._get_tab(request['tab']).vt
+        start_row = request.get('start_row')
+        if start_row is None:
+            start_row = int(vt.get_vadjustment().get_lower())
+        end_row = request.get('end_row')
+        if end_row is None:
+            end_row = vt.get_cursor_position()[1]
+        return {'text': vt.get_text_rows(int(start_row), int(end_row))}
+
+    def _op_pty_stats(self, client, request):
+        return {'tabs': self._activity.get_pty_stats()}
+
+    def _op_subscribe(self, client, request):
+        box = self._get_tab(request['tab'])
+        tab_id = request['tab']
+        subscription = self._subscriptions.get(tab_id)
+        if subscription is None:
+            subscription = _Subscription(box.vt)
+            subscription.handler_ids = [
+                box.vt.connect('contents-changed',
+                               self.__contents_changed_cb, tab_id),
+                box.vt.connect('destroy', self.__destroy_cb, tab_id)]
+            self._subscriptions[tab_id] = subscription
+        subscription.clients.add(client)
+        client.subscriptions.add(tab_id)
+        return {'row': subscription.row}
+
+    def _op_unsubscribe(self, client, request):
+        self._unsubscribe(client, request['tab'])
+        return {}
+
+    def _unsubscribe(self, client, tab_id):
+        client.subscriptions.discard(tab_id)
+        subscription = self._subscriptions.get(tab_id)
+        if subscription is None:
+            return
+        subscription.clients.discard(client)
+        if not subscription.clients:
+            self._remove_subscription(tab_id)
+
+    def _remove_subscription(self, tab_id):
+        subscription = self._subscriptions.pop(tab_id)
+        for handler_id in subscription.handler_ids:
+            if subscription.terminal.handler_is_connected(handler_id):
+                subscription.terminal.disconnect(handler_id)
+        if subscription.idle_id is not None:
+            GLib.source_remove(subscription.idle_id)
+        for client in subscription.clients:
+            client.subscriptions.discard(tab_id)
+
+    def __contents_changed_cb(self, terminal, tab_id):
+        # Output is sent at most once per main loop iteration
+        subscription = self._subscriptions[tab_id]
+        if subscription.idle_id is None:
+            subscription.idle_id = GLib.idle_add(
+                self.__send_output_cb, tab_id)
+
+    def __send_output_cb(self, tab_id):
+        subscription = self._subscriptions[tab_id]
+        subscription.idle_id = None
+        row = subscription.terminal.get_cursor_position()[1]
+        if row > subscription.row:
+            text = subscription.terminal.get_text_rows(
+                subscription.row, row - 1)
+            subscription.row = row
+            event = {'event': 'output', 'tab': tab_id, 'text': text}
+            for client in list(subscription.clients):
+                self._send(client, event)
+        return False
+
+    def __destroy_cb(self, terminal, tab_id):
+        subscription = self._subscriptions[tab_id]
+        for client in list(subscription.clients):
+            self._send(client, {'event': 'closed', 'tab': tab_id})
+        self._remove_subscription(tab_id)
+
+    def _describe(self, box):
+        return {'tab': self._activity.get_tab_id(box),
+                'index': self._activity.get_tabs().index(box),
+                'title': box.vt.get_window_title(),
+                'pid': box.pid}
+
+    def _send(self, client, message):
+        if client not in self._clients:
+            return
+        client.output += json.dumps(message).encode('utf-8') + b'\n'
+        if len(client.output) > CONTROL_MAX_BUFFER:
+            log.warning('dropping a control client that does not read')
+            self._drop_client(client)
+            return
+        if client.write_id is None:
+            client.write_id = GLib.io_add_watch(
+                client.sock.fileno(), GLib.PRIORITY_DEFAULT,
+                GLib.IOCondition.OUT, self.__write_cb, client)
+
+    def __write_cb(self, fd, condition, client):
+        try:
+            n = client.sock.send(client.output)
+        except BlockingIOError:
+            return True
+        except OSError as e:
+            if e.errno != errno.EPIPE:
+                log.warning('control client write failed: %s', e)
+            client.write_id = None
+            self._drop_client(client)
+            return False
+        del client.output[:n]
+        if client.output:
+            return True
+        client.write_id = None
+        return False
+
+    def _drop_client(self, client):
+        if client not in self._clients:
+            return
+        self._clients.remove(client)
+        for tab_id in list(client.subscriptions):
+            self._unsubscribe(client, tab_id)
+        for source_id in (client.read_id, client.write_id):
+            if source_id is not None:
+                GLib.source_remove(source_id)
+        client.sock.close()
@@ -0,0 +1,291 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import logging
+import os
+import queue
+import tempfile
+import threading
+from html.parser import HTMLParser
+
+from gi.repository import GLib
+
+from sugar3 import profile
+from sugar3.datastore import datastore
+
+log = logging.getLogger('Terminal')
+
+# Rows read from the terminal in one main loop iteration
+EXPORT_CHUNK_ROWS = 2000
+
+# Chunks read ahead of the worker; this bounds the memory used
+EXPORT_CHUNKS_IN_FLIGHT = 2
+
+
+def _sgr(color, background, bold, italic, underline, strikethrough):
+    codes = ['0']
+    if bold:
+        codes.append('1')
+    if italic:
+        codes.append('3')
+    if underline:
+        codes.append('4')
+    if strikethrough:
+        codes.append('9')
+    if color is not None:
+        codes.append('38;2;%d;%d;%d' % color)
+    if background is not None:
+        codes.append('48;2;%d;%d;%d' % background)
+    return '\x1b[%sm' % ';'.join(codes)
+
+
+def _parse_html_color(value):
+    value = value.strip().lstrip('#')
+    if len(value) != 6:
+        return None
+    try:
+        return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+    except ValueError:
+        return None
+
+
+class _HtmlToAnsi(HTMLParser):
+    """Turn the HTML that VTE makes of its text into SGR escapes."""
+
+    _FLAGS = {'b': 'bold', 'i': 'italic', 'u': 'underline',
+              'strike': 'strikethrough', 's': 'strikethrough'}
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self._stack = []
+        self._parts = []
+        self._current = None
+
+    def _state(self):
+        state = {'color': None, 'background': None, 'bold': False,
+                 'italic': False, 'underline': False,
+                 'strikethrough': False}
+        for tag_, changes in self._stack:
+            state.update(changes)
+        return state
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        changes = {}
+        if tag in self._FLAGS:
+            changes[self._FLAGS[tag]] = True
+        elif tag == 'font' and 'color' in attrs:
+            changes['color'] = _parse_html_color(attrs['color'])
+        elif tag == 'span':
+            for declaration in (attrs.get('style') or '').split(';'):
+                name, sep_, value = declaration.partition(':')
+                if name.strip() == 'background-color':
+                    changes['background'] = _parse_html_color(value)
+                elif name.strip() == 'color':
+                    changes['color'] = _parse_html_color(value)
+        elif tag == 'br':
+            self.handle_data('\n')
+            return
+        self._stack.append((tag, changes))
+
+    def handle_endtag(self, tag):
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                del self._stack[i:]
+                return
+
+    def handle_data(self, data):
+        sgr = _sgr(**self._state())
+        if sgr != self._current:
+            self._parts.append(sgr)
+            self._current = sgr
+        self._parts.append(data)
+
+    def convert(self, html):
+        self.feed(html)
+        self.close()
+        text = ''.join(self._parts)
+        self._parts = []
+        return text
+
+
+def _attributes_to_ansi(text, attributes):
+    """Turn text and the per-character attributes of old VTE into SGR."""
+    parts = []
+    current = None
+    for char, attr in zip(text, attributes):
+        sgr = _sgr((attr.fore.red >> 8, attr.fore.green >> 8,
+                    attr.fore.blue >> 8),
+                   (attr.back.red >> 8, attr.back.green >> 8,
+                    attr.back.blue >> 8),
+                   False, False, attr.underline, attr.strikethrough)
+        if sgr != current:
+            parts.append(sgr)
+            current = sgr
+        parts.append(char)
+    parts.append(text[len(attributes):])
+    return ''.join(parts)
+
+
+class ScrollbackExport(object):
+    """Save the output of a terminal as a new Journal entry.
+
+    Rows are read on the main loop, EXPORT_CHUNK_ROWS at a time from an
+    idle callback, and handed to a worker thread that converts them and
+    appends them to a temporary file. At most EXPORT_CHUNKS_IN_FLIGHT
+    chunks wait for the worker, so memory use does not grow with the
+    scrollback. The file is then written to the datastore asynchronously.
+
+    progress_cb is called with the fraction exported so far, and done_cb
+    with True or False once the entry is saved or the export failed.
+    """
+
+    def __init__(self, activity, terminal, title, ansi, progress_cb,
+                 done_cb):
+        self._activity = activity
+        self._terminal = terminal
+        self._title = title
+        self._ansi = ansi
+        self._progress_cb = progress_cb
+        self._done_cb = done_cb
+        self._queue = queue.Queue()
+        self._in_flight = 0
+        self._idle_id = None
+        self._cancelled = False
+
+    def start(self):
+        self._first_row = int(self._terminal.get_vadjustment().get_lower())
+        self._last_row = self._terminal.get_cursor_position()[1]
+        self._row = self._first_row
+
+        fd, self._path = tempfile.mkstemp(
+            suffix='.txt', dir=os.path.join(
+                self._activity.get_activity_root(), 'instance'))
+        self._thread = threading.Thread(
+            target=self._write, args=(os.fdopen(fd, 'w'),), daemon=True)
+        self._thread.start()
+        self._resume()
+
+    def cancel(self):
+        """Stop exporting; the callbacks are not called after this."""
+        self._cancelled = True
+        if self._idle_id is not None:
+            GLib.source_remove(self._idle_id)
+            self._idle_id = None
+        self._queue.put(None)
+
+    def _resume(self):
+        if self._idle_id is None and not self._cancelled:
+            self._idle_id = GLib.idle_add(
+                self.__read_cb, priority=GLib.PRIORITY_LOW)
+
+    def __read_cb(self):
+        if self._in_flight >= EXPORT_CHUNKS_IN_FLIGHT:
+            # The worker restarts reading when it has caught up
+            self._idle_id = None
+            return False
+
+        end_row = min(self._row + EXPORT_CHUNK_ROWS - 1, self._last_row)
+        if self._ansi:
+            chunk = self._terminal.get_formatted_rows(self._row, end_row)
+        else:
+            chunk = ('text', self._terminal.get_text_rows(self._row,
+                                                          end_row))
+        self._in_flight += 1
+        self._queue.put((end_row, chunk))
+        self._row = end_row + 1
+
+        if self._row > self._last_row:
+            self._queue.put(None)
+            self._idle_id = None
+            return False
+        return True
+
+    def _write(self, f):
+        """Convert and write chunks until the end, in the worker thread."""
+        error = None
+        try:
+            with f:
+                while True:
+                    item = self._queue.get()
+                    if item is None or self._cancelled:
+                        break
+                    end_row, chunk = item
+                    if chunk[0] == 'html':
+                        text = _HtmlToAnsi().convert(chunk[1])
+                    elif chunk[0] == 'attributes':
+                        text = _attributes_to_ansi(chunk[1], chunk[2])
+                    else:
+                        text = chunk[1]
+                    if text and not text.endswith('\n'):
+                        text += '\n'
+                    f.write(text)
+                    GLib.idle_add(self.__chunk_written_cb, end_row)
+                if self._ansi:
+                    f.write('\x1b[0m')
+        except OSError as e:
+            error = e
+        except Exception as e:
+            # The main loop still has to hear of it, or the export hangs
+            log.exception('Export worker failed')
+            error = e
+        GLib.idle_add(self.__file_written_cb, error)
+
+    def __chunk_written_cb(self, end_row):
+        self._in_flight -= 1
+        if self._cancelled:
+            return False
+        rows = self._last_row - self._first_row + 1
+        self._progress_cb((end_row - self._first_row + 1) / max(1, rows))
+        if self._row <= self._last_row:
+            self._resume()
+        return False
+
+    def __file_written_cb(self, error):
+        self._thread.join()
+        if error is not None or self._cancelled:
+            # Nobody reads the rows still to come
+            if self._idle_id is not None:
+                GLib.source_remove(self._idle_id)
+                self._idle_id = None
+            os.unlink(self._path)
+            if not self._cancelled:
+                log.error('Could not export the tab: %s', error)
+                self._done_cb(False)
+            return False
+
+        journal_entry = datastore.create()
+        journal_entry.metadata['title'] = self._title
+        journal_entry.metadata['title_set_by_user'] = '1'
+        journal_entry.metadata['mime_type'] = 'text/plain'
+        journal_entry.metadata['icon-color'] = profile.get_color().to_string()
+        journal_entry.file_path = self._path
+        datastore.write(journal_entry, transfer_ownership=True,
+                        reply_handler=self.__write_reply_cb,
+                        error_handler=self.__write_error_cb)
+        return False
+
+    def __write_reply_cb(self, *args):
+        # The tab may have been closed while the datastore wrote
+        if self._cancelled:
+            return
+        self._done_cb(True)
+
+    def __write_error_cb(self, error):
+        log.error('Could not save the exported tab: %s', error)
+        if self._cancelled:
+            return
+        self._done_cb(False)
@@ -33,6 +33,10 @@ from sugar3.graphics import style
 
 
 class HelpButton(Gtk.ToolItem):
+    """Toolbar help button whose palette content is built on first use.
+
+    Sections and paragraphs added before then are only recorded.
+    """
 
     def __init__(self, **kwargs):
         GObject.GObject.__init__(self)
@@ -42,7 +46,17 @@ class HelpButton(Gtk.ToolItem):
         self.add(help_button)
 
         self._palette = help_button.get_palette()
+        self._items = []
+        self._vbox = None
+
+        help_button.connect('clicked', self.__help_button_clicked_cb)
 
+    def __help_button_clicked_cb(self, button):
+        if self._vbox is None:
+            self._build_content()
+        self._palette.popup(immediate=True)
+
+    def _build_content(self):
         sw = Gtk.ScrolledWindow()
         sw.set_size_request(int(Gdk.Screen.width() / 2.8),
                             Gdk.Screen.height() - style.GRID_CELL_SIZE * 3)
@@ -52,17 +66,28 @@ class HelpButton(Gtk.ToolItem):
         self._vbox.set_orientation(Gtk.Orientation.VERTICAL)
         self._vbox.set_homogeneous(False)
 
+        for add_item, text, icon in self._items:
+            add_item(text, icon)
+        self._items = []
+
         sw.add_with_viewport(self._vbox)
 
         self._palette.set_content(sw)
         sw.show_all()
 
-        help_button.connect('clicked', self.__help_button_clicked_cb)
+    def add_section(self, section_text, icon=None):
+        if self._vbox is None:
+            self._items.append((self._add_section, section_text, icon))
+        else:
+            self._add_section(section_text, icon)
 
-    def __help_button_clicked_cb(self, button):
-        self._palette.popup(immediate=True)
+    def add_paragraph(self, text, icon=None):
+        if self._vbox is None:
+            self._items.append((self._add_paragraph, text, icon))
+        else:
+            self._add_paragraph(text, icon)
 
-    def add_section(self, section_text, icon=None):
+    def _add_section(self, section_text, icon=None):
         hbox = Gtk.Box()
         label = Gtk.Label()
         label.set_justify(Gtk.Justification.FILL)
@@ -77,7 +102,7 @@ class HelpButton(Gtk.ToolItem):
         hbox.show_all()
         self._vbox.pack_start(hbox, True, True, padding=5)
 
-    def add_paragraph(self, text, icon=None):
+    def _add_paragraph(self, text, icon=None):
         hbox = Gtk.Box()
         label = Gtk.Label(label=text)
         label.set_justify(Gtk.Justification.FILL)
@@ -0,0 +1,177 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Scheduling priority and resource limits for the shells of the tabs.
+
+These terminalrc options of the [terminal] section are applied to each
+shell right after it is started, and inherited by everything it runs:
+
+    shell_nice = 10               CPU niceness, 0 to 19
+    shell_ionice = best-effort:7  I/O class (idle, best-effort or
+                                  realtime) and level, 0 to 7
+    shell_limit_memory = 2048     address space limit, in MiB
+    shell_limit_cpu = 3600        CPU time limit, in seconds
+    shell_cgroup = /sys/fs/cgroup/...
+                                  a cgroup v2 directory under which the
+                                  activity creates one for its shells,
+                                  if it is writable
+    shell_cgroup_memory_max = 2G  memory.max of that cgroup
+    shell_cgroup_cpu_weight = 20  cpu.weight of that cgroup
+    shell_cgroup_pids_max = 512   pids.max of that cgroup
+
+Only the shells are affected; the activity keeps its own priority.
+Processes are limited with the cgroup rather than RLIMIT_NPROC, which
+counts every process of the user, the activity and Sugar included.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import platform
+import resource
+
+log = logging.getLogger('Terminal')
+
+_IOPRIO_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+
+# ioprio_set has no wrapper in Python or libc
+_SYS_IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289,
+                   'aarch64': 30, 'armv7l': 314, 'ppc64le': 273}
+
+_libc = None
+
+
+def _ioprio_set(pid, ioprio_class, level):
+    global _libc
+    number = _SYS_IOPRIO_SET.get(platform.machine())
+    if number is None:
+        raise OSError('ioprio_set is not known on %s' % platform.machine())
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    ioprio = (ioprio_class << _IOPRIO_CLASS_SHIFT) | level
+    if _libc.syscall(number, _IOPRIO_WHO_PROCESS, pid, ioprio) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+class ShellLimits(object):
+
+    def __init__(self, nice=0, ionice=None, memory=None, cpu=None,
+                 cgroup=None, cgroup_memory_max=None, cgroup_cpu_weight=None,
+                 cgroup_pids_max=None):
+        self.nice = nice
+        self.ionice = ionice
+        self.memory = memory
+        self.cpu = cpu
+        self._cgroup_parent = cgroup
+        self._cgroup_settings = {}
+        if cgroup_memory_max:
+            self._cgroup_settings['memory.max'] = cgroup_memory_max
+        if cgroup_cpu_weight:
+            self._cgroup_settings['cpu.weight'] = cgroup_cpu_weight
+        if cgroup_pids_max:
+            self._cgroup_settings['pids.max'] = cgroup_pids_max
+        self.cgroup = None
+
+    @classmethod
+    def from_config(cls, conf):
+        def get(name, convert=str):
+            if not conf.has_option('terminal', name):
+                return None
+            try:
+                return convert(conf.get('terminal', name))
+            except ValueError:
+                log.error('Ignoring invalid %s in terminalrc', name)
+                return None
+
+        ionice = None
+        value = get('shell_ionice')
+        if value:
+            name, sep_, level = value.partition(':')
+            if name in _IOPRIO_CLASSES and (not level or level.isdigit()):
+                ionice = (_IOPRIO_CLASSES[name], int(level or 0))
+            else:
+                log.error('Ignoring invalid shell_ionice in terminalrc')
+
+        memory = get('shell_limit_memory', int)
+        return cls(nice=get('shell_nice', int) or 0,
+                   ionice=ionice,
+                   memory=memory * 1024 * 1024 if memory else None,
+                   cpu=get('shell_limit_cpu', int),
+                   cgroup=get('shell_cgroup'),
+                   cgroup_memory_max=get('shell_cgroup_memory_max'),
+                   cgroup_cpu_weight=get('shell_cgroup_cpu_weight'),
+                   cgroup_pids_max=get('shell_cgroup_pids_max'))
+
+    def apply(self, pid):
+        """Apply the priority and limits to a shell that just started.
+
+        Failures are logged, as the shell is still usable without them.
+        """
+        try:
+            if self.nice:
+                os.setpriority(os.PRIO_PROCESS, pid, self.nice)
+            if self.ionice is not None:
+                _ioprio_set(pid, *self.ionice)
+            for limit, value in ((resource.RLIMIT_AS, self.memory),
+                                 (resource.RLIMIT_CPU, self.cpu)):
+                if value:
+                    resource.prlimit(pid, limit, (value, value))
+        except OSError as e:
+            log.error('Could not limit the shell %d: %s', pid, e)
+
+        cgroup = self._get_cgroup()
+        if cgroup is not None:
+            try:
+                with open(os.path.join(cgroup, 'cgroup.procs'), 'w') as f:
+                    f.write(str(pid))
+            except OSError as e:
+                log.error('Could not move the shell %d to %s: %s',
+                          pid, cgroup, e)
+
+    def _get_cgroup(self):
+        """Create the cgroup of the shells on first use."""
+        if self.cgroup is not None or not self._cgroup_parent:
+            return self.cgroup
+        parent = self._cgroup_parent
+        self._cgroup_parent = None
+        if not os.access(parent, os.W_OK):
+            log.debug('cgroup %s is not writable, not using it', parent)
+            return None
+        path = os.path.join(parent, 'sugar-terminal-%d' % os.getpid())
+        try:
+            os.makedirs(path, exist_ok=True)
+            for name, value in self._cgroup_settings.items():
+                with open(os.path.join(path, name), 'w') as f:
+                    f.write(str(value))
+        except OSError as e:
+            log.error('Could not set up cgroup %s: %s', path, e)
+            return None
+        self.cgroup = path
+        return path
+
+    def release(self):
+        """Remove the cgroup of the shells, once they have all exited."""
+        if self.cgroup is not None:
+            try:
+                os.rmdir(self.cgroup)
+            except OSError:
+                # Shells of detachable sessions may still be in it
+                pass
+            self.cgroup = None
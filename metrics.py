@@ -0,0 +1,161 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Counters and latency histograms for the hot paths of the activity.
+
+Metrics are off unless enabled with the 'metrics' option of terminalrc
+or the TERMINAL_METRICS environment variable. While off, count(),
+maximum(), observe() and timer() return at once without recording
+anything.
+"""
+
+import bisect
+import json
+import os
+import time
+
+# Upper bounds of the latency buckets, in milliseconds
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+           1000, 2500, 5000)
+
+
+class _Histogram(object):
+
+    __slots__ = ('counts', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS, ms)] += 1
+        self.total += ms
+        if self.minimum is None or ms < self.minimum:
+            self.minimum = ms
+        if self.maximum is None or ms > self.maximum:
+            self.maximum = ms
+
+    def to_dict(self):
+        count = sum(self.counts)
+        return {'count': count,
+                'sum_ms': self.total,
+                'mean_ms': self.total / count if count else 0,
+                'min_ms': self.minimum,
+                'max_ms': self.maximum,
+                'buckets_ms': list(BUCKETS) + ['inf'],
+                'counts': self.counts}
+
+
+class _Timer(object):
+
+    __slots__ = ('_metrics', '_name', '_start')
+
+    def __init__(self, metrics, name):
+        self._metrics = metrics
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._metrics.observe(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self.enabled = False
+        self._counters = {}
+        self._maxima = {}
+        self._histograms = {}
+        self._started = time.time()
+
+    def enable(self):
+        self.enabled = True
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def maximum(self, name, value):
+        """Keep the largest value given for name."""
+        if self.enabled:
+            if name not in self._maxima or value > self._maxima[name]:
+                self._maxima[name] = value
+
+    def observe(self, name, seconds):
+        """Record a latency, given in seconds, in the histogram name."""
+        if self.enabled:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = _Histogram()
+            histogram.add(seconds * 1000)
+
+    def timer(self, name):
+        """Return a context manager that records the time of its block."""
+        if self.enabled:
+            return _Timer(self, name)
+        return _NULL_TIMER
+
+    def to_dict(self):
+        return {'started': self._started,
+                'dumped': time.time(),
+                'counters': dict(self._counters),
+                'maxima': dict(self._maxima),
+                'histograms': {name: histogram.to_dict()
+                               for name, histogram
+                               in self._histograms.items()}}
+
+    def dump(self, directory, extra=None):
+        """Write the metrics as JSON into directory, returning the path.
+
+        The items of extra are added to the metrics.
+        """
+        if not self.enabled:
+            return None
+        data = self.to_dict()
+        data.update(extra or {})
+        path = os.path.join(directory, 'metrics-%d.json' % self._started)
+        with open(path, 'w') as fd:
+            json.dump(data, fd, indent=1)
+        return path
+
+
+metrics = Metrics()
+
+
+def metrics_enabled(conf):
+    """Return True if terminalrc or the environment enable metrics."""
+    if os.environ.get('TERMINAL_METRICS', '') not in ('', '0'):
+        return True
+    return conf.has_option('terminal', 'metrics') and \
+        conf.getboolean('terminal', 'metrics')
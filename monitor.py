@@ -0,0 +1,205 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import os
+import time
+import logging
+
+from gi.repository import GLib
+
+log = logging.getLogger('Terminal')
+
+# Seconds between two samples of every tab
+MONITOR_INTERVAL = 3
+
+# A sample of all tabs taking longer than this is logged as a warning,
+# once for each run of samples over it
+MONITOR_BUDGET = 0.005
+
+# Processes whose /proc files are opened in one sample. Opening them
+# costs most of a sample, so when many start at once, as with the tabs
+# of a resumed activity, the rest are opened over the next samples.
+MONITOR_NEW_PROCESSES = 16
+
+_CLK_TCK = os.sysconf('SC_CLK_TCK')
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class ResourceMonitor(object):
+    """Sample CPU and memory use of the process tree of every tab.
+
+    All tabs are sampled together from /proc on one timer. The stat file
+    of each process, and the children file of each of its threads, stay
+    open between samples and are re-read with pread(), so a sample costs
+    no open() or close() calls for processes that are still running.
+    The threads are only listed again when their number changes.
+    At most MONITOR_NEW_PROCESSES processes are opened in one sample;
+    those left over, and the processes they started, are counted from a
+    later one. The tabs are walked from a different one each sample, so
+    that new processes of the first tabs cannot keep those of the last
+    tabs from being opened.
+    """
+
+    def __init__(self, notebook):
+        self._notebook = notebook
+        # pid -> (stat fd, {tid: children fd})
+        self._fds = {}
+        self._ticks = {}
+        self._timeout_id = None
+        self._over_budget = False
+        self._opens_left = 0
+        self._first_page = 0
+        self.scan_time = 0
+        # True if the last sample left processes to open
+        self.opening = False
+
+    def start(self):
+        if self._timeout_id is None:
+            self._timeout_id = GLib.timeout_add_seconds(
+                MONITOR_INTERVAL, self.__timeout_cb)
+
+    def stop(self):
+        if self._timeout_id is not None:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = None
+        # CPU use is measured again from the next sample after a restart
+        self._ticks = {}
+
+    def close(self):
+        self.stop()
+        for pid in list(self._fds):
+            self._close_fds(pid)
+
+    def __timeout_cb(self):
+        self.sample()
+        return True
+
+    def sample(self):
+        start = time.monotonic()
+        seen = set()
+        ticks = {}
+        self._opens_left = MONITOR_NEW_PROCESSES
+        self.opening = False
+        n_pages = self._notebook.get_n_pages()
+        self._first_page = (self._first_page + 1) % max(1, n_pages)
+        for i in range(n_pages):
+            page = self._notebook.get_nth_page(
+                (self._first_page + i) % n_pages)
+            if page.pid is None:
+                # Playback tabs run no shell
+                continue
+            usage = self._sample_tree(page.pid, seen)
+            if usage is None:
+                continue
+            ticks[page.pid] = (usage[0], start)
+            previous = self._ticks.get(page.pid)
+            if previous is not None and start > previous[1]:
+                # Exited children take their ticks with them
+                cpu = max(0, usage[0] - previous[0]) * 100.0 / \
+                    _CLK_TCK / (start - previous[1])
+                page.label.set_usage(cpu, usage[1])
+        self._ticks = ticks
+
+        for pid in set(self._fds) - seen:
+            self._close_fds(pid)
+
+        self.scan_time = time.monotonic() - start
+        over_budget = self.scan_time > MONITOR_BUDGET
+        if over_budget and not self._over_budget:
+            log.warning('resource sample of %d processes took %.1fms, '
+                        'over the budget of %.1fms', len(seen),
+                        self.scan_time * 1000, MONITOR_BUDGET * 1000)
+        self._over_budget = over_budget
+
+    def _sample_tree(self, root, seen):
+        """Return (cpu ticks, rss bytes) summed over a process tree."""
+        total_ticks = 0
+        total_rss = 0
+        found = False
+        pids = [root]
+        while pids:
+            pid = pids.pop()
+            if pid in seen:
+                continue
+            fds = self._fds.get(pid)
+            if fds is None:
+                if not self._opens_left:
+                    self.opening = True
+                    continue
+                self._opens_left -= 1
+                fds = self._open_fds(pid)
+                if fds is None:
+                    continue
+            try:
+                stat = os.pread(fds[0], 4096, 0)
+            except OSError:
+                # The process exited since the last sample
+                self._close_fds(pid)
+                continue
+            seen.add(pid)
+            found = True
+            fields = stat.rsplit(b')', 1)[1].split()
+            total_ticks += int(fields[11]) + int(fields[12])
+            total_rss += int(fields[21]) * _PAGE_SIZE
+            tasks = fds[1]
+            if int(fields[17]) != len(tasks):
+                self._update_tasks(pid, tasks)
+            for fd in tasks.values():
+                try:
+                    children = os.pread(fd, 65536, 0)
+                except OSError:
+                    # The thread ended, it is dropped on the next sample
+                    continue
+                pids.extend(int(child) for child in children.split())
+        if not found:
+            return None
+        return total_ticks, total_rss
+
+    def _open_fds(self, pid):
+        try:
+            stat_fd = os.open('/proc/%d/stat' % pid, os.O_RDONLY)
+        except OSError:
+            return None
+        fds = self._fds[pid] = (stat_fd, {})
+        return fds
+
+    def _update_tasks(self, pid, tasks):
+        """Open the children files of new threads, close those of gone ones.
+
+        Each thread has its own children file, listing the processes
+        that thread started.
+        """
+        try:
+            tids = set(int(tid) for tid in os.listdir('/proc/%d/task' % pid))
+        except OSError:
+            return
+        for tid in set(tasks) - tids:
+            os.close(tasks.pop(tid))
+        for tid in tids - set(tasks):
+            try:
+                tasks[tid] = os.open(
+                    '/proc/%d/task/%d/children' % (pid, tid), os.O_RDONLY)
+            except OSError:
+                # The thread ended meanwhile
+                pass
+
+    def _close_fds(self, pid):
+        fds = self._fds.pop(pid, None)
+        if fds is None:
+            return
+        os.close(fds[0])
+        for fd in fds[1].values():
+            os.close(fd)
@@ -11,25 +11,52 @@ from sugar3.graphics.palettewindow import Invoker
 
 
 class ContentInvoker(Invoker):
-    def __init__(self, parent, link):
+    """Invoker for the terminal context menu.
+
+    One invoker is kept per terminal; its palette is built on the first
+    popup and then only updated for the link under the cursor.
+    """
+
+    def __init__(self, parent):
         Invoker.__init__(self)
         self._position_hint = self.AT_CURSOR
         self.parent = parent
-        self._link = link
+        self._long_press = None
 
-        self.parent.connect('realize', self.__term_realize_cb)
-        self.palette = TerminalPalette(self.parent, self._link)
+        if self.parent.get_realized():
+            self._attach_long_press()
+        else:
+            self.parent.connect('realize', self.__term_realize_cb)
+
+    def popup_for(self, link):
+        if self.palette is None:
+            self.palette = TerminalPalette(self.parent)
+        self.palette.set_link(link)
         self.notify_right_click()
 
+    def release(self):
+        if self._long_press is not None:
+            self._long_press.detach(self.parent)
+            self._long_press = None
+        if self.palette is not None:
+            self.palette.destroy()
+
     def __term_realize_cb(self, browser):
-        x11_window = browser.get_window()
+        self.parent.disconnect_by_func(self.__term_realize_cb)
+        self._attach_long_press()
+
+    def _attach_long_press(self):
+        if self._long_press is not None:
+            return
+        x11_window = self.parent.get_window()
         x11_window.set_events(x11_window.get_events() |
                               Gdk.EventMask.POINTER_MOTION_MASK |
                               Gdk.EventMask.TOUCH_MASK)
 
-        lp = SugarGestures.LongPressController()
-        lp.connect('pressed', self.__long_pressed_cb)
-        lp.attach(browser, SugarGestures.EventControllerFlags.NONE)
+        self._long_press = SugarGestures.LongPressController()
+        self._long_press.connect('pressed', self.__long_pressed_cb)
+        self._long_press.attach(
+            self.parent, SugarGestures.EventControllerFlags.NONE)
 
     def __long_pressed_cb(self, controller, x, y):
         # We can't force a context menu, but we can fake a right mouse click
@@ -38,12 +65,12 @@ class ContentInvoker(Invoker):
 
         b = event.button
         b.type = Gdk.EventType.BUTTON_PRESS
-        b.window = self.activity.get_window()
+        b.window = self.parent.get_window()
         b.time = Gtk.get_current_event_time()
         b.button = 3  # Right
         b.x = x
         b.y = y
-        b.x_root, b.y_root = self.activity.get_window().get_root_coords(x, y)
+        b.x_root, b.y_root = self.parent.get_window().get_root_coords(x, y)
 
         Gtk.main_do_event(event)
         return True
@@ -52,8 +79,8 @@ class ContentInvoker(Invoker):
         return self.AT_CURSOR
 
     def get_rect(self):
-        allocation = self.activity.get_allocation()
-        window = self.activity.get_window()
+        allocation = self.parent.get_allocation()
+        window = self.parent.get_window()
         if window is not None:
             res, x, y = window.get_origin()
         else:
@@ -80,43 +107,32 @@ class ContentInvoker(Invoker):
 
 
 class TerminalPalette(Palette):
-    def __init__(self, parent, link=False):
+    def __init__(self, parent):
         Palette.__init__(self)
         self.parent = parent
-        self._link = link
+        self._link = None
         self.create()
-        self.popup()
 
     def create(self):
-
-        if self._link is not None:
-            self.props.primary_text = GLib.markup_escape_text(self._link)
-        else:
-            self.props.primary_text = GLib.markup_escape_text(_('Terminal'))
         menu_box = Gtk.VBox()
         self.set_content(menu_box)
         menu_box.show()
         self._content.set_border_width(1)
 
-        if self._link:
-
-            menu_item = PaletteMenuItem(_('Follow link'), 'browse-follow-link')
-            menu_item.connect('activate', self.__follow_activate_cb)
-            menu_box.pack_start(menu_item, False, False, 0)
-            menu_item.show()
+        self._follow_item = PaletteMenuItem(
+            _('Follow link'), 'browse-follow-link')
+        self._follow_item.connect('activate', self.__follow_activate_cb)
+        menu_box.pack_start(self._follow_item, False, False, 0)
 
-            menu_item = PaletteMenuItem(_('Copy link'), 'edit-copy')
-            menu_item.icon.props.xo_color = profile.get_color()
-            menu_item.connect('activate', self.__copy_cb)
-            menu_box.pack_start(menu_item, False, False, 0)
-            menu_item.show()
+        self._copy_link_item = PaletteMenuItem(_('Copy link'), 'edit-copy')
+        self._copy_link_item.icon.props.xo_color = profile.get_color()
+        self._copy_link_item.connect('activate', self.__copy_cb)
+        menu_box.pack_start(self._copy_link_item, False, False, 0)
 
-        if not self._link:
-            menu_item = PaletteMenuItem(_('Copy text'), 'edit-copy')
-            menu_item.icon.props.xo_color = profile.get_color()
-            menu_item.connect('activate', self.__copy_cb)
-            menu_box.pack_start(menu_item, False, False, 0)
-            menu_item.show()
+        self._copy_text_item = PaletteMenuItem(_('Copy text'), 'edit-copy')
+        self._copy_text_item.icon.props.xo_color = profile.get_color()
+        self._copy_text_item.connect('activate', self.__copy_cb)
+        menu_box.pack_start(self._copy_text_item, False, False, 0)
 
         menu_item = PaletteMenuItem(_('Paste text'), 'edit-paste')
         menu_item.icon.props.xo_color = profile.get_color()
@@ -124,6 +140,19 @@ class TerminalPalette(Palette):
         menu_box.pack_start(menu_item, False, False, 0)
         menu_item.show()
 
+    def set_link(self, link):
+        self._link = link
+
+        if self._link is not None:
+            self.props.primary_text = GLib.markup_escape_text(self._link)
+        else:
+            self.props.primary_text = GLib.markup_escape_text(_('Terminal'))
+
+        has_link = bool(self._link)
+        self._follow_item.set_visible(has_link)
+        self._copy_link_item.set_visible(has_link)
+        self._copy_text_item.set_visible(not has_link)
+
     def __follow_activate_cb(self, button):
         self.parent.browse_link_under_cursor()
 
@@ -0,0 +1,82 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Journal previews drawn from the text of a terminal.
+
+Drawing a few lines of text straight at thumbnail size is much cheaper
+than rendering the whole canvas and scaling it down, and the text stays
+readable.
+"""
+
+import io
+
+import cairo
+import gi
+
+gi.require_version('PangoCairo', '1.0')
+from gi.repository import Gdk
+from gi.repository import Pango
+from gi.repository import PangoCairo
+
+# Lines of text that fit in a preview
+PREVIEW_LINES = 12
+
+# Space around the text, in pixels
+PREVIEW_MARGIN = 4
+
+
+def _set_source_color(cr, color):
+    rgba = Gdk.RGBA()
+    rgba.parse(color)
+    cr.set_source_rgb(rgba.red, rgba.green, rgba.blue)
+
+
+def get_preview_lines(text):
+    """Return the last PREVIEW_LINES lines of text that are not blank."""
+    lines = [line.rstrip() for line in text.split('\n')]
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines[-PREVIEW_LINES:]
+
+
+def render_preview(lines, font, fg_color, bg_color, width, height):
+    """Return a PNG of lines in font and the given colours.
+
+    The font is scaled so that PREVIEW_LINES lines fill the height, and
+    the last lines are kept if there are more.
+    """
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+    cr = cairo.Context(surface)
+    _set_source_color(cr, bg_color)
+    cr.paint()
+
+    font = font.copy()
+    line_height = (height - 2 * PREVIEW_MARGIN) / PREVIEW_LINES
+    # Pango leaves about a fifth of the size between lines
+    font.set_absolute_size(line_height * 0.8 * Pango.SCALE)
+    layout = PangoCairo.create_layout(cr)
+    layout.set_font_description(font)
+    layout.set_text('\n'.join(lines), -1)
+    text_height = layout.get_pixel_size()[1]
+
+    cr.move_to(PREVIEW_MARGIN,
+               min(PREVIEW_MARGIN, height - PREVIEW_MARGIN - text_height))
+    _set_source_color(cr, fg_color)
+    PangoCairo.show_layout(cr, layout)
+
+    png = io.BytesIO()
+    surface.write_to_png(png)
+    return png.getvalue()
@@ -0,0 +1,194 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""cProfile and tracemalloc profiles of a live session.
+
+Profiling is off unless enabled with the 'profile' option of terminalrc
+or the TERMINAL_PROFILE environment variable. It then runs from the
+start of the activity until it closes, and Ctrl+Shift+P stops it and
+starts it again. While off, begin() and end() return at once.
+
+Time and allocations are attributed to phases: startup (until the first
+prompt), tab (creating a tab), save and restore (the Journal), and
+session for everything else. When profiling stops, every phase that ran
+is written to the instance directory as profile-<time>-<phase>.prof,
+for "python3 -m pstats", and profile-<time>-<phase>.txt, with its runs,
+their total time and memory growth, and the places that allocated the
+memory kept by the run that kept the most.
+
+cProfile only sees the main thread. The time and memory of a phase
+include those of phases nested in it, such as the first tab in startup,
+and tracemalloc snapshots are only compared when profiles are written.
+"""
+
+import cProfile
+import logging
+import os
+import time
+import tracemalloc
+
+log = logging.getLogger('Terminal')
+
+# Frames kept by tracemalloc for each allocation
+TRACEMALLOC_FRAMES = 10
+
+# Allocation places listed for each phase, and frames shown for each
+TOP_ALLOCATIONS = 25
+REPORT_FRAMES = 5
+
+# Allocations made last in these files are the profiler's own
+_IGNORED_FILES = frozenset((__file__, tracemalloc.__file__,
+                            cProfile.__file__,
+                            '<frozen importlib._bootstrap>',
+                            '<frozen importlib._bootstrap_external>'))
+
+
+class _Phase(object):
+
+    __slots__ = ('profile', 'runs', 'seconds', 'growth', 'largest',
+                 'snapshots')
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.runs = 0
+        self.seconds = 0.0
+        self.growth = 0
+        # Bytes kept by the run that kept the most, and its snapshots
+        self.largest = 0
+        self.snapshots = None
+
+
+class SessionProfiler(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.running = False
+        self._directory = None
+        self._started = None
+        self._phases = {}
+        # (name, start time, traced bytes, tracemalloc snapshot) of the
+        # open phases, innermost last; only the innermost is profiled
+        self._stack = []
+
+    def enable(self, directory):
+        self.enabled = True
+        self._directory = directory
+
+    def start(self):
+        if not self.enabled or self.running:
+            return
+        self.running = True
+        self._started = time.time()
+        self._phases = {}
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._push('session')
+
+    def stop(self):
+        """Stop profiling and write the profiles, returning their paths."""
+        if not self.running:
+            return []
+        while self._stack:
+            self._pop()
+        tracemalloc.stop()
+        self.running = False
+        return self._dump()
+
+    def begin(self, name):
+        if self.running:
+            self._push(name)
+
+    def end(self, name):
+        """Close the phase name, and any phase left open inside it."""
+        if not self.running:
+            return
+        for entry in reversed(self._stack[1:]):
+            if entry[0] == name:
+                while self._pop() != name:
+                    pass
+                return
+
+    def _push(self, name):
+        if self._stack:
+            self._phases[self._stack[-1][0]].profile.disable()
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = _Phase()
+        phase.runs += 1
+        snapshot = tracemalloc.take_snapshot()
+        self._stack.append((name, time.perf_counter(),
+                            tracemalloc.get_traced_memory()[0], snapshot))
+        phase.profile.enable()
+
+    def _pop(self):
+        name, start, traced, before = self._stack.pop()
+        phase = self._phases[name]
+        phase.profile.disable()
+        phase.seconds += time.perf_counter() - start
+        growth = tracemalloc.get_traced_memory()[0] - traced
+        phase.growth += growth
+        if phase.snapshots is None or growth > phase.largest:
+            phase.largest = growth
+            phase.snapshots = (before, tracemalloc.take_snapshot())
+        if self._stack:
+            self._phases[self._stack[-1][0]].profile.enable()
+        return name
+
+    def _report(self, name, phase):
+        lines = ['phase: %s' % name,
+                 'runs: %d' % phase.runs,
+                 'seconds: %.3f' % phase.seconds,
+                 'memory growth: %.1f KiB' % (phase.growth / 1024),
+                 '',
+                 'Memory kept by the run that kept the most, %.1f KiB:' % (
+                     phase.largest / 1024)]
+        before, after = phase.snapshots
+        stats = [stat for stat in after.compare_to(before, 'traceback')
+                 if stat.size_diff > 0]
+        stats = [stat for stat in stats
+                 if stat.traceback[-1].filename not in _IGNORED_FILES]
+        for i, stat in enumerate(stats[:TOP_ALLOCATIONS]):
+            lines.append('%d. %.1f KiB in %d blocks' % (
+                i + 1, stat.size_diff / 1024, stat.count_diff))
+            lines.extend(stat.traceback.format(limit=REPORT_FRAMES,
+                                               most_recent_first=True))
+        return '\n'.join(lines) + '\n'
+
+    def _dump(self):
+        paths = []
+        for name, phase in self._phases.items():
+            path = os.path.join(self._directory, 'profile-%d-%s' % (
+                self._started, name))
+            try:
+                phase.profile.dump_stats(path + '.prof')
+                with open(path + '.txt', 'w') as f:
+                    f.write(self._report(name, phase))
+            except OSError as e:
+                log.error('Could not write the %s profile: %s', name, e)
+                continue
+            paths.append(path + '.prof')
+        self._phases = {}
+        return paths
+
+
+profiler = SessionProfiler()
+
+
+def profiling_enabled(conf):
+    """Return True if terminalrc or the environment enable profiling."""
+    if os.environ.get('TERMINAL_PROFILE', '') not in ('', '0'):
+        return True
+    return conf.has_option('terminal', 'profile') and \
+        conf.getboolean('terminal', 'profile')
@@ -0,0 +1,133 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Throughput and latency counters for the PTY of a terminal.
+
+VTE reads the output of the child itself and does not tell how much it
+read, so output is counted in rows: how far the cursor moved down since
+the last contents-changed signal, or since the last check of the flood
+timer while the terminal is flooding. Input is counted in bytes, from
+the commit signal, which VTE emits for everything sent to the child.
+
+Counters are updated once per batch, never per byte. The echo latency
+is the time from the first input of a batch to the next change on
+screen.
+"""
+
+import collections
+
+# Seconds over which the output and input rates are averaged
+RATE_WINDOWS = (1, 10, 60)
+
+
+class PtyCounters(object):
+
+    def __init__(self):
+        self.rows_in = 0
+        self.batches_in = 0
+        self.bytes_out = 0
+        self.writes_out = 0
+        # Most rows received within one second
+        self.peak_rows = 0
+        self.floods = 0
+        self.flood_seconds = 0.0
+        self.echo_latency = None
+        self.echo_latency_max = None
+        # [second, rows in, bytes out] for each of the last seconds
+        self._seconds = collections.deque()
+        self._input_time = None
+        self._flood_start = None
+
+    def _bucket(self, now):
+        second = int(now)
+        if self._seconds and self._seconds[-1][0] == second:
+            return self._seconds[-1]
+        bucket = [second, 0, 0]
+        self._seconds.append(bucket)
+        while self._seconds[0][0] <= second - RATE_WINDOWS[-1]:
+            self._seconds.popleft()
+        return bucket
+
+    def add_output(self, rows, now):
+        """Count a batch of output, returning the echo latency it ends.
+
+        The latency is None if no input was waiting for the screen.
+        """
+        self.batches_in += 1
+        if rows > 0:
+            self.rows_in += rows
+            bucket = self._bucket(now)
+            bucket[1] += rows
+            if bucket[1] > self.peak_rows:
+                self.peak_rows = bucket[1]
+
+        if self._input_time is None:
+            return None
+        latency = now - self._input_time
+        self._input_time = None
+        self.echo_latency = latency
+        if self.echo_latency_max is None or latency > self.echo_latency_max:
+            self.echo_latency_max = latency
+        return latency
+
+    def add_input(self, size, now):
+        self.bytes_out += size
+        self.writes_out += 1
+        self._bucket(now)[2] += size
+        if self._input_time is None:
+            self._input_time = now
+
+    def set_flooding(self, flooding, now):
+        if flooding:
+            self.floods += 1
+            self._flood_start = now
+        elif self._flood_start is not None:
+            self.flood_seconds += now - self._flood_start
+            self._flood_start = None
+
+    def rates(self, now):
+        """Return the rows in and bytes out per second over each window."""
+        second = int(now)
+        rows = {}
+        bytes_out = {}
+        for window in RATE_WINDOWS:
+            recent = [bucket for bucket in self._seconds
+                      if bucket[0] > second - window]
+            rows[window] = sum(bucket[1] for bucket in recent) / window
+            bytes_out[window] = sum(bucket[2] for bucket in recent) / window
+        return rows, bytes_out
+
+    def to_dict(self, now):
+        rows, bytes_out = self.rates(now)
+        flood_seconds = self.flood_seconds
+        if self._flood_start is not None:
+            flood_seconds += now - self._flood_start
+
+        def ms(seconds):
+            return None if seconds is None else seconds * 1000
+
+        return {'rows_in': self.rows_in,
+                'batches_in': self.batches_in,
+                'bytes_out': self.bytes_out,
+                'writes_out': self.writes_out,
+                'rows_in_per_s': {str(w): rows[w] for w in RATE_WINDOWS},
+                'bytes_out_per_s': {str(w): bytes_out[w]
+                                    for w in RATE_WINDOWS},
+                'peak_rows_per_s': self.peak_rows,
+                'floods': self.floods,
+                'flood_seconds': flood_seconds,
+                'echo_latency_ms': ms(self.echo_latency),
+                'echo_latency_max_ms': ms(self.echo_latency_max)}
@@ -0,0 +1,398 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Recording and playback of terminal sessions.
+
+Recordings are asciicast v2 files: a JSON header line, then one
+[time, "o", text] line per chunk of output. Next to each recording, an
+index file holds a screen keyframe every KEYFRAME_INTERVAL seconds with
+the byte offset of the following event, so playback can seek without
+reading the recording from the start.
+
+A keyframe is only taken once the terminal has read all the output
+recorded so far, so that its screen and offset match.
+"""
+
+import bisect
+import codecs
+import fcntl
+import json
+import logging
+import os
+import queue
+import select
+import struct
+import termios
+import threading
+import time
+import tty
+
+from gi.repository import GLib
+from gi.repository import Vte
+
+log = logging.getLogger('Terminal')
+
+# Seconds between two screen keyframes
+KEYFRAME_INTERVAL = 10
+
+# Milliseconds between two tries of a keyframe that had to wait for the
+# terminal to read the output
+KEYFRAME_RETRY = 100
+
+# Seconds skipped by the arrow keys during playback
+SEEK_STEP = 10
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        try:
+            n = os.write(fd, view)
+        except BlockingIOError:
+            select.select([], [fd], [])
+            continue
+        view = view[n:]
+
+
+def _copy_window_size(from_fd, to_fd):
+    size = fcntl.ioctl(from_fd, termios.TIOCGWINSZ, b'\0' * 8)
+    fcntl.ioctl(to_fd, termios.TIOCSWINSZ, size)
+
+
+class _CastWriter(threading.Thread):
+    """Write queued events to a recording and its keyframe index."""
+
+    def __init__(self, path, width, height):
+        threading.Thread.__init__(self, daemon=True)
+        self._path = path
+        self._header = {'version': 2, 'width': width, 'height': height,
+                        'timestamp': int(time.time())}
+        self._queue = queue.SimpleQueue()
+
+    def put_output(self, t, data):
+        self._queue.put(('o', t, data))
+
+    def put_keyframe(self, t, screen, cursor):
+        self._queue.put(('k', t, (screen, cursor)))
+
+    def close(self):
+        self._queue.put(None)
+        self.join()
+
+    def run(self):
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        with open(self._path, 'wb') as cast, \
+                open(self._path + '.idx', 'w') as index:
+            cast.write(json.dumps(self._header).encode('utf-8') + b'\n')
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                kind, t, data = item
+                if kind == 'o':
+                    text = decoder.decode(data)
+                    if text:
+                        cast.write(json.dumps(
+                            [round(t, 6), 'o', text]).encode('utf-8') + b'\n')
+                else:
+                    index.write(json.dumps(
+                        {'time': t, 'offset': cast.tell(),
+                         'screen': data[0], 'cursor': data[1]}) + '\n')
+
+
+class Recorder(object):
+    """Record the output of a terminal while it keeps running.
+
+    The shell's PTY is taken from the terminal, which gets a new PTY in
+    raw mode instead. A relay thread copies data between the two and
+    queues the shell's output for a writer thread, so the main loop does
+    no work per byte.
+
+    finished_cb is called without arguments once the recording is saved,
+    whether it was stopped or the shell exited.
+    """
+
+    def __init__(self, terminal, path, finished_cb=None):
+        self._terminal = terminal
+        self.path = path
+        self._finished_cb = finished_cb
+        # Held by the relay from queueing output until it is written
+        self._lock = threading.Lock()
+        self._child_fd = None
+        self._slave_fd = None
+        self._stop_fds = None
+        self._thread = None
+        self._writer = None
+        self._start = None
+        self._handler_id = None
+        self._keyframe_id = None
+        self._retry_id = None
+
+    def start(self):
+        self._child_fd = os.dup(self._terminal.get_pty_fd())
+        master_fd, self._slave_fd = os.openpty()
+        tty.setraw(self._slave_fd)
+        self._stop_fds = os.pipe()
+
+        self._start = time.monotonic()
+        self._writer = _CastWriter(self.path,
+                                   self._terminal.get_column_count(),
+                                   self._terminal.get_row_count())
+        self._writer.start()
+        self._put_keyframe()
+
+        self._terminal.set_pty(Vte.Pty.new_foreign_sync(master_fd, None))
+        _copy_window_size(self._slave_fd, self._child_fd)
+        self._handler_id = self._terminal.connect(
+            'size-allocate', self.__size_allocate_cb)
+        self._keyframe_id = GLib.timeout_add_seconds(
+            KEYFRAME_INTERVAL, self.__keyframe_cb)
+
+        self._thread = threading.Thread(target=self._relay, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop recording and give the shell's PTY back to the terminal."""
+        if self._thread is None:
+            return
+        os.write(self._stop_fds[1], b'x')
+        self._thread.join()
+        self._thread = None
+        if self._child_fd is not None:
+            self._terminal.set_pty(
+                Vte.Pty.new_foreign_sync(self._child_fd, None))
+            self._child_fd = None
+        self._finish()
+
+    def _finish(self):
+        self._terminal.disconnect(self._handler_id)
+        GLib.source_remove(self._keyframe_id)
+        if self._retry_id is not None:
+            GLib.source_remove(self._retry_id)
+            self._retry_id = None
+        self._writer.close()
+        for fd in (self._slave_fd, self._child_fd) + self._stop_fds:
+            if fd is not None:
+                os.close(fd)
+        self._slave_fd = self._child_fd = None
+        self._stop_fds = ()
+        log.debug('recording saved to %s', self.path)
+        if self._finished_cb is not None:
+            self._finished_cb()
+
+    def __shell_exited_cb(self):
+        # Closing our end of the PTY lets the terminal see the exit
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self._finish()
+        return False
+
+    def __size_allocate_cb(self, widget, allocation):
+        if self._slave_fd is not None:
+            _copy_window_size(self._slave_fd, self._child_fd)
+
+    def __keyframe_cb(self):
+        if self._retry_id is None and not self._keyframe():
+            self._retry_id = GLib.timeout_add(
+                KEYFRAME_RETRY, self.__keyframe_retry_cb)
+        return True
+
+    def __keyframe_retry_cb(self):
+        if self._keyframe():
+            self._retry_id = None
+            return False
+        return True
+
+    def _keyframe(self):
+        """Take a keyframe, returning False if the terminal lags behind.
+
+        The relay cannot queue output meanwhile, and none of what it
+        queued is left unread in the terminal's PTY, so the writer puts
+        the keyframe right after the last output on screen.
+        """
+        # Never wait here: the relay may be blocked on a full PTY, which
+        # only the main loop empties
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            fd = self._terminal.get_pty_fd()
+            if fd is not None and struct.unpack('i', fcntl.ioctl(
+                    fd, termios.FIONREAD, b'\0' * 4))[0]:
+                return False
+            self._put_keyframe()
+        finally:
+            self._lock.release()
+        return True
+
+    def _put_keyframe(self):
+        top = self._terminal.get_screen_top()
+        screen = self._terminal.get_text_rows(
+            top, top + self._terminal.get_row_count() - 1)
+        column, row = self._terminal.get_cursor_position()
+        self._writer.put_keyframe(time.monotonic() - self._start, screen,
+                                  [column, row - top])
+
+    def _relay(self):
+        child_fd, slave_fd, stop_fd = \
+            self._child_fd, self._slave_fd, self._stop_fds[0]
+        try:
+            while True:
+                readable, writable_, errors_ = select.select(
+                    [child_fd, slave_fd, stop_fd], [], [])
+                if stop_fd in readable:
+                    return
+                if child_fd in readable:
+                    try:
+                        data = os.read(child_fd, 65536)
+                    except BlockingIOError:
+                        data = None
+                    if data == b'':
+                        break
+                    if data:
+                        with self._lock:
+                            self._writer.put_output(
+                                time.monotonic() - self._start, data)
+                            _write_all(slave_fd, data)
+                if slave_fd in readable:
+                    _write_all(child_fd, os.read(slave_fd, 65536))
+        except OSError:
+            # EIO once the shell has exited
+            pass
+        GLib.idle_add(self.__shell_exited_cb)
+
+
+class Player(object):
+    """Play a recording into a terminal, with seeking through keyframes.
+
+    Events are read from the recording as they are due, never all at
+    once. Left and Right seek by SEEK_STEP seconds, space pauses.
+    """
+
+    def __init__(self, terminal, path):
+        self._terminal = terminal
+        self._cast = open(path, 'rb')
+        self._header = json.loads(self._cast.readline().decode('utf-8'))
+        self._first_event = self._cast.tell()
+
+        self._keyframes = []
+        if os.path.exists(path + '.idx'):
+            with open(path + '.idx') as index:
+                self._keyframes = [json.loads(line) for line in index]
+        self._keyframe_times = [k['time'] for k in self._keyframes]
+
+        self._position = 0
+        self._clock = None
+        self._next = None
+        self._timeout_id = None
+        terminal.connect('key-press-event', self.__key_press_cb)
+        terminal.connect('destroy', self.__destroy_cb)
+
+    def play(self):
+        self._clock = time.monotonic() - self._position
+        self._schedule()
+
+    def pause(self):
+        if self._timeout_id is not None:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = None
+        if self._clock is not None:
+            self._position = time.monotonic() - self._clock
+            self._clock = None
+
+    def seek(self, position):
+        playing = self._clock is not None
+        self.pause()
+        position = max(0, position)
+
+        self._terminal.reset(True, True)
+        i = bisect.bisect_right(self._keyframe_times, position) - 1
+        if i >= 0:
+            keyframe = self._keyframes[i]
+            screen = keyframe['screen'].rstrip('\n').split('\n')
+            self._terminal.feed('\r\n'.join(screen).encode('utf-8'))
+            column, row = keyframe['cursor']
+            self._terminal.feed(b'\x1b[%d;%dH' % (row + 1, column + 1))
+            self._cast.seek(keyframe['offset'])
+        else:
+            self._cast.seek(self._first_event)
+        self._next = None
+        self._feed_until(position)
+
+        self._position = position
+        if playing:
+            self.play()
+
+    def _read_event(self):
+        while True:
+            line = self._cast.readline()
+            if not line:
+                return None
+            t, kind, text = json.loads(line.decode('utf-8'))
+            if kind == 'o':
+                return t, text
+
+    def _feed_until(self, position):
+        """Feed every event due at position, returning False at the end."""
+        while True:
+            if self._next is None:
+                self._next = self._read_event()
+                if self._next is None:
+                    return False
+            if self._next[0] > position:
+                return True
+            self._terminal.feed(self._next[1].encode('utf-8'))
+            self._next = None
+
+    def _schedule(self):
+        if self._next is None:
+            self._next = self._read_event()
+            if self._next is None:
+                self._clock = None
+                return
+        delay = self._next[0] - (time.monotonic() - self._clock)
+        self._timeout_id = GLib.timeout_add(
+            max(0, int(delay * 1000)), self.__timeout_cb)
+
+    def __timeout_cb(self):
+        self._timeout_id = None
+        if self._feed_until(time.monotonic() - self._clock):
+            self._schedule()
+        else:
+            self._position = time.monotonic() - self._clock
+            self._clock = None
+        return False
+
+    def __key_press_cb(self, widget, event):
+        position = self._position
+        if self._clock is not None:
+            position = time.monotonic() - self._clock
+        if event.keyval == 0xff51:  # Left
+            self.seek(position - SEEK_STEP)
+        elif event.keyval == 0xff53:  # Right
+            self.seek(position + SEEK_STEP)
+        elif event.keyval == 0x20:  # space
+            if self._clock is None:
+                self.play()
+            else:
+                self.pause()
+        else:
+            return False
+        return True
+
+    def __destroy_cb(self, widget):
+        self.pause()
+        self._cast.close()
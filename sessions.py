@@ -0,0 +1,366 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Shell sessions that outlive the activity.
+
+A session daemon, started on demand, owns the PTYs and shells. The
+activity talks to it over a Unix socket with one JSON object per line:
+
+    {"op": "spawn", "argv": [...], "env": {...}, "cwd": "...",
+     "rows": 24, "cols": 80}
+    {"op": "attach", "session": "..."}
+    {"op": "close", "session": "..."}
+
+Each reply is a JSON line, followed by "backlog" bytes of output if it
+has that key. Replies to spawn and attach carry the PTY master through
+SCM_RIGHTS, so VTE reads the shell directly while attached. Sessions
+are attached to the connection that spawned or attached them; when it
+closes, the daemon keeps reading their output into a bounded backlog
+that is handed over on the next attach.
+
+This module does not use Gtk, so the daemon can be run as a script:
+
+    python3 sessions.py SOCKET
+"""
+
+import errno
+import fcntl
+import functools
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import termios
+import time
+import uuid
+
+log = logging.getLogger('Terminal')
+
+# Bytes of output kept for a detached session
+SESSION_BACKLOG = 64 * 1024
+
+# The daemon exits when it has had no sessions and no clients this long
+DAEMON_IDLE_EXIT = 10
+
+# Seconds a new tab waits for a daemon that was started to listen, and
+# milliseconds between its attempts to connect
+DAEMON_START_TIMEOUT = 2
+DAEMON_POLL_INTERVAL = 50
+
+
+class Session(object):
+    """A shell owned by the session daemon, as seen by the activity."""
+
+    def __init__(self, client, session_id, pid, fd, backlog=b''):
+        self.id = session_id
+        self.pid = pid
+        self.fd = fd
+        self.backlog = backlog
+        self._client = client
+
+    def close(self):
+        """Ask the daemon to hang up the shell."""
+        self._client.close(self.id)
+
+
+class SessionClient(object):
+
+    def __init__(self, path):
+        self._path = path
+        self._sock = None
+        self._buffer = b''
+
+    def spawn(self, argv, env, cwd, rows, cols):
+        """Start a shell in a new session, returning None on failure."""
+        reply, fds, backlog_ = self._request(
+            {'op': 'spawn', 'argv': argv, 'env': env, 'cwd': cwd,
+             'rows': rows, 'cols': cols})
+        if reply is None or not fds:
+            return None
+        return Session(self, reply['session'], reply['pid'], fds[0])
+
+    def attach(self, session_id):
+        """Attach to a running session, returning None if it is gone."""
+        reply, fds, backlog = self._request(
+            {'op': 'attach', 'session': session_id})
+        if reply is None or not fds:
+            return None
+        return Session(self, session_id, reply['pid'], fds[0], backlog)
+
+    def close(self, session_id):
+        self._request({'op': 'close', 'session': session_id})
+
+    def start(self):
+        """Start the daemon unless it is listening, without waiting."""
+        if self.ready():
+            return
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), self._path],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, start_new_session=True)
+
+    def ready(self):
+        """Return whether the daemon is listening, without waiting."""
+        try:
+            self._connect()
+        except OSError:
+            return False
+        return True
+
+    def _connect(self):
+        if self._sock is not None:
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self._path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._buffer = b''
+
+    def _request(self, request):
+        """Send a request, returning (reply, fds, backlog).
+
+        The reply is None if the daemon failed or refused the request.
+        """
+        fds = []
+        try:
+            self._connect()
+            self._sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            while b'\n' not in self._buffer:
+                data, new_fds, flags_, address_ = socket.recv_fds(
+                    self._sock, 65536, 1)
+                fds.extend(new_fds)
+                if not data:
+                    raise ConnectionError('session daemon went away')
+                self._buffer += data
+            line, self._buffer = self._buffer.split(b'\n', 1)
+            reply = json.loads(line.decode('utf-8'))
+            size = reply.get('backlog', 0)
+            while len(self._buffer) < size:
+                data = self._sock.recv(65536)
+                if not data:
+                    raise ConnectionError('session daemon went away')
+                self._buffer += data
+            backlog, self._buffer = self._buffer[:size], self._buffer[size:]
+        except (OSError, ValueError) as e:
+            log.error('Session daemon request %s failed: %s',
+                      request['op'], e)
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+            for fd in fds:
+                os.close(fd)
+            return None, [], b''
+        if not reply.get('ok'):
+            for fd in fds:
+                os.close(fd)
+            return None, [], b''
+        return reply, fds, backlog
+
+
+class _DaemonSession(object):
+
+    def __init__(self, session_id, pid, fd):
+        self.id = session_id
+        self.pid = pid
+        self.fd = fd
+        self.backlog = bytearray()
+        self.client = None
+        self.reading = False
+
+
+class SessionDaemon(object):
+
+    def __init__(self, path):
+        self._path = path
+        self._selector = selectors.DefaultSelector()
+        self._sessions = {}
+        self._clients = {}
+        self._idle_since = time.monotonic()
+
+    def serve(self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        # Nobody else may connect, not even before the chmod
+        umask = os.umask(0o077)
+        try:
+            listener.bind(self._path)
+        finally:
+            os.umask(umask)
+        os.chmod(self._path, 0o600)
+        listener.listen()
+        self._selector.register(listener, selectors.EVENT_READ, self._accept)
+
+        try:
+            while True:
+                for key, events_ in self._selector.select(timeout=1):
+                    key.data(key.fileobj)
+                self._reap()
+                if self._sessions or self._clients:
+                    self._idle_since = time.monotonic()
+                elif time.monotonic() - self._idle_since > DAEMON_IDLE_EXIT:
+                    break
+        finally:
+            os.unlink(self._path)
+
+    def _accept(self, listener):
+        sock, address_ = listener.accept()
+        self._clients[sock] = b''
+        self._selector.register(sock, selectors.EVENT_READ, self._read_client)
+
+    def _read_client(self, sock):
+        try:
+            data = sock.recv(65536)
+        except OSError:
+            data = b''
+        if not data:
+            self._drop_client(sock)
+            return
+        buffer = self._clients[sock] + data
+        while b'\n' in buffer:
+            line, buffer = buffer.split(b'\n', 1)
+            try:
+                try:
+                    self._handle(sock, json.loads(line.decode('utf-8')))
+                except (ValueError, LookupError, TypeError, AttributeError,
+                        struct.error) as e:
+                    # A bad request fails on its own, never the daemon
+                    self._reply(sock, {'ok': False, 'error': str(e)})
+            except OSError:
+                self._drop_client(sock)
+                return
+        self._clients[sock] = buffer
+
+    def _drop_client(self, sock):
+        self._selector.unregister(sock)
+        del self._clients[sock]
+        sock.close()
+        for session in self._sessions.values():
+            if session.client is sock:
+                # Keep the shell from blocking on a full PTY
+                session.client = None
+                session.reading = True
+                self._selector.register(
+                    session.fd, selectors.EVENT_READ,
+                    functools.partial(self._read_session, session))
+
+    def _handle(self, sock, request):
+        op = request.get('op')
+        session = self._sessions.get(request.get('session'))
+        if op == 'spawn':
+            session = self._spawn(request)
+            session.client = sock
+            self._reply(sock, {'ok': True, 'session': session.id,
+                               'pid': session.pid}, session.fd)
+        elif op == 'attach' and session is not None and session.reading:
+            self._selector.unregister(session.fd)
+            session.reading = False
+            session.client = sock
+            backlog = bytes(session.backlog)
+            session.backlog = bytearray()
+            self._reply(sock, {'ok': True, 'pid': session.pid,
+                               'backlog': len(backlog)}, session.fd)
+            sock.sendall(backlog)
+        elif op == 'close' and session is not None:
+            try:
+                os.killpg(session.pid, signal.SIGHUP)
+            except OSError:
+                pass
+            self._reply(sock, {'ok': True})
+        else:
+            self._reply(sock, {'ok': False})
+
+    def _reply(self, sock, reply, fd=None):
+        data = json.dumps(reply).encode('utf-8') + b'\n'
+        if fd is None:
+            sock.sendall(data)
+        else:
+            socket.send_fds(sock, [data], [fd])
+
+    def _spawn(self, request):
+        # Check the request before forking, so that it fails here
+        argv = request['argv']
+        if not argv or not all(isinstance(arg, str) for arg in argv):
+            raise ValueError('argv must be a list of strings')
+        winsize = None
+        if 'rows' in request and 'cols' in request:
+            winsize = struct.pack('HHHH', request['rows'], request['cols'],
+                                  0, 0)
+        pid, fd = os.forkpty()
+        if pid == 0:
+            try:
+                # Do not pass on what the daemon ignores
+                signal.signal(signal.SIGHUP, signal.SIG_DFL)
+                signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+                try:
+                    os.chdir(request.get('cwd') or '/')
+                except OSError:
+                    pass
+                os.execvpe(argv[0], argv, request.get('env') or os.environ)
+            finally:
+                os._exit(127)
+        if winsize is not None:
+            fcntl.ioctl(fd, termios.TIOCSWINSZ, winsize)
+        session = _DaemonSession(uuid.uuid4().hex, pid, fd)
+        self._sessions[session.id] = session
+        return session
+
+    def _read_session(self, session, fd):
+        try:
+            data = os.read(session.fd, 65536)
+        except OSError as e:
+            if e.errno != errno.EIO:
+                raise
+            data = b''
+        if not data:
+            # The shell is gone; it is removed once reaped
+            self._selector.unregister(session.fd)
+            session.reading = False
+            return
+        session.backlog += data
+        del session.backlog[:-SESSION_BACKLOG]
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status_ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            for session in list(self._sessions.values()):
+                if session.pid == pid:
+                    if session.reading:
+                        self._selector.unregister(session.fd)
+                    os.close(session.fd)
+                    del self._sessions[session.id]
+
+
+def main():
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    SessionDaemon(sys.argv[1]).serve()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Shell integration for the Terminal activity, loaded with --rcfile by
+# the interactive bash shells it starts.
+#
+# Each command is framed with OSC 133 marks: A before the prompt, B
+# after it, C when the command starts and D;<status> when it returns.
+# VTE does not report OSC 133 to the activity, so the starts of commands
+# and prompts are also sent as OSC 6 file URIs under
+# /.sugar-terminal-mark/, which VTE does report. It only reports the
+# last one of each chunk of output it reads, so each URI carries what
+# the activity needs even if those before it were lost:
+#
+#   C/<n>             command number n starts
+#   A/<n>/<status>    a prompt, after command n returned status
+
+if [ -f /etc/bash.bashrc ]; then
+    . /etc/bash.bashrc
+fi
+if [ -f ~/.bashrc ]; then
+    . ~/.bashrc
+fi
+
+__sugar_terminal_mark() {
+    printf '\033]133;%s\007' "$1${2:+;$2}"
+}
+
+__sugar_terminal_uri() {
+    printf '\033]6;file:///.sugar-terminal-mark/%s\007' "$1"
+}
+
+__sugar_terminal_commands=0
+__sugar_terminal_status=0
+
+__sugar_terminal_precmd() {
+    local status=$?
+    __sugar_terminal_at_prompt=
+    if [ -n "$__sugar_terminal_running" ]; then
+        __sugar_terminal_mark D "$status"
+        __sugar_terminal_running=
+        __sugar_terminal_status=$status
+    fi
+    __sugar_terminal_mark A
+    __sugar_terminal_uri \
+        "A/$__sugar_terminal_commands/$__sugar_terminal_status"
+}
+
+__sugar_terminal_preexec() {
+    local status=$?
+    # An empty command line runs the prompt hooks straight away
+    if [ -n "$__sugar_terminal_at_prompt" ] && \
+            [ "$BASH_COMMAND" != __sugar_terminal_precmd ]; then
+        __sugar_terminal_at_prompt=
+        __sugar_terminal_running=1
+        __sugar_terminal_commands=$((__sugar_terminal_commands + 1))
+        __sugar_terminal_mark C
+        __sugar_terminal_uri "C/$__sugar_terminal_commands"
+    fi
+    # For a DEBUG trap of the user's that runs after this one
+    return $status
+}
+
+if [ -z "$__sugar_terminal_loaded" ]; then
+    __sugar_terminal_loaded=1
+    # The precmd hook comes first to see the status of the command, and
+    # the prompt is only marked ready once the others have run. Bash 5.1
+    # runs each element of an array PROMPT_COMMAND.
+    if [[ "$(declare -p PROMPT_COMMAND 2>/dev/null)" == "declare -a"* ]]; then
+        PROMPT_COMMAND=(__sugar_terminal_precmd "${PROMPT_COMMAND[@]}"
+                        __sugar_terminal_at_prompt=1)
+    else
+        PROMPT_COMMAND="__sugar_terminal_precmd;${PROMPT_COMMAND:+$PROMPT_COMMAND;}__sugar_terminal_at_prompt=1"
+    fi
+    # A constant sequence, so that no prompt forks a subshell for it
+    PS1="$PS1\\[\\e]133;B\\a\\]"
+    # Keep a DEBUG trap set by the user's bashrc, after ours
+    __sugar_terminal_trap=$(trap -p DEBUG)
+    __sugar_terminal_trap=${__sugar_terminal_trap#trap -- }
+    __sugar_terminal_trap=${__sugar_terminal_trap% DEBUG}
+    eval "__sugar_terminal_trap=${__sugar_terminal_trap:-''}"
+    trap "__sugar_terminal_preexec${__sugar_terminal_trap:+
+$__sugar_terminal_trap}" DEBUG
+    unset __sugar_terminal_trap
+fi
@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Run Terminal in a plain window, without the Sugar shell.
+
+Usage:
+
+    python3 standalone.py [--root DIRECTORY] [--debug]
+
+The window has the same tabs, terminals, toolbars and terminalrc as the
+activity, but none of the Sugar services, which makes it quicker to
+start, usable on a kiosk and a steady target for benchmarks:
+
+ - the tabs are saved to <root>/data/session.json when the window
+   closes, and restored from it when it opens again
+ - Journal entries, such as scrollback exports and large selections,
+   are written to <root>/journal with their metadata in a .json file
+ - links open in the default application of the desktop
+ - the activity toolbar button only shows the activity icon
+
+<root> is $SUGAR_ACTIVITY_ROOT if set, or terminal under
+$XDG_DATA_HOME. Gtk 3, VTE and the sugar3 toolkit are still needed.
+"""
+
+import argparse
+import configparser
+import gettext
+import json
+import logging
+import os
+import shutil
+import uuid
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import GLib
+from gi.repository import GObject
+from gi.repository import Gdk
+from gi.repository import Gio
+from gi.repository import Gtk
+
+from sugar3 import profile
+from sugar3.activity import activity
+from sugar3.activity import widgets
+from sugar3.activity.activityhandle import ActivityHandle
+from sugar3.datastore import datastore
+from sugar3.graphics.icon import Icon
+from sugar3.graphics.toolbutton import ToolButton
+from sugar3.graphics.xocolor import XoColor
+
+log = logging.getLogger('Terminal')
+
+# Size of the window when it opens
+WINDOW_WIDTH = 1024
+WINDOW_HEIGHT = 768
+
+# Buddy colors used when the Sugar settings are not installed
+DEFAULT_COLOR = '#005FE4,#00A0FF'
+
+_BUNDLE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+class StandaloneActivity(Gtk.Window):
+    """The part of sugar3's Activity that TerminalActivity uses."""
+
+    active = GObject.Property(type=bool, default=True)
+
+    def __init__(self, handle):
+        Gtk.Window.__init__(self, title=os.environ['SUGAR_BUNDLE_NAME'])
+        self.set_default_size(WINDOW_WIDTH, WINDOW_HEIGHT)
+        self.metadata = {'title': os.environ['SUGAR_BUNDLE_NAME'],
+                         'mime_type': ''}
+        self._session_path = _get_session_path()
+        self._busy_count = 0
+        self._vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self.add(self._vbox)
+        self._vbox.show()
+        self.connect('key-press-event', self._Window__key_press_cb)
+        self.connect('delete-event', self.__delete_event_cb)
+        self.connect('window-state-event', self.__window_state_cb)
+
+    def _Window__key_press_cb(self, widget, event):
+        # TerminalActivity disconnects the key handler of Sugar's Window
+        return False
+
+    def __delete_event_cb(self, widget, event):
+        self.close()
+        return True
+
+    def __window_state_cb(self, widget, event):
+        iconified = event.new_window_state & Gdk.WindowState.ICONIFIED
+        self.props.active = not iconified
+
+    def get_activity_root(self):
+        return activity.get_activity_root()
+
+    def set_toolbar_box(self, toolbar_box):
+        self._vbox.pack_start(toolbar_box, False, False, 0)
+        self._vbox.reorder_child(toolbar_box, 0)
+
+    def set_canvas(self, canvas):
+        self._vbox.pack_end(canvas, True, True, 0)
+        canvas.connect('map', self.__canvas_map_cb)
+
+    def __canvas_map_cb(self, canvas):
+        # Like Sugar, restore the session once the canvas is shown
+        canvas.disconnect_by_func(self.__canvas_map_cb)
+        if os.path.exists(self._session_path):
+            self.metadata['mime_type'] = 'text/plain'
+            self.read_file(self._session_path)
+
+    def add_alert(self, alert):
+        self._vbox.pack_start(alert, False, False, 0)
+        self._vbox.reorder_child(alert, 1)
+        alert.show()
+
+    def remove_alert(self, alert):
+        if alert.get_parent() is self._vbox:
+            self._vbox.remove(alert)
+
+    def busy(self):
+        self._busy_count += 1
+        if self._busy_count == 1 and self.get_window() is not None:
+            self.get_window().set_cursor(Gdk.Cursor.new_for_display(
+                self.get_display(), Gdk.CursorType.WATCH))
+
+    def unbusy(self):
+        self._busy_count -= 1
+        if self._busy_count == 0 and self.get_window() is not None:
+            self.get_window().set_cursor(None)
+        return self._busy_count
+
+    def save(self):
+        path = self._session_path + '.tmp'
+        try:
+            self.write_file(path)
+            os.replace(path, self._session_path)
+        except (OSError, ValueError) as e:
+            log.error('Could not save the session to %s: %s',
+                      self._session_path, e)
+
+    def close(self, skip_save=False):
+        if not skip_save:
+            self.save()
+        self.destroy()
+
+
+class ActivityTitle(ToolButton):
+    """Stands in for ActivityToolbarButton, which needs the Journal."""
+
+    def __init__(self, activity):
+        ToolButton.__init__(self)
+        icon = Icon(file=os.path.join(_BUNDLE_PATH, 'activity',
+                                      'activity-terminal.svg'),
+                    xo_color=profile.get_color())
+        self.set_icon_widget(icon)
+        icon.show()
+        self.props.tooltip = activity.metadata['title']
+
+
+class LocalJournal(object):
+    """Journal entries kept as files in a directory.
+
+    create() and write() replace those of sugar3.datastore. Like them,
+    write() calls its handlers from the main loop.
+    """
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    def create(self):
+        return _JournalEntry()
+
+    def write(self, entry, update_mtime=True, transfer_ownership=False,
+              reply_handler=None, error_handler=None, timeout=-1):
+        object_id = entry.object_id or str(uuid.uuid4())
+        path = os.path.join(self._directory, object_id)
+        try:
+            if entry.file_path and entry.file_path != path:
+                if transfer_ownership:
+                    shutil.move(entry.file_path, path)
+                else:
+                    shutil.copyfile(entry.file_path, path)
+            with open(path + '.json', 'w') as f:
+                json.dump(dict(entry.metadata), f, indent=1)
+        except OSError as e:
+            if error_handler is None:
+                raise
+            GLib.idle_add(error_handler, e)
+            return
+        entry.object_id = object_id
+        entry.file_path = path
+        log.debug('journal entry written to %s', path)
+        if reply_handler is not None:
+            GLib.idle_add(reply_handler, object_id)
+
+
+class _JournalEntry(object):
+
+    def __init__(self):
+        self.object_id = None
+        self.metadata = {}
+        self.file_path = None
+
+    def destroy(self):
+        pass
+
+
+class OpenLinkJob(object):
+    """Stands in for sugarterm.OpenLinkJob, which needs Browse."""
+
+    def __init__(self, activity, url):
+        self._activity = activity
+        self._url = url
+
+    def start(self):
+        uri = Gio.File.new_for_commandline_arg(self._url).get_uri()
+        try:
+            Gtk.show_uri_on_window(self._activity, uri,
+                                   Gtk.get_current_event_time())
+        except GLib.Error as e:
+            log.error('Could not open %s: %s', uri, e)
+
+
+def _get_session_path():
+    return os.path.join(activity.get_activity_root(), 'data', 'session.json')
+
+
+def _setup_environment(root):
+    """Set what sugar-activity3 would, unless already set."""
+    info = configparser.ConfigParser()
+    info.read(os.path.join(_BUNDLE_PATH, 'activity', 'activity.info'))
+    bundle_id = info.get('Activity', 'bundle_id')
+    os.environ.setdefault('SUGAR_BUNDLE_PATH', _BUNDLE_PATH)
+    os.environ.setdefault('SUGAR_BUNDLE_ID', bundle_id)
+    os.environ.setdefault('SUGAR_BUNDLE_NAME', info.get('Activity', 'name'))
+    os.environ.setdefault('SUGAR_BUNDLE_VERSION',
+                          info.get('Activity', 'activity_version'))
+    os.environ.setdefault('SUGAR_ACTIVITY_ROOT', root)
+    for name in ('instance', 'data', 'tmp', 'journal'):
+        os.makedirs(os.path.join(os.environ['SUGAR_ACTIVITY_ROOT'], name),
+                    exist_ok=True)
+
+    gettext.bindtextdomain(bundle_id, os.path.join(_BUNDLE_PATH, 'locale'))
+    gettext.textdomain(bundle_id)
+
+
+def _install_standins():
+    """Replace the Sugar services before terminal is imported."""
+    activity.Activity = StandaloneActivity
+    widgets.ActivityToolbarButton = ActivityTitle
+
+    journal = LocalJournal(os.path.join(activity.get_activity_root(),
+                                        'journal'))
+    datastore.create = journal.create
+    datastore.write = journal.write
+
+    # Gio aborts the process on a missing schema
+    source = Gio.SettingsSchemaSource.get_default()
+    if source is None or source.lookup('org.sugarlabs.user', True) is None:
+        profile.get_color = lambda: XoColor(DEFAULT_COLOR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--root', help='directory of the session, the '
+                        'Journal entries and the instance files')
+    parser.add_argument('--debug', action='store_true',
+                        help='log debug messages')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.WARNING)
+
+    if args.root:
+        os.environ['SUGAR_ACTIVITY_ROOT'] = os.path.abspath(args.root)
+    data_home = os.environ.get('XDG_DATA_HOME') or \
+        os.path.expanduser(os.path.join('~', '.local', 'share'))
+    _setup_environment(os.path.join(data_home, 'terminal'))
+    _install_standins()
+
+    # Only now, so that TerminalActivity derives from StandaloneActivity
+    import sugarterm
+    import terminal
+    import watchdog
+
+    sugarterm.OpenLinkJob = OpenLinkJob
+    # Stalls are blamed on the handlers main() runs, not on main()
+    watchdog.register_main_loop(main)
+    # Like a Journal entry, a saved session makes this a resume
+    object_id = None
+    if os.path.exists(_get_session_path()):
+        object_id = 'session'
+    window = terminal.TerminalActivity(
+        ActivityHandle(activity_id='standalone', object_id=object_id))
+    window.connect('destroy', Gtk.main_quit)
+    window.show()
+    Gtk.main()
+
+
+if __name__ == '__main__':
+    main()
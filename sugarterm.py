@@ -23,7 +23,10 @@ This is a modified upstream source of the famous Guake Terminal
 https://github.com/Guake/guake/blob/master/guake/terminal.py
 
 """
+import array
+import bisect
 import code
+import collections
 import configparser
 import logging
 import os
@@ -31,10 +34,12 @@ import re
 import shlex
 import signal
 import sys
+import tempfile
 import threading
 import uuid
 
 from enum import IntEnum
+from gettext import gettext as _
 from pathlib import Path
 from typing import Optional
 from typing import Tuple
@@ -43,17 +48,23 @@ from urllib.parse import urlparse
 
 import time
 
+import dbus
 import gi
 from sugar3 import profile, env
-from sugar3.activity.activity import launch_bundle
+from sugar3.activity.activity import J_DBUS_INTERFACE
+from sugar3.activity.activity import J_DBUS_PATH
+from sugar3.activity.activity import J_DBUS_SERVICE
 from sugar3.datastore import datastore
 
+from metrics import metrics
 from palette import ContentInvoker
+from ptystats import PtyCounters
 
 gi.require_version('Gtk', '3.0')
 gi.require_version('Vte', '2.91')  # vte-0.38
 
 from gi.repository import GLib
+from gi.repository import GObject
 from gi.repository import Gdk
 from gi.repository import Gtk
 from gi.repository import Pango
@@ -74,6 +85,35 @@ TERMINAL_MATCH_EXPRS = [
     "[-[:alnum:]]+(\\.[-[:alnum:]]+)*"
 ]
 
+# Seconds the shell of a closed tab gets to exit after SIGHUP, before its
+# session is sent SIGKILL, and then to be reaped, before its terminal is
+# released anyway.
+CHILD_KILL_TIMEOUT = 3
+
+# A terminal that scrolls FLOOD_ROWS rows within FLOOD_WINDOW seconds
+# enters flood mode, and leaves it after FLOOD_SETTLE quiet seconds.
+FLOOD_WINDOW = 0.5
+FLOOD_ROWS = 500
+FLOOD_SETTLE = 1.0
+
+# Large pastes are handed to VTE this many bytes at a time, from an
+# idle-priority watch, so the main loop can keep drawing in between.
+PASTE_CHUNK_SIZE = 4096
+
+# Selections longer than this, in characters, are saved to the Journal
+# rather than put in the clipboard
+CLIPBOARD_MAX_SIZE = 1024 * 1024
+
+BRACKETED_PASTE_START = b'\x1b[200~'
+BRACKETED_PASTE_END = b'\x1b[201~'
+
+# shell-integration.bash sends the starts of commands and prompts as OSC 6
+# file URIs under this path, because VTE reports OSC 6 but not OSC 133.
+# VTE only reports the last URI of each chunk of output it reads, with
+# the cursor where the chunk ends, so marks may be missed and their rows
+# are those of the cursor after the prompt or command line.
+COMMAND_MARK_URI = 'file:///.sugar-terminal-mark/'
+
 log = logging
 
 libutempter = None
@@ -108,6 +148,53 @@ def halt(loc):
     code.interact(local=loc)
 
 
+def _is_utf8_boundary(data):
+    """Return True if data does not end inside a UTF-8 sequence."""
+    for i in range(1, min(4, len(data)) + 1):
+        byte = data[-i]
+        if byte < 0x80:
+            return i == 1
+        if byte >= 0xC0:
+            needed = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return needed == i
+    return True
+
+
+def _get_session_pgrps(sid):
+    """Return the process groups of the live processes in session sid."""
+    pgrps = set()
+    try:
+        names = os.listdir('/proc')
+    except OSError:
+        return pgrps
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % name, 'rb') as f:
+                stat = f.read()
+        except OSError:
+            # The process exited meanwhile
+            continue
+        fields = stat.rsplit(b')', 1)[1].split()
+        if fields[0] != b'Z' and int(fields[3]) == sid:
+            pgrps.add(int(fields[2]))
+    return pgrps
+
+
+def read_terminal_config():
+    """Return the parsed terminalrc and its path."""
+    conf = configparser.ConfigParser()
+    conf_file = os.path.join(env.get_profile_path(), 'terminalrc')
+
+    if os.path.isfile(conf_file):
+        with open(conf_file, 'r') as f:
+            conf.read_file(f)
+    else:
+        conf.add_section('terminal')
+    return conf, conf_file
+
+
 __all__ = ['SugarTerminal']
 
 # pylint: enable=anomalous-backslash-in-string
@@ -118,16 +205,489 @@ class DropTargets(IntEnum):
     TEXT = 1
 
 
+class _PasteJob(object):
+
+    __slots__ = ('data', 'offset', 'paste', 'bracketed')
+
+    def __init__(self, data, paste):
+        self.data = memoryview(data)
+        self.offset = 0
+        self.paste = paste
+        self.bracketed = False
+
+
+class ChildWriter(object):
+    """Queue bytes for the child and write them in bounded chunks.
+
+    Chunks go through VTE, so they stay in order with what is typed, and
+    are handed over when the PTY becomes writable, or from an idle
+    callback when no PTY file descriptor is available. This is not flow
+    control: VTE queues what it is given until the child reads it, and
+    the PTY is writable as long as the kernel has room, so it only keeps
+    each main loop iteration short. A paste is sent in one bracket pair
+    if the child asked for bracketed pastes, with its chunks in between.
+    """
+
+    def __init__(self, terminal):
+        self._terminal = terminal
+        self._jobs = collections.deque()
+        self._source_id = None
+        # True while VTE reports our own writes with commit
+        self.writing = False
+
+    @property
+    def pending(self):
+        return sum(len(job.data) - job.offset for job in self._jobs)
+
+    def write(self, data, paste=False):
+        if not data:
+            return
+        self._jobs.append(_PasteJob(data, paste))
+        if self._source_id is None and self._write_chunk():
+            self._start_watch()
+
+    def cancel(self):
+        """Drop any queued data, returning True if something was pending.
+
+        A bracketed paste cut short is closed, so the child is never left
+        in paste mode.
+        """
+        if not self._jobs:
+            return False
+        if self._jobs[0].bracketed:
+            self.writing = True
+            try:
+                self._terminal.end_paste()
+            finally:
+                self.writing = False
+        self._jobs.clear()
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+        return True
+
+    def _start_watch(self):
+        fd = self._terminal.get_pty_fd()
+        if fd is None:
+            self._source_id = GLib.idle_add(
+                self.__dispatch_cb, priority=GLib.PRIORITY_DEFAULT_IDLE)
+        else:
+            self._source_id = GLib.io_add_watch(
+                fd, GLib.PRIORITY_DEFAULT_IDLE, GLib.IOCondition.OUT,
+                self.__dispatch_cb)
+
+    def __dispatch_cb(self, *args):
+        if self._write_chunk():
+            return True
+        self._source_id = None
+        return False
+
+    def _write_chunk(self):
+        """Write at most one chunk, returning True if more remains."""
+        if not self._jobs:
+            return False
+        job = self._jobs[0]
+        chunk = bytes(job.data[job.offset:job.offset + PASTE_CHUNK_SIZE])
+        # Do not split a multi-byte character across two chunks
+        trimmed = chunk
+        while trimmed and not _is_utf8_boundary(trimmed):
+            trimmed = trimmed[:-1]
+        if trimmed:
+            chunk = trimmed
+        self.writing = True
+        try:
+            if job.paste and job.offset == 0:
+                job.bracketed = self._terminal.begin_paste()
+            self._terminal.feed_child_bytes(chunk)
+            job.offset += len(chunk)
+            if job.offset >= len(job.data):
+                self._jobs.popleft()
+                if job.bracketed:
+                    self._terminal.end_paste()
+        finally:
+            self.writing = False
+        return bool(self._jobs)
+
+
+class InputBroadcaster(object):
+    """Send what is typed or pasted in one terminal to a set of others.
+
+    Input is encoded once, and everything typed during one main loop
+    iteration is written to all targets from a single idle callback, so
+    a keystroke costs one write per target and no main loop source each.
+    """
+
+    def __init__(self):
+        self._targets = collections.OrderedDict()
+        self._batches = []
+        self._idle_id = None
+        self._dispatching = False
+
+    def __contains__(self, terminal):
+        return terminal in self._targets
+
+    def __len__(self):
+        return len(self._targets)
+
+    def add(self, terminal):
+        if terminal not in self._targets:
+            self._targets[terminal] = terminal.connect(
+                'commit', self.__commit_cb)
+            terminal.broadcaster = self
+
+    def remove(self, terminal):
+        handler_id = self._targets.pop(terminal, None)
+        if handler_id is not None:
+            terminal.disconnect(handler_id)
+            terminal.broadcaster = None
+
+    def clear(self):
+        for terminal in list(self._targets):
+            self.remove(terminal)
+        if self._idle_id is not None:
+            GLib.source_remove(self._idle_id)
+            self._idle_id = None
+        self._batches = []
+
+    def __commit_cb(self, terminal, text, size):
+        # Ignore what VTE reports of our own writes to the targets, and
+        # of pastes, which paste() hands over
+        if not self._dispatching and not terminal.writing_input:
+            self.send(text.encode('utf-8'), terminal)
+
+    def send(self, data, source=None):
+        """Queue data for every target except source."""
+        if self._batches and self._batches[-1][0] is source:
+            self._batches[-1][1].extend(data)
+        else:
+            self._batches.append((source, bytearray(data)))
+        if self._idle_id is None:
+            self._idle_id = GLib.idle_add(
+                self.__dispatch_cb, priority=GLib.PRIORITY_HIGH_IDLE)
+
+    def paste(self, data, source):
+        """Hand a paste from source to the chunked writer of each target.
+        """
+        # Keep it behind what was typed before
+        self._flush()
+        self._dispatching = True
+        try:
+            for terminal in self._targets:
+                if terminal is not source:
+                    terminal.write_input(data, paste=True)
+        finally:
+            self._dispatching = False
+
+    def __dispatch_cb(self):
+        self._idle_id = None
+        self._flush()
+        return False
+
+    def _flush(self):
+        batches, self._batches = self._batches, []
+        if not batches:
+            return
+        self._dispatching = True
+        try:
+            if len(batches) == 1:
+                source, data = batches[0]
+                data = bytes(data)
+                for terminal in self._targets:
+                    if terminal is not source:
+                        terminal.write_input(data)
+            else:
+                for terminal in self._targets:
+                    data = b''.join(data for source, data in batches
+                                    if source is not terminal)
+                    if data:
+                        terminal.write_input(data)
+        finally:
+            self._dispatching = False
+
+
+class ChildReaper(object):
+    """Terminate the shells of closed tabs and release their terminals.
+
+    Closed terminals are kept until VTE's own GLib child watch reaps the
+    shell and emits child-exited. Nothing else may wait for the pid, see
+    g_child_watch_source_new():
+
+        * the application must not wait for pid to exit by any
+          other mechanism, including waitpid(pid, ...) or a second
+          child-watch source for the same pid
+
+    One timer sends SIGKILL to every shell still running after
+    CHILD_KILL_TIMEOUT, and releases the terminals of those still not
+    reaped CHILD_KILL_TIMEOUT later.
+    """
+
+    def __init__(self):
+        self._deadlines = {}
+        self._killed = set()
+        self._timeout_id = None
+
+    def terminate(self, terminal):
+        if terminal.child_exited or terminal.pid is None:
+            self._release(terminal)
+            return
+        terminal.connect('child-exited', self.__child_exited_cb)
+        self._deadlines[terminal] = time.monotonic() + CHILD_KILL_TIMEOUT
+        terminal.signal_child(signal.SIGHUP)
+        if self._timeout_id is None:
+            self._timeout_id = GLib.timeout_add_seconds(1, self.__timeout_cb)
+
+    def __child_exited_cb(self, terminal, status):
+        del self._deadlines[terminal]
+        self._killed.discard(terminal)
+        self._release(terminal)
+
+    def __timeout_cb(self):
+        now = time.monotonic()
+        for terminal, deadline in list(self._deadlines.items()):
+            if deadline > now:
+                continue
+            if terminal in self._killed:
+                log.warning("Shell %d was not reaped after SIGKILL, "
+                            "releasing its terminal", terminal.pid)
+                terminal.disconnect_by_func(self.__child_exited_cb)
+                del self._deadlines[terminal]
+                self._killed.discard(terminal)
+                self._release(terminal)
+                continue
+            log.debug("Shell %d ignored SIGHUP, killing it", terminal.pid)
+            terminal.signal_child(signal.SIGKILL)
+            self._killed.add(terminal)
+            self._deadlines[terminal] = now + CHILD_KILL_TIMEOUT
+        if self._deadlines:
+            return True
+        self._timeout_id = None
+        return False
+
+    def _release(self, terminal):
+        terminal.release()
+        terminal.destroy()
+
+
+_reaper = ChildReaper()
+
+
+class OpenLinkJob(object):
+    """Open a link in the Browse activity without blocking the UI.
+
+    The link is saved to the Journal as a text/uri-list entry, then the
+    Journal is asked to launch it. Both D-Bus calls are asynchronous and
+    the activity shows as busy until they complete. Entries are kept per
+    link, so opening the same link again only launches it.
+    """
+
+    _object_ids = {}
+
+    def __init__(self, activity, url):
+        self._activity = activity
+        self._url = url
+
+    def start(self):
+        self._set_busy(True)
+        object_id = self._object_ids.get(self._url)
+        if object_id is not None:
+            self._launch(object_id, retry=True)
+            return
+
+        path = os.path.join(self._activity.get_activity_root(),
+                            'instance', '%i' % time.time())
+        with open(path, 'w') as fd:
+            fd.write(self._url)
+
+        journal_entry = datastore.create()
+        journal_entry.metadata['title'] = 'Browse Activity'
+        journal_entry.metadata['title_set_by_user'] = '1'
+        journal_entry.metadata['keep'] = '0'
+        journal_entry.metadata['mime_type'] = 'text/uri-list'
+        journal_entry.metadata['icon-color'] = profile.get_color().to_string()
+        journal_entry.metadata['description'] = \
+            "Opening {} from the Terminal".format(self._url)
+        journal_entry.file_path = path
+        datastore.write(journal_entry, transfer_ownership=True,
+                        reply_handler=self.__write_reply_cb,
+                        error_handler=self.__error_cb)
+
+    def __write_reply_cb(self, object_id):
+        self._object_ids[self._url] = object_id
+        self._launch(object_id, retry=False)
+
+    def _launch(self, object_id, retry):
+        def error_cb(error):
+            if retry:
+                # The cached entry may have been erased from the Journal
+                log.debug("Could not launch %s, saving it again", object_id)
+                del self._object_ids[self._url]
+                self._set_busy(False)
+                self.start()
+            else:
+                self.__error_cb(error)
+
+        bus = dbus.SessionBus()
+        journal = dbus.Interface(
+            bus.get_object(J_DBUS_SERVICE, J_DBUS_PATH), J_DBUS_INTERFACE)
+        journal.LaunchBundle('', object_id,
+                             reply_handler=self.__launch_reply_cb,
+                             error_handler=error_cb)
+
+    def __launch_reply_cb(self, *args):
+        self._set_busy(False)
+
+    def __error_cb(self, error):
+        log.error("Could not open %s: %s", self._url, error)
+        self._set_busy(False)
+
+    def _set_busy(self, busy):
+        if not hasattr(self._activity, 'busy'):
+            return
+        if busy:
+            self._activity.busy()
+        else:
+            self._activity.unbusy()
+
+
+class SaveSelectionJob(object):
+    """Save text too large for the clipboard as a new Journal entry.
+
+    Putting it in the clipboard would block the activity, and then the
+    clipboard manager, while they copy it. Instead the text is written to
+    a file in a worker thread, which the datastore then takes over
+    asynchronously. done_cb is called with True once it is saved, or
+    False if that failed.
+    """
+
+    def __init__(self, activity, text, title, done_cb):
+        self._activity = activity
+        self._text = text
+        self._title = title
+        self._done_cb = done_cb
+        self._path = None
+
+    def start(self):
+        fd, self._path = tempfile.mkstemp(
+            suffix='.txt', dir=os.path.join(
+                self._activity.get_activity_root(), 'instance'))
+        threading.Thread(target=self._write, args=(os.fdopen(fd, 'w'),),
+                         daemon=True).start()
+
+    def _write(self, f):
+        """Write the text, in the worker thread."""
+        error = None
+        try:
+            with f:
+                f.write(self._text)
+        except OSError as e:
+            error = e
+        self._text = None
+        GLib.idle_add(self.__written_cb, error)
+
+    def __written_cb(self, error):
+        if error is not None:
+            os.unlink(self._path)
+            self.__error_cb(error)
+            return False
+
+        journal_entry = datastore.create()
+        journal_entry.metadata['title'] = self._title
+        journal_entry.metadata['title_set_by_user'] = '1'
+        journal_entry.metadata['mime_type'] = 'text/plain'
+        journal_entry.metadata['icon-color'] = profile.get_color().to_string()
+        journal_entry.file_path = self._path
+        datastore.write(journal_entry, transfer_ownership=True,
+                        reply_handler=self.__write_reply_cb,
+                        error_handler=self.__error_cb)
+        return False
+
+    def __write_reply_cb(self, *args):
+        self._done_cb(True)
+
+    def __error_cb(self, error):
+        log.error("Could not save the selection: %s", error)
+        self._done_cb(False)
+
+
+class CommandRecords(object):
+    """The rows, duration and exit code of each command run in a tab.
+
+    Records are kept in parallel arrays in the order the commands ran,
+    so their rows are sorted and prompts are found with bisect.
+    """
+
+    def __init__(self):
+        self.prompt_rows = array.array('q')
+        self.output_rows = array.array('q')
+        self.end_rows = array.array('q')
+        self.durations = array.array('d')
+        self.exit_codes = array.array('i')
+
+    def __len__(self):
+        return len(self.prompt_rows)
+
+    def add(self, prompt_row, output_row, end_row, duration, exit_code):
+        self.prompt_rows.append(prompt_row)
+        self.output_rows.append(output_row)
+        self.end_rows.append(end_row)
+        self.durations.append(duration)
+        self.exit_codes.append(exit_code)
+
+    def previous_prompt(self, row):
+        """Return the row of the last prompt above row, or None."""
+        i = bisect.bisect_left(self.prompt_rows, row)
+        return self.prompt_rows[i - 1] if i else None
+
+    def next_prompt(self, row):
+        """Return the row of the first prompt below row, or None."""
+        i = bisect.bisect_right(self.prompt_rows, row)
+        return self.prompt_rows[i] if i < len(self.prompt_rows) else None
+
+    def to_list(self, first_row):
+        """Return the records ending at or after first_row, as lists.
+
+        Rows are made relative to first_row.
+        """
+        start = bisect.bisect_left(self.end_rows, first_row)
+        return [[max(0, self.prompt_rows[i] - first_row),
+                 max(0, self.output_rows[i] - first_row),
+                 self.end_rows[i] - first_row,
+                 self.durations[i], self.exit_codes[i]]
+                for i in range(start, len(self.prompt_rows))]
+
+    def load(self, records, first_row):
+        """Add records saved by to_list, with rows counted from first_row.
+        """
+        for prompt_row, output_row, end_row, duration, exit_code \
+                in records:
+            self.add(prompt_row + first_row, output_row + first_row,
+                     end_row + first_row, duration, exit_code)
+
+
 class SugarTerminal(Vte.Terminal):
     """
     Just a vte.Terminal with some properties already set.
     """
 
+    __gsignals__ = {
+        'flood-changed': (GObject.SignalFlags.RUN_FIRST,
+                          None,
+                          ([bool])),
+        'command-finished': (GObject.SignalFlags.RUN_FIRST,
+                             None,
+                             ([float, int])),
+        'selection-saved': (GObject.SignalFlags.RUN_FIRST,
+                            None,
+                            ([bool])),
+    }
+
     def __init__(self, activity):
         super(SugarTerminal, self).__init__()
         self.activity = activity
         self.conf = None
         self.conf_file = None
+        self._highlight_patterns = []
+        self._highlight_tags = set()
         self.add_matches()
         self.handler_ids = []
         self.read_config()
@@ -142,13 +702,50 @@ class SugarTerminal(Vte.Terminal):
         # self.custom_fgcolor = None
         self.found_link = None
         self.uuid = uuid.uuid4()
+        self._content_invoker = None
+        self.handler_ids.append(self.connect('realize', self.__realize_cb))
+        self.child_exited = False
+        self._utmp_removed = False
+        self.session = None
+        self.handler_ids.append(self.connect('eof', self.__eof_cb))
 
         # Custom colors
         self.custom_bgcolor = None
         self.custom_fgcolor = None
         self.custom_palette = None
+        self.bracketed_paste = self._get_conf(
+            self.conf, 'bracketed_paste', True)
+        self.shell_integration = self._get_conf(
+            self.conf, 'shell_integration', True)
+        self._writer = ChildWriter(self)
+        self.broadcaster = None
         self.setup_drag_and_drop()
 
+        self.flooding = False
+        self._flood_start = 0
+        self._flood_row = 0
+        self._flood_quiet = 0
+        self._flood_timeout_id = None
+        self._scroll_on_output = False
+        self._contents_changed_id = self.connect(
+            'contents-changed', self.__contents_changed_cb)
+        self.handler_ids.append(self._contents_changed_id)
+
+        self.counters = PtyCounters()
+        self._counted_row = 0
+        self.handler_ids.append(self.connect('commit', self.__commit_cb))
+
+        self.commands = CommandRecords()
+        self._prompt_row = None
+        self._output_row = None
+        self._command_start = 0
+        # The command running, and the last one seen to return, by the
+        # numbers the shell gives them
+        self._command = None
+        self._last_command = 0
+        self.handler_ids.append(self.connect(
+            'current-file-uri-changed', self.__file_uri_changed_cb))
+
     def configure_terminal(self):
         blink = self._get_conf(self.conf, 'cursor_blink', False)
         self.set_cursor_blink_mode(blink)
@@ -193,14 +790,7 @@ class SugarTerminal(Vte.Terminal):
             return default
 
     def read_config(self):
-        self.conf = configparser.ConfigParser()
-        self.conf_file = os.path.join(env.get_profile_path(), 'terminalrc')
-
-        if os.path.isfile(self.conf_file):
-            with open(self.conf_file, 'r') as f:
-                self.conf.read_file(f)
-        else:
-            self.conf.add_section('terminal')
+        self.conf, self.conf_file = read_terminal_config()
 
     def setup_drag_and_drop(self):
         self.targets = Gtk.TargetList()
@@ -208,7 +798,196 @@ class SugarTerminal(Vte.Terminal):
         self.targets.add_text_targets(DropTargets.TEXT)
         self.drag_dest_set(Gtk.DestDefaults.ALL, [], Gdk.DragAction.COPY)
         self.drag_dest_set_target_list(self.targets)
-        self.connect('drag-data-received', self.on_drag_data_received)
+        self.handler_ids.append(self.connect(
+            'drag-data-received', self.on_drag_data_received))
+
+    def get_text_rows(self, start_row, end_row):
+        """Return the text of the rows from start_row to end_row.
+
+        Rows count from the start of the scrollback, like the cursor row.
+        """
+        end_col = self.get_column_count()
+        if (Vte.MAJOR_VERSION, Vte.MINOR_VERSION) >= (0, 76):
+            text, length_ = self.get_text_range_format(
+                Vte.Format.TEXT, start_row, 0, end_row, end_col)
+        else:
+            text, attributes_ = self.get_text_range(
+                start_row, 0, end_row, end_col, None, None)
+        return text or ''
+
+    def get_formatted_rows(self, start_row, end_row):
+        """Return the rows from start_row to end_row with their colours.
+
+        This is ('html', html) from VTE 0.76 on, and before that
+        ('attributes', text, attributes) with one attribute per character.
+        """
+        end_col = self.get_column_count()
+        if (Vte.MAJOR_VERSION, Vte.MINOR_VERSION) >= (0, 76):
+            html, length_ = self.get_text_range_format(
+                Vte.Format.HTML, start_row, 0, end_row, end_col)
+            return 'html', html or ''
+        text, attributes = self.get_text_range(
+            start_row, 0, end_row, end_col, None, None)
+        return 'attributes', text or '', list(attributes or [])
+
+    def get_screen_top(self):
+        """Return the row at the top of the screen when not scrolled back."""
+        upper = int(self.get_vadjustment().get_upper())
+        return max(0, upper - self.get_row_count())
+
+    def _get_cursor_row(self):
+        # The row counts from the start of the scrollback, so it keeps
+        # growing while output scrolls
+        return self.get_cursor_position()[1]
+
+    def _count_output(self, now):
+        """Add the rows received since the last call to the counters."""
+        row = self._get_cursor_row()
+        rows = max(0, row - self._counted_row)
+        self._counted_row = row
+        latency = self.counters.add_output(rows, now)
+        metrics.count('pty.rows_in', rows)
+        if latency is not None:
+            metrics.observe('pty.echo', latency)
+        metrics.maximum('pty.peak_rows_per_s', self.counters.peak_rows)
+
+    def discard_output(self):
+        """Do not count the rows fed so far as output of the child."""
+        self._counted_row = self._get_cursor_row()
+
+    def __commit_cb(self, terminal, text, size):
+        self.counters.add_input(size, time.monotonic())
+        metrics.count('pty.bytes_out', size)
+
+    def __contents_changed_cb(self, terminal):
+        now = time.monotonic()
+        self._count_output(now)
+        if now - self._flood_start > FLOOD_WINDOW:
+            self._flood_start = now
+            self._flood_row = self._get_cursor_row()
+        elif self._get_cursor_row() - self._flood_row >= FLOOD_ROWS:
+            self._set_flooding(True)
+
+    def __flood_timeout_cb(self):
+        # contents-changed is blocked, so count the output here
+        self._count_output(time.monotonic())
+        row = self._get_cursor_row()
+        if row - self._flood_row >= FLOOD_ROWS:
+            self._flood_quiet = 0
+        else:
+            self._flood_quiet += FLOOD_WINDOW
+        self._flood_row = row
+        if self._flood_quiet < FLOOD_SETTLE:
+            return True
+        self._flood_timeout_id = None
+        self._set_flooding(False)
+        return False
+
+    def _set_flooding(self, flooding):
+        """Suspend link matching and scrolling on output during a flood.
+
+        While flooding, the rate is checked by a timer instead of on
+        every contents-changed signal.
+        """
+        if flooding == self.flooding:
+            return
+        self.flooding = flooding
+        self.counters.set_flooding(flooding, time.monotonic())
+        if flooding:
+            metrics.count('pty.floods')
+            log.debug("Terminal %s is flooding", self.uuid)
+            self.handler_block(self._contents_changed_id)
+            self.match_remove_all()
+            self._scroll_on_output = self.get_scroll_on_output()
+            self.set_scroll_on_output(False)
+            self._flood_quiet = 0
+            self._flood_row = self._get_cursor_row()
+            self._flood_timeout_id = GLib.timeout_add(
+                int(FLOOD_WINDOW * 1000), self.__flood_timeout_cb)
+        else:
+            log.debug("Terminal %s settled", self.uuid)
+            self.add_matches()
+            self.set_scroll_on_output(self._scroll_on_output)
+            self._flood_start = 0
+            self.handler_unblock(self._contents_changed_id)
+        self.emit('flood-changed', flooding)
+
+    def __file_uri_changed_cb(self, terminal):
+        uri = self.get_current_file_uri()
+        if not uri or not uri.startswith(COMMAND_MARK_URI):
+            return
+        mark = uri[len(COMMAND_MARK_URI):].split('/')
+        try:
+            command = int(mark[1])
+        except (IndexError, ValueError):
+            return
+        column_, row = self.get_cursor_position()
+        if mark[0] == 'C':
+            if self._command is not None:
+                log.debug("No prompt after command %d", self._command)
+            self._command = command
+            self._output_row = row
+            self._command_start = time.monotonic()
+        elif mark[0] == 'A':
+            if command > self._last_command:
+                try:
+                    exit_code = int(mark[2])
+                except (IndexError, ValueError):
+                    exit_code = 0
+                self._end_command(command, row, exit_code)
+                self._last_command = command
+            self._prompt_row = row
+            self._command = None
+            self._output_row = None
+
+    def _end_command(self, command, prompt_row, exit_code):
+        """Record the command that returned before the prompt at prompt_row.
+        """
+        if command == self._command:
+            output_row = self._output_row
+            duration = time.monotonic() - self._command_start
+        elif self._prompt_row is not None:
+            # Its start was missed: the output follows its prompt, and
+            # how long it ran is unknown
+            output_row = self._prompt_row
+            duration = None
+        else:
+            return
+        start_row = self._prompt_row
+        if start_row is None:
+            start_row = output_row
+        # The output ends on the row above the prompt
+        end_row = max(output_row, prompt_row - 1)
+        self.commands.add(start_row, output_row, end_row,
+                          duration or 0.0, exit_code)
+        if duration is not None:
+            self.emit('command-finished', duration, exit_code)
+
+    def scroll_to_prompt(self, forward):
+        """Scroll the previous or next prompt to the top of the screen."""
+        adjustment = self.get_vadjustment()
+        top = int(adjustment.get_value())
+        if forward:
+            row = self.commands.next_prompt(top)
+            if row is None and self._prompt_row is not None and \
+                    self._prompt_row > top:
+                row = self._prompt_row
+        else:
+            row = self.commands.previous_prompt(top)
+        if row is not None:
+            adjustment.set_value(max(adjustment.get_lower(), row))
+        return row is not None
+
+    def attach_session(self, session):
+        """Use the PTY of a shell owned by the session daemon."""
+        self.session = session
+        self.set_pty(Vte.Pty.new_foreign_sync(session.fd, None))
+
+    def __eof_cb(self, terminal):
+        # VTE does not watch shells it did not spawn, so report the exit
+        # of a session shell when its PTY closes
+        if self.session is not None and not self.child_exited:
+            self.emit('child-exited', 0)
 
     def get_uuid(self):
         return self.uuid
@@ -222,34 +1001,130 @@ class SugarTerminal(Vte.Terminal):
         self._pid = pid
 
     def feed_child(self, resolved_cmdline):
+        self.feed_child_bytes(resolved_cmdline.encode('utf-8'))
+
+    def feed_child_bytes(self, data):
         if (Vte.MAJOR_VERSION, Vte.MINOR_VERSION) >= (0, 42):
-            encoded = resolved_cmdline.encode("utf-8")
             try:
-                super().feed_child_binary(encoded)
+                super().feed_child_binary(data)
             except TypeError:
                 # The doc does not say clearly at which version the
                 # feed_child* function lost the "len" parameter :(
-                super().feed_child(resolved_cmdline, len(resolved_cmdline))
+                super().feed_child(data.decode('utf-8'), len(data))
         else:
-            super().feed_child(resolved_cmdline, len(resolved_cmdline))
+            super().feed_child(data.decode('utf-8'), len(data))
+
+    def get_pty_fd(self):
+        pty = self.get_pty()
+        if pty is None:
+            return None
+        return pty.get_fd()
+
+    @property
+    def writing_input(self):
+        return self._writer.writing
+
+    def begin_paste(self):
+        """Open a bracketed paste, returning True if the child wants one.
+
+        VTE does not say whether the child turned bracketed paste mode
+        on, but brackets what it pastes if so and reports it with
+        commit. With bracketed_paste, VTE 0.68 and later are therefore
+        asked to paste nothing, which costs the child an empty bracket
+        pair. Older versions do not bracket, so nothing is sent.
+        """
+        if not self.bracketed_paste or \
+                (Vte.MAJOR_VERSION, Vte.MINOR_VERSION) < (0, 68):
+            return False
+        sent = []
+        handler_id = self.connect(
+            'commit', lambda terminal, text, size: sent.append(text))
+        try:
+            Vte.Terminal.paste_text(self, '')
+        finally:
+            self.disconnect(handler_id)
+        if not ''.join(sent).startswith(
+                BRACKETED_PASTE_START.decode('ascii')):
+            return False
+        self.feed_child_bytes(BRACKETED_PASTE_START)
+        return True
+
+    def end_paste(self):
+        self.feed_child_bytes(BRACKETED_PASTE_END)
+
+    def paste_text(self, text):
+        """Send pasted text to the child through the chunked writer."""
+        if not text:
+            return
+        # Like VTE, send line breaks as carriage returns
+        text = text.replace('\r\n', '\r').replace('\n', '\r')
+        # Never let the pasted text open or close a bracket
+        for marker in (BRACKETED_PASTE_START, BRACKETED_PASTE_END):
+            text = text.replace(marker.decode('ascii'), '')
+        data = text.encode('utf-8')
+        self._writer.write(data, paste=True)
+        if self.broadcaster is not None:
+            self.broadcaster.paste(data, self)
+
+    def write_input(self, data, paste=False):
+        """Queue bytes for the child, behind any pending paste."""
+        self._writer.write(data, paste)
+
+    def cancel_paste(self):
+        return self._writer.cancel()
 
     def execute_command(self, command):
-        if command[-1] != '\n':
+        if not command.endswith('\n'):
             command += "\n"
-        self.feed_child(command)
+        self.write_input(command.encode('utf-8'))
 
     def copy_clipboard(self, widget=None, content=None):
-        if self.get_has_selection() and (content is None):
-            super(SugarTerminal, self).copy_clipboard()
-        elif content:
+        """Copy content, or else the selection, to the clipboard.
+
+        Text longer than CLIPBOARD_MAX_SIZE is saved to the Journal
+        instead, and 'selection-saved' is emitted once that is done.
+        """
+        if content:
+            if len(content) > CLIPBOARD_MAX_SIZE:
+                self._save_selection(content)
+                return
             self.clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
             self.clipboard.set_text(content, -1)
             self.clipboard.store()
         elif self.get_has_selection():
-            super(SugarTerminal, self).copy_clipboard()
+            text = self._get_selection()
+            if text is None:
+                super(SugarTerminal, self).copy_clipboard()
+            elif len(text) > CLIPBOARD_MAX_SIZE:
+                self._save_selection(text)
+            else:
+                # The selection is read once, not again by VTE
+                self.clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
+                self.clipboard.set_text(text, -1)
+
+    def _get_selection(self):
+        """Return the selected text, or None if VTE cannot tell."""
+        if (Vte.MAJOR_VERSION, Vte.MINOR_VERSION) < (0, 70):
+            # The selection cannot be read before VTE 0.70
+            return None
+        return self.get_text_selected(Vte.Format.TEXT)
+
+    def _save_selection(self, text):
+        title = _('%(activity)s selection: %(tab)s') % {
+            'activity': self.activity.metadata['title'],
+            'tab': self.get_window_title() or ''}
+        SaveSelectionJob(self.activity, text, title,
+                         self.__selection_saved_cb).start()
+
+    def __selection_saved_cb(self, saved):
+        self.emit('selection-saved', saved)
 
     def paste_clipboard(self, widget=None):
-        super(SugarTerminal, self).paste_clipboard()
+        clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
+        clipboard.request_text(self.__clipboard_text_cb)
+
+    def __clipboard_text_cb(self, clipboard, text):
+        self.paste_text(text)
 
     def add_matches(self):
         """Adds all regular expressions declared in
@@ -269,6 +1144,12 @@ class SugarTerminal(Vte.Terminal):
                         expr, len(expr), VTE_REGEX_FLAGS), 0
                 )
                 self.match_set_cursor_type(tag, Gdk.CursorType.HAND2)
+            self._highlight_tags = set()
+            for expr in self._highlight_patterns:
+                self._highlight_tags.add(self.match_add_regex(
+                    Vte.Regex.new_for_match(
+                        expr, len(expr.encode('utf-8')), VTE_REGEX_FLAGS),
+                    0))
 
         except (GLib.Error, AttributeError) \
                 as e:  # pylint: disable=catching-non-exception
@@ -290,6 +1171,13 @@ class SugarTerminal(Vte.Terminal):
                     "in VTE. Exception: '%s'", str(e)
                 )
 
+    def set_highlight_patterns(self, patterns):
+        """Have VTE underline text matching these PCRE patterns."""
+        self._highlight_patterns = list(patterns)
+        if not self.flooding:
+            self.match_remove_all()
+            self.add_matches()
+
     def get_current_directory(self):
         directory = os.path.expanduser('~')
         if self.pid is not None:
@@ -392,6 +1280,9 @@ class SugarTerminal(Vte.Terminal):
             )
 
         self.found_link = None
+        if matched_string and matched_string[1] in self._highlight_tags:
+            # Highlighted by a trigger, not a link
+            matched_string = None
 
         if event.button == 1 and \
                 (event.get_state() & Gdk.ModifierType.CONTROL_MASK):
@@ -408,24 +1299,33 @@ class SugarTerminal(Vte.Terminal):
             self.matched_value = matched_string[0]
 
         if event.type == Gdk.EventType.BUTTON_PRESS and event.button == 3:
-            ContentInvoker(self, self.found_link)
+            self.get_content_invoker().popup_for(self.found_link)
+
+    def get_content_invoker(self):
+        if self._content_invoker is None:
+            self._content_invoker = ContentInvoker(self)
+        return self._content_invoker
+
+    def __realize_cb(self, widget):
+        # The invoker owns the long-press gesture, which needs a window
+        self.get_content_invoker()
 
     def on_child_exited(self, target, status, *user_data):
-        if libutempter is not None:
-            if self.get_pty() is not None:
-                libutempter.utempter_remove_record(self.get_pty().get_fd())
+        self.child_exited = True
+        self._writer.cancel()
+        self._remove_utmp_record()
 
     def on_drag_data_received(
             self, widget, drag_context, x, y, data, info, time):
         if info == DropTargets.URIS:
-            uris = data.get_uris()
-            for uri in uris:
+            paths = []
+            for uri in data.get_uris():
                 path = Path(unquote(urlparse(uri).path))
-                self.feed_child(shlex.quote(str(path.absolute())) + ' ')
+                paths.append(shlex.quote(str(path.absolute())) + ' ')
+            self._writer.write(''.join(paths).encode('utf-8'))
         elif info == DropTargets.TEXT:
-            text = data.get_text()
-            if text:
-                self.feed_child(text)
+            self.paste_text(data.get_text())
+        drag_context.finish(True, False, time)
 
     def _on_ctrl_click_matcher(self, matched_string):
         value, tag = matched_string
@@ -479,37 +1379,66 @@ class SugarTerminal(Vte.Terminal):
         self.set_font(font_desc)
 
     def kill(self):
-        pid = self.pid
-        threading.Thread(target=self.delete_shell, args=(pid, )).start()
-        # start_new_thread(self.delete_shell, (pid,))
-
-    def delete_shell(self, pid):
-        """Kill the shell with SIGHUP
-
-        NOTE: Leave it alone, DO NOT USE os.waitpid
-
-        > sys:1: Warning: GChildWatchSource: Exit status of a child
-                 process was requested but ECHILD was received by
-                 waitpid(). See the documentation of
-                 g_child_watch_source_new() for possible causes.
-
-        g_child_watch_source_new() documentation:
-            https://developer.gnome.org/glib/stable/glib-The-Main-Event-Loop.html#g-child-watch-source-new
-
-        On POSIX platforms, the following restrictions apply to this
-        API due to limitations in POSIX process interfaces:
-            ...
-            * the application must not wait for pid to exit by any
-              other mechanism, including waitpid(pid, ...) or a second
-              child-watch source for the same pid
-            ...
-        For this reason, we should not call os.waitpid(pid, ...),
-        leave it to OS
+        _reaper.terminate(self)
+
+    def signal_child(self, signum):
+        """Send signum to every process group in the shell's session.
+
+        The shell leads its own session, so this reaches background jobs
+        too, even those of shells like dash that do not pass on SIGHUP.
         """
+        pgrps = set()
         try:
-            os.kill(pid, signal.SIGHUP)
+            pgrps.add(os.getpgid(self.pid))
+            sid = os.getsid(self.pid)
+            # Not if the shell shares the session of the activity
+            if sid != os.getsid(0):
+                pgrps.update(_get_session_pgrps(sid))
         except OSError:
             pass
+        fd = self.get_pty_fd()
+        if fd is not None:
+            try:
+                pgrps.add(os.tcgetpgrp(fd))
+            except OSError:
+                pass
+        # Never signal the activity itself
+        pgrps.discard(os.getpgrp())
+        if not pgrps:
+            pgrps.add(None)
+        for pgrp in pgrps:
+            try:
+                if pgrp is None:
+                    os.kill(self.pid, signum)
+                else:
+                    os.killpg(pgrp, signum)
+            except OSError:
+                pass
+
+    def release(self):
+        """Drop the handlers, context menu and utmp record of a closed tab.
+        """
+        self._writer.cancel()
+        if self.broadcaster is not None:
+            self.broadcaster.remove(self)
+        self._remove_utmp_record()
+        if self._flood_timeout_id is not None:
+            GLib.source_remove(self._flood_timeout_id)
+            self._flood_timeout_id = None
+        if self.flooding:
+            self.handler_unblock(self._contents_changed_id)
+        for handler_id in self.handler_ids:
+            self.disconnect(handler_id)
+        self.handler_ids = []
+        if self._content_invoker is not None:
+            self._content_invoker.release()
+            self._content_invoker = None
+
+    def _remove_utmp_record(self):
+        if libutempter is not None and not self._utmp_removed:
+            if self.get_pty() is not None:
+                libutempter.utempter_remove_record(self.get_pty().get_fd())
+                self._utmp_removed = True
 
     def set_color_bold(self, font_color, *args, **kwargs):
         real_fgcolor = \
@@ -559,20 +1488,4 @@ class SugarTerminal(Vte.Terminal):
         if not self.found_link:
             log.warning("No link under cursor")
             return
-        path = os.path.join(self.activity.get_activity_root(),
-                            'instance', '%i' % time.time())
-        fd = open(path, "w")
-        fd.write(url)
-        fd.close()
-        journal_entry = datastore.create()
-        journal_entry.metadata['title'] = 'Browse Activity'
-        journal_entry.metadata['title_set_by_user'] = '1'
-        journal_entry.metadata['keep'] = '0'
-        journal_entry.metadata['mime_type'] = 'text/uri-list'
-        journal_entry.metadata['icon-color'] = profile.get_color().to_string()
-        journal_entry.metadata['description'] = \
-            "Opening {} from the Terminal".format(url)
-        journal_entry.file_path = path
-        datastore.write(journal_entry)
-        self._object_id = journal_entry.object_id
-        launch_bundle(object_id=self._object_id)
+        OpenLinkJob(self.activity, self.found_link).start()
@@ -19,6 +19,8 @@
 import os
 import sys
 import json
+import time
+import atexit
 import logging
 from gettext import gettext as _
 
@@ -41,6 +43,8 @@ from gi.repository import Vte
 from gi.repository import Pango
 
 from sugar3.graphics.toolbutton import ToolButton
+from sugar3.graphics.toggletoolbutton import ToggleToolButton
+from sugar3.graphics.palettemenu import PaletteMenuItem
 from sugar3.graphics.toolbarbox import ToolbarBox
 from sugar3.graphics.toolbarbox import ToolbarButton
 
@@ -49,17 +53,44 @@ from sugar3.activity.widgets import ActivityToolbarButton
 from sugar3.activity.widgets import StopButton
 from sugar3.activity import activity
 from sugar3.graphics.colorbutton import ColorToolButton, get_svg_color_string
+from sugar3.graphics.alert import NotifyAlert
 
 from widgets import BrowserNotebook
+from widgets import TabIndicators
 from widgets import TabLabel
 
 from helpbutton import HelpButton
+from metrics import metrics
+from metrics import metrics_enabled
+from preview import PREVIEW_LINES
+from preview import get_preview_lines
+from preview import render_preview
+from profiling import profiler
+from profiling import profiling_enabled
+from control import ControlServer
+from export import ScrollbackExport
+from limits import ShellLimits
+from monitor import ResourceMonitor
+from recording import Player
+from recording import Recorder
+from sessions import DAEMON_POLL_INTERVAL
+from sessions import DAEMON_START_TIMEOUT
+from sessions import SessionClient
+from sugarterm import InputBroadcaster
 from sugarterm import SugarTerminal
+from sugarterm import read_terminal_config
+from triggers import TriggerEngine
+from triggers import read_triggers
+from watchdog import MainLoopWatchdog
+from watchdog import watchdog_threshold
 
 MASKED_ENVIRONMENT = [
     'DBUS_SESSION_BUS_ADDRESS',
     'PPID']
 
+# Seconds a trigger alert is shown, counting the matches that follow
+TRIGGER_ALERT_TIMEOUT = 10
+
 log = logging.getLogger('Terminal')
 log.setLevel(logging.DEBUG)
 logging.basicConfig()
@@ -85,6 +116,14 @@ except:
 class TerminalActivity(activity.Activity):
 
     def __init__(self, handle):
+        self._start_time = time.time()
+        conf, conf_file_ = read_terminal_config()
+        if profiling_enabled(conf):
+            profiler.enable(os.path.join(activity.get_activity_root(),
+                                         'instance'))
+            profiler.start()
+            profiler.begin('startup')
+            atexit.register(self.dump_profiles)
         activity.Activity.__init__(self, handle)
 
         # HACK to avoid Escape key disable fullscreen mode on Terminal Activity
@@ -103,32 +142,199 @@ class TerminalActivity(activity.Activity):
         self._theme_state = "light"
 
         self._font_size = FONT_SIZE
+        self._broadcaster = InputBroadcaster()
+        self._broadcasting = False
+        self._secondary_toolbars_built = False
+        self._preview = None
+        self._preview_key = None
+
+        # PTY counters of every tab opened, kept for the metrics
+        self._pty_counters = {}
+        if metrics_enabled(conf):
+            metrics.enable()
+            atexit.register(self.dump_metrics)
+
+        threshold = watchdog_threshold(conf)
+        if threshold is not None:
+            self._watchdog = MainLoopWatchdog(os.path.join(
+                self.get_activity_root(), 'instance', 'stalls.log'),
+                threshold)
+            self._watchdog.start()
+
+        self._limits = ShellLimits.from_config(conf)
+        atexit.register(self._limits.release)
+
+        self._triggers = TriggerEngine(read_triggers(conf),
+                                       self.__trigger_cb)
+        # [alert, matches] shown for each terminal and trigger
+        self._trigger_alerts = {}
+
+        self._sessions = None
+        # read_file replaces the first tab of a resumed activity, so its
+        # shell is not worth a session of the daemon
+        self._restoring = handle is not None and bool(handle.object_id)
+        if conf.has_option('terminal', 'detachable_sessions') and \
+                conf.getboolean('terminal', 'detachable_sessions'):
+            self._sessions = SessionClient(os.path.join(
+                self.get_activity_root(), 'instance', 'sessions.sock'))
+            self._sessions.start()
+
         self.build_notebook()
         self.build_toolbar()
 
+        self._control = None
+        if conf.has_option('terminal', 'control_socket') and \
+                conf.getboolean('terminal', 'control_socket'):
+            self._control = ControlServer(self, os.path.join(
+                self.get_activity_root(), 'instance', 'control.sock'))
+            self._control.start()
+
+        self._monitor = ResourceMonitor(self._notebook)
+        self.connect('notify::active', self.__active_cb)
+        self.connect('destroy', self.__destroy_cb)
+        self._monitor.start()
+
+    def __destroy_cb(self, widget):
+        if self._control is not None:
+            self._control.close()
+        self._monitor.close()
+
+    def __active_cb(self, widget, pspec):
+        # Do not sample processes while the activity is hidden
+        if self.props.active:
+            self._monitor.start()
+        else:
+            self._monitor.stop()
+
     def build_notebook(self):
         self._notebook = BrowserNotebook()
         self._notebook.connect("tab-added", self.__open_tab_cb)
+        self._notebook.connect("switch-page", self.__switch_page_cb)
+        self._indicators = TabIndicators(self._notebook)
         self._notebook.set_property("tab-pos", Gtk.PositionType.TOP)
         self._notebook.set_scrollable(True)
         self._notebook.show()
         self.set_canvas(self._notebook)
         self._create_tab(None)
 
+        box = self._notebook.get_nth_page(0)
+        box.handler_ids.append(
+            box.vt.connect('map', self.__first_vt_map_cb))
+        box.handler_ids.append(
+            box.vt.connect('contents-changed', self.__first_prompt_cb))
+
+    def __switch_page_cb(self, notebook, box, index):
+        box.label.set_marked(False)
+
+    def __trigger_cb(self, vt, trigger, text):
+        for box in self.get_tabs():
+            if box.vt == vt:
+                break
+        else:
+            return
+        if trigger.action == 'mark':
+            if box != self._notebook.get_nth_page(
+                    self._notebook.get_current_page()):
+                box.label.set_marked(True)
+            return
+
+        # Matches shown in an alert still on screen are counted in it
+        # rather than stacking more alerts
+        key = (vt, trigger.name)
+        shown = self._trigger_alerts.get(key)
+        if shown is not None:
+            shown[1] += 1
+            shown[0].props.msg = _(
+                '%(trigger)s: %(text)s (%(count)d matches)') % {
+                'trigger': trigger.name, 'text': text.strip(),
+                'count': shown[1]}
+            return
+
+        alert = NotifyAlert(TRIGGER_ALERT_TIMEOUT)
+        alert.props.title = vt.get_window_title() or _('Terminal')
+        alert.props.msg = _('%(trigger)s: %(text)s') % {
+            'trigger': trigger.name, 'text': text.strip()}
+        alert.connect('response', self.__trigger_alert_response_cb, key)
+        self._trigger_alerts[key] = [alert, 1]
+        self.add_alert(alert)
+
+    def __trigger_alert_response_cb(self, alert, response_id, key):
+        del self._trigger_alerts[key]
+        self.remove_alert(alert)
+
+    def __alert_response_cb(self, alert, response_id):
+        self.remove_alert(alert)
+
+    def __first_vt_map_cb(self, vt):
+        vt.disconnect_by_func(self.__first_vt_map_cb)
+        log.debug('first terminal mapped after %.3fs',
+                  time.time() - self._start_time)
+        # Everything else in the toolbar waits until the shell is visible
+        GLib.idle_add(self.__build_secondary_toolbars_cb,
+                      priority=GLib.PRIORITY_LOW)
+
+    def __first_prompt_cb(self, vt):
+        vt.disconnect_by_func(self.__first_prompt_cb)
+        log.debug('first prompt after %.3fs', time.time() - self._start_time)
+        metrics.observe('startup.first_prompt', time.time() - self._start_time)
+        profiler.end('startup')
+
+    def dump_metrics(self):
+        now = time.monotonic()
+        terminals = {tab_id: counters.to_dict(now)
+                     for tab_id, counters in self._pty_counters.items()}
+        path = metrics.dump(os.path.join(self.get_activity_root(), 'instance'),
+                            {'terminals': terminals})
+        if path is not None:
+            log.debug('metrics written to %s', path)
+
+    def dump_profiles(self):
+        for path in profiler.stop():
+            log.debug('profile written to %s', path)
+
+    def __build_secondary_toolbars_cb(self):
+        self.build_secondary_toolbars()
+        return False
+
     def build_toolbar(self):
-        toolbar_box = ToolbarBox()
+        self._toolbar_box = ToolbarBox()
 
         activity_button = ActivityToolbarButton(self)
-        toolbar_box.toolbar.insert(activity_button, 0)
+        self._toolbar_box.toolbar.insert(activity_button, 0)
         activity_button.show()
 
+        separator = Gtk.SeparatorToolItem()
+        separator.props.draw = False
+        separator.set_expand(True)
+        self._toolbar_box.toolbar.insert(separator, -1)
+        separator.show()
+
+        stop_button = StopButton(self)
+        stop_button.props.accelerator = '<Ctrl><Shift>Q'
+        self._toolbar_box.toolbar.insert(stop_button, -1)
+        stop_button.show()
+
+        self.set_toolbar_box(self._toolbar_box)
+        self._toolbar_box.show()
+
+    def build_secondary_toolbars(self):
+        """Add the edit, view and help buttons to the toolbar.
+
+        This is called on idle once the first terminal is mapped, or
+        earlier when something needs these buttons or their accelerators.
+        """
+        if self._secondary_toolbars_built:
+            return
+        self._secondary_toolbars_built = True
+        toolbar = self._toolbar_box.toolbar
+
         edit_toolbar = self._create_edit_toolbar()
         edit_toolbar_button = ToolbarButton(
             page=edit_toolbar,
             icon_name='toolbar-edit'
         )
         edit_toolbar.show()
-        toolbar_box.toolbar.insert(edit_toolbar_button, -1)
+        toolbar.insert(edit_toolbar_button, 1)
         edit_toolbar_button.show()
 
         view_toolbar = self._create_view_toolbar()
@@ -136,7 +342,7 @@ class TerminalActivity(activity.Activity):
             page=view_toolbar,
             icon_name='toolbar-view')
         view_toolbar.show()
-        toolbar_box.toolbar.insert(view_toolbar_button, -1)
+        toolbar.insert(view_toolbar_button, 2)
         view_toolbar_button.show()
 
         self._delete_tab_toolbar = None
@@ -144,22 +350,10 @@ class TerminalActivity(activity.Activity):
         self._next_tab_toolbar = None
 
         helpbutton = self._create_help_button()
-        toolbar_box.toolbar.insert(helpbutton, -1)
+        toolbar.insert(helpbutton, 3)
         helpbutton.show_all()
 
-        separator = Gtk.SeparatorToolItem()
-        separator.props.draw = False
-        separator.set_expand(True)
-        toolbar_box.toolbar.insert(separator, -1)
-        separator.show()
-
-        stop_button = StopButton(self)
-        stop_button.props.accelerator = '<Ctrl><Shift>Q'
-        toolbar_box.toolbar.insert(stop_button, -1)
-        stop_button.show()
-
-        self.set_toolbar_box(toolbar_box)
-        toolbar_box.show()
+        log.debug('toolbars built after %.3fs', time.time() - self._start_time)
 
     def fullscreen(self):
         self._notebook.set_show_tabs(False)
@@ -184,8 +378,106 @@ class TerminalActivity(activity.Activity):
         clear.connect('clicked', self.__clear_cb)
         edit_toolbar.insert(clear, -1)
         clear.show()
+
+        record = ToolButton('media-record')
+        record.set_tooltip(_('Record tab'))
+        record.connect('clicked', self.__record_cb)
+        edit_toolbar.insert(record, -1)
+        record.show()
+
+        play = ToolButton('media-playback-start')
+        play.set_tooltip(_('Play last recording'))
+        play.connect('clicked', self.__play_cb)
+        edit_toolbar.insert(play, -1)
+        play.show()
+
+        export = ToolButton('document-save')
+        export.set_tooltip(_('Export tab output'))
+        menu_box = Gtk.VBox()
+        for label, ansi in ((_('As plain text'), False),
+                            (_('With colors'), True)):
+            menu_item = PaletteMenuItem(label)
+            menu_item.connect('activate', self.__export_cb, ansi)
+            menu_box.pack_start(menu_item, False, False, 0)
+            menu_item.show()
+        export.get_palette().set_content(menu_box)
+        menu_box.show()
+        export.connect('clicked', self.__export_cb, False)
+        edit_toolbar.insert(export, -1)
+        export.show()
+
+        broadcast = ToggleToolButton('zoom-groups')
+        broadcast.set_tooltip(_('Send input to several tabs'))
+        broadcast.connect('toggled', self.__broadcast_cb)
+        edit_toolbar.insert(broadcast, -1)
+        broadcast.show()
         return edit_toolbar
 
+    def _get_recordings_dir(self):
+        path = os.path.join(self.get_activity_root(), 'data', 'recordings')
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return path
+
+    def __record_cb(self, button):
+        box = self._notebook.get_nth_page(self._notebook.get_current_page())
+        if box.recorder is not None:
+            box.recorder.stop()
+        elif box.pid is not None:
+            def finished_cb():
+                # Also when the shell exits while recording
+                box.recorder = None
+                box.label.set_recording(False)
+
+            path = os.path.join(
+                self._get_recordings_dir(),
+                time.strftime('terminal-%Y%m%d-%H%M%S.cast'))
+            box.recorder = Recorder(box.vt, path, finished_cb)
+            box.recorder.start()
+            box.label.set_recording(True)
+
+    def __play_cb(self, button):
+        directory = self._get_recordings_dir()
+        recordings = sorted(name for name in os.listdir(directory)
+                            if name.endswith('.cast'))
+        if recordings:
+            index = self._create_tab(
+                None, os.path.join(directory, recordings[-1]))
+            self._notebook.page = index
+
+    def __export_cb(self, widget, ansi):
+        box = self._notebook.get_nth_page(self._notebook.get_current_page())
+        if box.export is not None:
+            return
+
+        def done_cb(saved):
+            box.export = None
+            box.label.set_progress(None)
+
+        title = _('%(activity)s output: %(tab)s') % {
+            'activity': self.metadata['title'],
+            'tab': box.vt.get_window_title() or ''}
+        box.export = ScrollbackExport(self, box.vt, title, ansi,
+                                      box.label.set_progress, done_cb)
+        box.label.set_progress(0)
+        box.export.start()
+
+    def __broadcast_cb(self, button):
+        self._broadcasting = button.get_active()
+        for i in range(self._notebook.get_n_pages()):
+            box = self._notebook.get_nth_page(i)
+            # Every tab with a shell is included until unticked
+            active = self._broadcasting and box.pid is not None
+            box.label.set_broadcast(self._broadcasting, active)
+        if not self._broadcasting:
+            self._broadcaster.clear()
+
+    def __tab_broadcast_toggled_cb(self, label, box, active):
+        if active and box.pid is not None:
+            self._broadcaster.add(box.vt)
+        else:
+            self._broadcaster.remove(box.vt)
+
     def __copy_cb(self, button):
         vt = self._notebook.get_nth_page(self._notebook.get_current_page()).vt
         if vt.get_has_selection():
@@ -229,6 +521,7 @@ class TerminalActivity(activity.Activity):
         self._update_theme()
 
     def _update_theme(self):
+        start = time.perf_counter()
         if self._theme_state == "light":
             self._theme_toggler.set_icon_name('dark-theme')
             self._theme_toggler.set_tooltip('Switch to Dark Theme')
@@ -244,6 +537,7 @@ class TerminalActivity(activity.Activity):
         for i in range(self._notebook.get_n_pages()):
             vt = self._notebook.get_nth_page(i).vt
             vt.set_term_colors(self._theme_colors['custom'])
+        metrics.observe('update_theme', time.perf_counter() - start)
 
     def _create_view_toolbar(self):  # Color changer and Zoom toolbar
         view_toolbar = Gtk.Toolbar()
@@ -375,14 +669,76 @@ class TerminalActivity(activity.Activity):
         vt = self._notebook.get_nth_page(self._notebook.get_current_page()).vt
         vt.grab_focus()
 
+    def get_tabs(self):
+        return [self._notebook.get_nth_page(i)
+                for i in range(self._notebook.get_n_pages())]
+
+    def get_tab_id(self, box):
+        return str(box.vt.get_uuid())
+
+    def get_tab(self, tab_id):
+        """Return the page of the tab with the given id, or None."""
+        for box in self.get_tabs():
+            if self.get_tab_id(box) == tab_id:
+                return box
+        return None
+
+    def get_pty_stats(self):
+        """Return the PTY counters of each tab, by tab id."""
+        now = time.monotonic()
+        return {self.get_tab_id(box): box.vt.counters.to_dict(now)
+                for box in self.get_tabs()}
+
+    def open_tabs(self, count):
+        """Open count tabs, switching only to the last one."""
+        boxes = []
+        for i in range(count):
+            index = self._create_tab(None, select=False)
+            boxes.append(self._notebook.get_nth_page(index))
+        if boxes:
+            self._notebook.props.page = self._notebook.page_num(boxes[-1])
+            boxes[-1].vt.grab_focus()
+        return boxes
+
+    def close_tabs(self, boxes):
+        for box in boxes:
+            index = self._notebook.page_num(box)
+            if index != -1:
+                self._close_tab(index)
+
     def _close_tab(self, index):
-        self._notebook.remove_page(index)
+        self._destroy_tab(index)
         if self._notebook.get_n_pages() == 0:
             self.close()
         if self._notebook.get_n_pages() == 1:
             self._notebook.get_tab_label(
                 self._notebook.get_nth_page(0)).hide_close_button()
 
+    def _destroy_tab(self, index):
+        """Remove a tab and hand its terminal over to be terminated."""
+        box = self._notebook.get_nth_page(index)
+        vt = box.vt
+        self._broadcaster.remove(vt)
+        self._triggers.unwatch(vt)
+        self._indicators.unwatch(box)
+        if box.export is not None:
+            box.export.cancel()
+        if box.recorder is not None:
+            box.recorder.stop()
+        if vt.flooding:
+            self._notebook.suspend_updates(False)
+        for handler_id in box.handler_ids:
+            if vt.handler_is_connected(handler_id):
+                vt.disconnect(handler_id)
+        if vt.session is not None:
+            # Closing the tab ends the session, unlike closing the activity
+            vt.session.close()
+        self._notebook.remove_page(index)
+        # The terminal outlives its box until the shell has exited
+        box.remove(vt)
+        box.destroy()
+        vt.kill()
+
     def __tab_child_exited_cb(self, vt, status=None):
         for i in range(self._notebook.get_n_pages()):
             if self._notebook.get_nth_page(i).vt == vt:
@@ -390,29 +746,55 @@ class TerminalActivity(activity.Activity):
                 return
 
     def __tab_title_changed_cb(self, vt):
+        if vt.flooding:
+            # The title is updated once the output settles
+            return
         for i in range(self._notebook.get_n_pages()):
             if self._notebook.get_nth_page(i).vt == vt:
                 label = self._notebook.get_nth_page(i).label
                 label.set_text(vt.get_window_title())
                 return
 
-    def __drag_data_received_cb(self, widget, context, x, y, selection,
-                                target, time):
-        widget.feed_child(selection.get_text(), -1)
-        context.finish(True, False, time)
-        return True
+    def __tab_flood_changed_cb(self, vt, flooding):
+        self._notebook.suspend_updates(flooding)
+        if not flooding:
+            self.__tab_title_changed_cb(vt)
 
-    def _create_tab(self, tab_state):
-        vt = SugarTerminal(self)
-        vt.connect("child-exited", self.__tab_child_exited_cb)
-        vt.connect("window-title-changed", self.__tab_title_changed_cb)
+    def __tab_command_finished_cb(self, vt, duration, exit_code):
+        for i in range(self._notebook.get_n_pages()):
+            if self._notebook.get_nth_page(i).vt == vt:
+                self._notebook.get_nth_page(i).label.set_last_command(
+                    duration, exit_code)
+                return
+
+    def __tab_selection_saved_cb(self, vt, saved):
+        alert = NotifyAlert(10)
+        if saved:
+            alert.props.title = _('Selection saved')
+            alert.props.msg = _('The selection was too large for the '
+                                'clipboard, so it was saved to the Journal.')
+        else:
+            alert.props.title = _('Selection not copied')
+            alert.props.msg = _('The selection was too large for the '
+                                'clipboard, and could not be saved.')
+        alert.connect('response', self.__alert_response_cb)
+        self.add_alert(alert)
 
-        vt.drag_dest_set(Gtk.DestDefaults.MOTION | Gtk.DestDefaults.DROP,
-                         [Gtk.TargetEntry.new('text/plain', 0, 0),
-                          Gtk.TargetEntry.new('STRING', 0, 1)],
-                         Gdk.DragAction.DEFAULT | Gdk.DragAction.COPY)
-        vt.drag_dest_add_text_targets()
-        vt.connect('drag_data_received', self.__drag_data_received_cb)
+    def _create_tab(self, tab_state, recording=None, select=True):
+        """Add a tab running a shell, or playing recording if given.
+
+        The new tab becomes the current one if select is True.
+        """
+        start = time.perf_counter()
+        profiler.begin('tab')
+        metrics.count('tabs_created')
+        vt = SugarTerminal(self)
+        handler_ids = [
+            vt.connect("child-exited", self.__tab_child_exited_cb),
+            vt.connect("window-title-changed", self.__tab_title_changed_cb),
+            vt.connect("flood-changed", self.__tab_flood_changed_cb),
+            vt.connect("command-finished", self.__tab_command_finished_cb),
+            vt.connect("selection-saved", self.__tab_selection_saved_cb)]
 
         vt.set_term_colors(self._theme_colors['custom'])
 
@@ -425,10 +807,17 @@ class TerminalActivity(activity.Activity):
         box.pack_start(scrollbar, False, True, 0)
 
         box.vt = vt
+        box.handler_ids = handler_ids
+        box.recorder = None
+        box.export = None
         box.show()
+        if metrics.enabled:
+            self._pty_counters[self.get_tab_id(box)] = vt.counters
 
         tablabel = TabLabel(box)
         tablabel.connect('tab-close', self.__close_tab_cb)
+        tablabel.connect('broadcast-toggled',
+                         self.__tab_broadcast_toggled_cb)
         tablabel.update_size(200)
         box.label = tablabel
 
@@ -449,6 +838,11 @@ class TerminalActivity(activity.Activity):
         # Launch the default shell in the HOME directory.
         os.chdir(os.environ["HOME"])
 
+        # Reattach to a shell that outlived the previous activity.
+        session = None
+        if tab_state and tab_state.get('session') and self._sessions:
+            session = self._sessions.attach(tab_state['session'])
+
         if tab_state:
             # Restore the environment.
             # This is currently not enabled.
@@ -478,12 +872,66 @@ class TerminalActivity(activity.Activity):
                 vt.set_font(font_desc)
 
             # Restore the scrollback buffer.
-            for l in tab_state['scrollback']:
-                vt.feed(l.encode('utf-8') + b'\r\n')
+            first_row = vt.get_cursor_position()[1]
+            with metrics.timer('scrollback_replay'):
+                for l in tab_state['scrollback']:
+                    vt.feed(l.encode('utf-8') + b'\r\n')
+            vt.discard_output()
+            vt.commands.load(tab_state.get('commands', []), first_row)
+
+        if recording is not None:
+            box.pid = None
+            tablabel.set_text(os.path.basename(recording))
+            Player(vt, recording).play()
+        elif session is not None:
+            # Output written while no activity was attached
+            vt.feed(session.backlog)
+            vt.attach_session(session)
+            box.pid = session.pid
+        elif self._sessions is not None and not self._restoring and \
+                not self._sessions.ready():
+            # The shell waits until the session daemon listens
+            box.pid = None
+            GLib.timeout_add(DAEMON_POLL_INTERVAL, self.__sessions_ready_cb,
+                             box, time.monotonic())
+        else:
+            box.pid = self._spawn_shell(vt)
+        vt.pid = box.pid
+        self._triggers.watch(vt)
+        self._indicators.watch(box)
+        if self._broadcasting:
+            tablabel.set_broadcast(True, box.pid is not None)
+
+        if select:
+            self._notebook.props.page = index
+            vt.grab_focus()
+
+        metrics.observe('create_tab', time.perf_counter() - start)
+        profiler.end('tab')
+        return index
+
+    def __sessions_ready_cb(self, box, since):
+        if self._notebook.page_num(box) == -1:
+            return False
+        if not self._sessions.ready() and \
+                time.monotonic() - since < DAEMON_START_TIMEOUT:
+            return True
+        # Without the daemon, _spawn_shell starts the shell in VTE
+        box.pid = box.vt.pid = self._spawn_shell(box.vt)
+        if self._broadcasting:
+            box.label.set_broadcast(True, box.pid is not None)
+        return False
 
+    def _spawn_shell(self, vt):
+        """Start the user's shell in vt, returning its pid."""
         argv = [os.environ.get('SHELL') or '/bin/bash']
+        if os.path.basename(argv[0]) == 'bash' and \
+                vt.shell_integration:
+            # Marks the prompts and commands for SugarTerminal
+            argv += ['--rcfile', os.path.join(
+                activity.get_bundle_path(), 'shell-integration.bash')]
         envv = ['SUGAR_TERMINAL_VERSION=%s' %
-                os.environ['SUGAR_BUNDLE_VERSION']]
+                os.environ.get('SUGAR_BUNDLE_VERSION', '')]
 
         saved = {}
         for name in ['SUGAR_BUNDLE_PATH', 'SUGAR_ACTIVITY_ROOT',
@@ -493,26 +941,42 @@ class TerminalActivity(activity.Activity):
                 saved[name] = os.environ[name]
                 del os.environ[name]
 
-        if hasattr(vt, 'fork_command_full'):
-            _, box.pid = vt.fork_command_full(
-                Vte.PtyFlags.DEFAULT, os.environ["HOME"],
-                argv, envv, GLib.SpawnFlags.DO_NOT_REAP_CHILD,
-                None, None)
-        else:
-            _, box.pid = vt.spawn_sync(
-                Vte.PtyFlags.DEFAULT, os.environ["HOME"],
-                argv, envv, GLib.SpawnFlags.DO_NOT_REAP_CHILD,
-                None, None)
+        session = None
+        with metrics.timer('spawn'):
+            if self._sessions is not None and not self._restoring:
+                env = dict(os.environ)
+                env.update(e.split('=', 1) for e in envv)
+                session = self._sessions.spawn(
+                    argv, env, os.environ["HOME"],
+                    vt.get_row_count(), vt.get_column_count())
+            if session is not None:
+                vt.attach_session(session)
+                pid = session.pid
+            elif hasattr(vt, 'fork_command_full'):
+                _, pid = vt.fork_command_full(
+                    Vte.PtyFlags.DEFAULT, os.environ["HOME"],
+                    argv, envv, GLib.SpawnFlags.DO_NOT_REAP_CHILD,
+                    None, None)
+            else:
+                _, pid = vt.spawn_sync(
+                    Vte.PtyFlags.DEFAULT, os.environ["HOME"],
+                    argv, envv, GLib.SpawnFlags.DO_NOT_REAP_CHILD,
+                    None, None)
 
         for name in saved:
             os.environ[name] = saved[name]
 
-        self._notebook.props.page = index
-        vt.grab_focus()
-
-        return index
+        if pid and pid > 0:
+            self._limits.apply(pid)
+        return pid
 
     def __key_press_cb(self, window, event):
+        start = time.perf_counter()
+        handled = self._handle_key_press(event)
+        metrics.observe('key_press', time.perf_counter() - start)
+        return handled
+
+    def _handle_key_press(self, event):
         """Route some keypresses directly to the vte and then drop them.
 
         This prevents Sugar from hijacking events that are useful in
@@ -527,8 +991,18 @@ class TerminalActivity(activity.Activity):
 
         key_name = Gdk.keyval_name(event.keyval)
 
+        # An accelerator may arrive before the toolbars were built on idle;
+        # build them now so Gtk can still dispatch it after this handler.
+        if not self._secondary_toolbars_built and event.get_state() & \
+                (Gdk.ModifierType.CONTROL_MASK | Gdk.ModifierType.MOD1_MASK):
+            self.build_secondary_toolbars()
+
         # Escape is used in Sugar to cancel fullscreen mode.
         if key_name == 'Escape':
+            # Escape first cancels a paste that is still being written.
+            current_page = self._notebook.get_current_page()
+            if self._notebook.get_nth_page(current_page).vt.cancel_paste():
+                return True
             event_to_vt(event)
             return True
 
@@ -555,6 +1029,19 @@ class TerminalActivity(activity.Activity):
                 elif key_name == 'T':
                     self._create_tab(None)
                     return True
+                elif key_name in ('Up', 'Down'):
+                    current_page = self._notebook.get_current_page()
+                    vt = self._notebook.get_nth_page(current_page).vt
+                    return vt.scroll_to_prompt(key_name == 'Down')
+                elif key_name == 'M' and metrics.enabled:
+                    self.dump_metrics()
+                    return True
+                elif key_name == 'P' and profiler.enabled:
+                    if profiler.running:
+                        self.dump_profiles()
+                    else:
+                        profiler.start()
+                    return True
 
         return False
 
@@ -562,13 +1049,20 @@ class TerminalActivity(activity.Activity):
         if self.metadata['mime_type'] != 'text/plain':
             return
 
-        fd = open(file_path, 'r')
-        text = fd.read()
-        data = json.loads(text)
-        fd.close()
+        start = time.perf_counter()
+        profiler.begin('restore')
+        with metrics.timer('read_file.parse'):
+            fd = open(file_path, 'r')
+            text = fd.read()
+            data = json.loads(text)
+            fd.close()
+        # The colour pickers are updated below
+        self.build_secondary_toolbars()
+
         # Clean out any existing tabs.
         while self._notebook.get_n_pages():
-            self._notebook.remove_page(0)
+            self._destroy_tab(0)
+        self._restoring = False
 
         # Restore theme
         if data['theme'] == 'custom':
@@ -591,11 +1085,15 @@ class TerminalActivity(activity.Activity):
         # Create a blank one if this state had no terminals.
         if self._notebook.get_n_pages() == 0:
             self._create_tab(None)
+        metrics.observe('read_file', time.perf_counter() - start)
+        profiler.end('restore')
 
     def write_file(self, file_path):
         if not self.metadata['mime_type']:
             self.metadata['mime_type'] = 'text/plain'
 
+        start = time.perf_counter()
+        profiler.begin('save')
         data = {}
         data['current-tab'] = self._notebook.get_current_page()
         # make sures this doesn't conflict with older terminal version
@@ -610,6 +1108,7 @@ class TerminalActivity(activity.Activity):
 
             page = self._notebook.get_nth_page(i)
 
+            phase_start = time.perf_counter()
             text = ''
             if VTE_VERSION >= 76:
                 # Use get_text with format for Vte version 0.76 and above
@@ -625,9 +1124,20 @@ class TerminalActivity(activity.Activity):
                     text = ''
 
             scrollback_lines = text.split('\n')
-
-            environ_file = '/proc/%d/environ' % page.pid
-            if os.path.isfile(environ_file):
+            first_row = int(page.vt.get_vadjustment().get_lower())
+            if page.vt.session is not None:
+                # The shell lives on, so only its screen is needed
+                scrollback_lines = \
+                    scrollback_lines[-page.vt.get_row_count():]
+                first_row = page.vt.get_screen_top()
+            metrics.observe('write_file.text',
+                            time.perf_counter() - phase_start)
+
+            phase_start = time.perf_counter()
+            environ_file = None
+            if page.pid is not None:
+                environ_file = '/proc/%d/environ' % page.pid
+            if environ_file and os.path.isfile(environ_file):
                 # Note- this currently gets the child's initial environment
                 # rather than the current environment,
                 # making it not very useful.
@@ -638,18 +1148,57 @@ class TerminalActivity(activity.Activity):
                 # terminal killed by the user
                 environment = []
                 cwd = '~'
+            metrics.observe('write_file.proc',
+                            time.perf_counter() - phase_start)
 
             font_desc = page.vt.get_font()
 
             tab_state = {'env': environment, 'cwd': cwd,
                          'font_size': font_desc.get_size(),
-                         'scrollback': scrollback_lines}
+                         'scrollback': scrollback_lines,
+                         'commands': page.vt.commands.to_list(first_row)}
+            if page.vt.session is not None:
+                tab_state['session'] = page.vt.session.id
 
             data['tabs'].append(tab_state)
 
         with open(file_path, 'w') as fd:
-            text = json.dumps(data)
-            fd.write(text)
+            with metrics.timer('write_file.json'):
+                text = json.dumps(data)
+            with metrics.timer('write_file.write'):
+                fd.write(text)
+        metrics.count('write_file.bytes', len(text))
+        metrics.observe('write_file', time.perf_counter() - start)
+        profiler.end('save')
+
+    def get_preview(self):
+        """Draw the last lines of the current tab for the Journal.
+
+        The preview is drawn again only when the tab, its output, its
+        font or the colours changed since the last save.
+        """
+        box = self._notebook.get_nth_page(self._notebook.get_current_page())
+        if box is None:
+            return None
+        vt = box.vt
+        colors = self._theme_colors['custom']
+        font = vt.get_font()
+        key = (self.get_tab_id(box), vt.counters.batches_in,
+               font.to_string(), colors['fg_color'], colors['bg_color'])
+        if key == self._preview_key:
+            return self._preview
+
+        start = time.perf_counter()
+        end_row = vt.get_cursor_position()[1]
+        start_row = max(int(vt.get_vadjustment().get_lower()),
+                        end_row - PREVIEW_LINES + 1)
+        lines = get_preview_lines(vt.get_text_rows(start_row, end_row))
+        width, height = activity.PREVIEW_SIZE
+        self._preview = render_preview(lines, font, colors['fg_color'],
+                                       colors['bg_color'], width, height)
+        self._preview_key = key
+        metrics.observe('preview', time.perf_counter() - start)
+        return self._preview
 
     def __clear_cb(self, button):
         vt = self._notebook.get_nth_page(self._notebook.get_current_page()).vt
@@ -0,0 +1,213 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Actions run when a tab prints text matching a pattern.
+
+Triggers are the sections of terminalrc named "trigger <name>":
+
+    [trigger build]
+    pattern = BUILD FAILED|Segmentation fault
+    action = notify
+
+Patterns are PCRE regular expressions, like the link patterns of VTE.
+The action is one of:
+
+    notify     show a Sugar alert (the default)
+    highlight  have VTE underline the matching text under the pointer
+    mark       mark the tab label until the tab is shown
+"""
+
+import logging
+import re
+
+from gi.repository import GLib
+
+log = logging.getLogger('Terminal')
+
+TRIGGER_SECTION_PREFIX = 'trigger '
+
+TRIGGER_ACTIONS = ('notify', 'highlight', 'mark')
+
+# Regular expressions kept for the sets of triggers left to match
+TRIGGER_REGEX_CACHE = 32
+
+_REGEX_FLAGS = GLib.RegexCompileFlags.OPTIMIZE | \
+    GLib.RegexCompileFlags.MULTILINE
+
+# Backreferences, subroutine calls and conditions that name a group by
+# its number, or recurse into the whole pattern, not preceded by an odd
+# number of backslashes
+_NUMBERED_REFERENCE = re.compile(
+    r'(?<!\\)(?:\\\\)*'
+    r'(?:\\(?:[1-9]|g\{?[-+]?[0-9])|\(\?(?:[-+]?[0-9]|R\)|\([0-9]))')
+
+
+class Trigger(object):
+
+    def __init__(self, name, pattern, action='notify'):
+        self.name = name
+        self.pattern = pattern
+        self.action = action
+
+
+def read_triggers(conf):
+    """Return the valid triggers defined in terminalrc."""
+    triggers = []
+    for section in conf.sections():
+        if not section.startswith(TRIGGER_SECTION_PREFIX):
+            continue
+        name = section[len(TRIGGER_SECTION_PREFIX):].strip()
+        pattern = conf.get(section, 'pattern', fallback='')
+        action = conf.get(section, 'action', fallback='notify')
+        if not pattern or action not in TRIGGER_ACTIONS:
+            log.error('Ignoring trigger %s: it needs a pattern and one of '
+                      'the actions %s', name, ', '.join(TRIGGER_ACTIONS))
+            continue
+        try:
+            GLib.Regex.new(pattern, _REGEX_FLAGS, 0)
+        except GLib.Error as e:
+            log.error('Ignoring trigger %s: %s', name, e.message)
+            continue
+        triggers.append(Trigger(name, pattern, action))
+    return triggers
+
+
+class _Scan(object):
+
+    __slots__ = ('row', 'idle_id', 'handler_id')
+
+    def __init__(self, row):
+        self.row = row
+        self.idle_id = None
+        self.handler_id = None
+
+
+class TriggerEngine(object):
+    """Match the output of every terminal against all triggers at once.
+
+    The patterns are compiled into one regular expression of named
+    alternatives, so rows are scanned once whatever the number of
+    triggers until one fires, and only a match looks at which trigger it
+    belongs to. The rows are scanned again without each trigger that
+    fired, since it could hide the matches of the triggers after it.
+    Patterns that refer to a group by number are compiled on their own,
+    since the alternatives renumber the groups.
+    Each terminal remembers the first row it has not scanned; rows are
+    read once complete, from a low-priority idle callback after output,
+    and never scanned again. Hidden tabs are scanned like the current
+    one.
+
+    callback is called with the terminal, the trigger and the matched
+    text, at most once per trigger and terminal for each batch of rows.
+    """
+
+    def __init__(self, triggers, callback):
+        self.triggers = [trigger for trigger in triggers
+                         if trigger.action != 'highlight']
+        self.highlights = [trigger.pattern for trigger in triggers
+                           if trigger.action == 'highlight']
+        self._callback = callback
+        self._scans = {}
+        # Regular expressions of the combined triggers, by their indexes
+        self._regexes = {}
+        # (index, regex) of the triggers matched on their own, and the
+        # indexes of those in self._regex
+        self._separate = []
+        self._combined = []
+        for i, trigger in enumerate(self.triggers):
+            if _NUMBERED_REFERENCE.search(trigger.pattern):
+                self._separate.append(
+                    (i, GLib.Regex.new(trigger.pattern, _REGEX_FLAGS, 0)))
+            else:
+                self._combined.append(i)
+        if self._combined:
+            self._get_regex(tuple(self._combined))
+
+    def watch(self, terminal):
+        if self.highlights:
+            terminal.set_highlight_patterns(self.highlights)
+        if not self.triggers:
+            return
+        scan = _Scan(terminal.get_cursor_position()[1])
+        scan.handler_id = terminal.connect('contents-changed',
+                                           self.__contents_changed_cb)
+        self._scans[terminal] = scan
+
+    def unwatch(self, terminal):
+        scan = self._scans.pop(terminal, None)
+        if scan is None:
+            return
+        terminal.disconnect(scan.handler_id)
+        if scan.idle_id is not None:
+            GLib.source_remove(scan.idle_id)
+
+    def __contents_changed_cb(self, terminal):
+        scan = self._scans[terminal]
+        if scan.idle_id is None:
+            scan.idle_id = GLib.idle_add(self.__scan_cb, terminal,
+                                         priority=GLib.PRIORITY_LOW)
+
+    def __scan_cb(self, terminal):
+        scan = self._scans[terminal]
+        scan.idle_id = None
+        row = terminal.get_cursor_position()[1]
+        # Rows that already left the scrollback cannot be read
+        start = max(scan.row, int(terminal.get_vadjustment().get_lower()))
+        scan.row = max(scan.row, row)
+        if row > start:
+            self.scan(terminal, terminal.get_text_rows(start, row - 1))
+        return False
+
+    def scan(self, terminal, text):
+        fired = set()
+        for i, regex in self._separate:
+            matched, match_info = regex.match(text, 0)
+            if matched:
+                fired.add(i)
+                self._callback(terminal, self.triggers[i],
+                               match_info.fetch(0))
+        # The leftmost alternative wins where several match, so once a
+        # trigger fired the text is matched again without it
+        remaining = tuple(self._combined)
+        while remaining:
+            matched, match_info = self._get_regex(remaining).match(text, 0)
+            if not matched:
+                break
+            for i in remaining:
+                found, start, end_ = match_info.fetch_named_pos(
+                    'sugartrigger%d' % i)
+                if found and start != -1:
+                    fired.add(i)
+                    self._callback(terminal, self.triggers[i],
+                                   match_info.fetch_named(
+                                       'sugartrigger%d' % i))
+                    break
+            else:
+                break
+            remaining = tuple(i for i in remaining if i not in fired)
+
+    def _get_regex(self, indexes):
+        """Return the regular expression of the triggers at indexes."""
+        regex = self._regexes.get(indexes)
+        if regex is None:
+            if len(self._regexes) >= TRIGGER_REGEX_CACHE:
+                self._regexes.clear()
+            regex = GLib.Regex.new(
+                '|'.join('(?<sugartrigger%d>%s)' %
+                         (i, self.triggers[i].pattern) for i in indexes),
+                _REGEX_FLAGS, 0)
+            self._regexes[indexes] = regex
+        return regex
@@ -0,0 +1,181 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Find out what blocks the main loop when the activity hitches.
+
+The watchdog is off unless enabled with the 'watchdog' option of
+terminalrc or the TERMINAL_WATCHDOG environment variable, set to the
+length in seconds of the shortest stall to report.
+
+A timer on the main loop records a heartbeat, and a thread checks it.
+When the heartbeat is late by more than the threshold, the thread takes
+the stack of the main thread and the handler the main loop called into,
+and writes them to a log that keeps the last WATCHDOG_LOG_ENTRIES
+stalls, one JSON object per line.
+"""
+
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from gi.repository import GLib
+
+from metrics import metrics
+
+log = logging.getLogger('Terminal')
+
+# Default shortest stall reported, in seconds
+WATCHDOG_THRESHOLD = 0.2
+
+# Milliseconds between two heartbeats of the main loop
+HEARTBEAT_INTERVAL = 50
+
+# Stalls kept in the log
+WATCHDOG_LOG_ENTRIES = 50
+
+BUNDLE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Code of the bundle functions that run the main loop, such as the main()
+# of standalone.py; the handlers are the frames they call into
+_main_loop_codes = set()
+
+
+def watchdog_threshold(conf):
+    """Return the stall threshold set in the environment or terminalrc.
+
+    Returns None if the watchdog is not enabled.
+    """
+    value = os.environ.get('TERMINAL_WATCHDOG', '')
+    if value in ('', '0') and conf.has_option('terminal', 'watchdog'):
+        value = conf.get('terminal', 'watchdog')
+    if value in ('', '0'):
+        return None
+    try:
+        threshold = float(value)
+    except ValueError:
+        # Any other value, such as "yes", enables the default
+        return WATCHDOG_THRESHOLD
+    return threshold if threshold > 0 else None
+
+
+def register_main_loop(function):
+    """Tell the watchdog that function, in the bundle, runs the main loop.
+    """
+    _main_loop_codes.add(function.__code__)
+
+
+def _describe_handler(frame):
+    """Return the outermost function of the bundle in a stack.
+
+    Frames of the main loop itself are C code and do not appear, so this
+    is the handler or callback the main loop is running. Frames from a
+    registered main loop function outwards are not counted.
+    """
+    handler = None
+    while frame is not None and frame.f_code not in _main_loop_codes:
+        if frame.f_code.co_filename.startswith(BUNDLE_PATH):
+            handler = frame
+        frame = frame.f_back
+    if handler is None:
+        return None
+    code = handler.f_code
+    return '%s:%d %s' % (os.path.basename(code.co_filename),
+                         handler.f_lineno,
+                         getattr(code, 'co_qualname', code.co_name))
+
+
+class MainLoopWatchdog(object):
+
+    def __init__(self, path, threshold):
+        self._path = path
+        self._threshold = threshold
+        self._main_thread = threading.main_thread().ident
+        self._heartbeat = time.monotonic()
+        self._timeout_id = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._entries = collections.deque(maxlen=WATCHDOG_LOG_ENTRIES)
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        self._entries.append(json.loads(line))
+                    except ValueError:
+                        pass
+
+    def start(self):
+        self._heartbeat = time.monotonic()
+        self._timeout_id = GLib.timeout_add(HEARTBEAT_INTERVAL,
+                                            self.__heartbeat_cb)
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        GLib.source_remove(self._timeout_id)
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def __heartbeat_cb(self):
+        self._heartbeat = time.monotonic()
+        return True
+
+    def _watch(self):
+        stall = None
+        interval = HEARTBEAT_INTERVAL / 1000.0
+        while not self._stop.wait(interval):
+            heartbeat = self._heartbeat
+            late = time.monotonic() - heartbeat - interval
+            if stall is not None and stall['heartbeat'] != heartbeat:
+                # The main loop is back; record how long it was gone
+                stall['entry']['duration'] = round(
+                    heartbeat - stall['heartbeat'] - interval, 3)
+                metrics.count('stalls')
+                metrics.observe('stall', stall['entry']['duration'])
+                self._save()
+                stall = None
+            elif stall is None and late > self._threshold:
+                stall = {'heartbeat': heartbeat,
+                         'entry': self._capture(late)}
+                self._entries.append(stall['entry'])
+                self._save()
+
+    def _capture(self, late):
+        frame = sys._current_frames().get(self._main_thread)
+        entry = {'time': time.time(),
+                 'duration': round(late, 3),
+                 'handler': _describe_handler(frame),
+                 'stack': traceback.format_stack(frame) if frame else []}
+        log.warning('main loop stalled for %.0fms in %s',
+                    late * 1000, entry['handler'])
+        return entry
+
+    def _save(self):
+        tmp_path = self._path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                for entry in self._entries:
+                    f.write(json.dumps(entry) + '\n')
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            log.error('Could not write the stall log: %s', e)
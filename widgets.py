@@ -17,12 +17,23 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import time
+from gettext import gettext as _
+
+from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gtk
 from gi.repository import Pango
 
 from sugar3.graphics.icon import Icon
 
+# A tab whose processes use more CPU than this, in percent, is marked
+RUNAWAY_CPU = 80
+
+# A background tab that printed output and then stayed quiet for this
+# many seconds is marked as silent
+SILENCE_TIMEOUT = 10
+
 
 class TabAdd(Gtk.Button):
     __gsignals__ = {
@@ -66,8 +77,21 @@ class BrowserNotebook(Gtk.Notebook):
         self.n_pages = 0
         self.width = 0
         self.button_size = 0
+        self._suspended = 0
+
+    def suspend_updates(self, suspend):
+        """Skip tab size updates on draw while suspended.
+
+        Calls nest; updates resume after as many calls with False.
+        """
+        if suspend:
+            self._suspended += 1
+        else:
+            self._suspended -= 1
 
     def _draw_cb(self, widget, event):
+        if self._suspended:
+            return
         # Update tab sizes
         n_pages = self.get_n_pages()
         width = self.get_allocation().width
@@ -99,23 +123,158 @@ class BrowserNotebook(Gtk.Notebook):
                 self.child_set_property(page, 'tab-expand', True)
 
 
+class _TabState(object):
+
+    __slots__ = ('box', 'output', 'bell', 'silent', 'last_output',
+                 'handler_ids')
+
+    def __init__(self, box):
+        self.box = box
+        self.output = False
+        self.bell = False
+        self.silent = False
+        self.last_output = 0
+        self.handler_ids = []
+
+
+class TabIndicators(object):
+    """Mark background tabs that printed output, rang or went silent.
+
+    Signals only set flags on the tab; labels are updated from a single
+    tick callback, so at most once per frame whatever the output rate.
+    Once a tab is marked, further output only records the time, which a
+    one-second timer running while any tab may go silent checks.
+    """
+
+    def __init__(self, notebook):
+        self._notebook = notebook
+        self._states = {}
+        self._dirty = set()
+        self._tick_id = None
+        self._timeout_id = None
+        notebook.connect('switch-page', self.__switch_page_cb)
+
+    def watch(self, box):
+        state = _TabState(box)
+        state.handler_ids = [
+            box.vt.connect('contents-changed', self.__contents_changed_cb,
+                           state),
+            box.vt.connect('bell', self.__bell_cb, state)]
+        self._states[box] = state
+
+    def unwatch(self, box):
+        state = self._states.pop(box, None)
+        if state is None:
+            return
+        for handler_id in state.handler_ids:
+            box.vt.disconnect(handler_id)
+        self._dirty.discard(state)
+
+    def _is_current(self, box):
+        return self._notebook.get_nth_page(
+            self._notebook.get_current_page()) is box
+
+    def __contents_changed_cb(self, vt, state):
+        state.last_output = time.monotonic()
+        if state.output and not state.silent:
+            return
+        if self._is_current(state.box):
+            return
+        state.output = True
+        state.silent = False
+        self._queue_update(state)
+        if self._timeout_id is None:
+            self._timeout_id = GLib.timeout_add_seconds(
+                1, self.__silence_timeout_cb)
+
+    def __bell_cb(self, vt, state):
+        if not state.bell and not self._is_current(state.box):
+            state.bell = True
+            self._queue_update(state)
+
+    def __silence_timeout_cb(self):
+        now = time.monotonic()
+        waiting = False
+        for state in self._states.values():
+            if state.output and not state.silent:
+                if now - state.last_output >= SILENCE_TIMEOUT:
+                    state.silent = True
+                    self._queue_update(state)
+                else:
+                    waiting = True
+        if not waiting:
+            self._timeout_id = None
+        return waiting
+
+    def __switch_page_cb(self, notebook, box, index):
+        state = self._states.get(box)
+        if state is not None and (state.output or state.bell):
+            state.output = state.bell = state.silent = False
+            self._queue_update(state)
+
+    def _queue_update(self, state):
+        self._dirty.add(state)
+        if self._tick_id is None:
+            self._tick_id = self._notebook.add_tick_callback(self.__tick_cb)
+
+    def __tick_cb(self, widget, frame_clock):
+        self._tick_id = None
+        dirty, self._dirty = self._dirty, set()
+        for state in dirty:
+            state.box.label.set_indicators(state.output, state.bell,
+                                           state.silent)
+        return False
+
+
 class TabLabel(Gtk.HBox):
     __gsignals__ = {
         'tab-close': (GObject.SignalFlags.RUN_FIRST,
                       None,
                       ([GObject.TYPE_PYOBJECT])),
+        'broadcast-toggled': (GObject.SignalFlags.RUN_FIRST,
+                              None,
+                              ([GObject.TYPE_PYOBJECT, bool])),
     }
 
     def __init__(self, child):
         GObject.GObject.__init__(self)
 
         self.child = child
+        self._broadcast_button = Gtk.CheckButton()
+        self._broadcast_button.set_tooltip_text(_('Send input to this tab'))
+        self._broadcast_button.set_no_show_all(True)
+        self._broadcast_button.connect('toggled', self.__broadcast_toggled_cb)
+        self.pack_start(self._broadcast_button, False, True, 0)
+
+        self._recording_icon = Icon(icon_name='media-record',
+                                    icon_size=Gtk.IconSize.MENU)
+        self._recording_icon.set_no_show_all(True)
+        self.pack_start(self._recording_icon, False, True, 2)
+
         self._label = Gtk.Label(label="")
         self._label.set_ellipsize(Pango.EllipsizeMode.END)
         self._label.set_alignment(0, 0.5)
         self.pack_start(self._label, True, True, 0)
         self._label.show()
 
+        self._command_label = Gtk.Label(label="")
+        self.pack_start(self._command_label, False, True, 4)
+        self._command_label.show()
+
+        self._progress_label = Gtk.Label(label="")
+        self._progress_label.set_no_show_all(True)
+        self.pack_start(self._progress_label, False, True, 4)
+
+        self._indicator_label = Gtk.Label(label="")
+        self._indicator_text = None
+        self._indicator_label.set_no_show_all(True)
+        self.pack_start(self._indicator_label, False, True, 2)
+
+        self._usage_label = Gtk.Label(label="")
+        self._usage_text = None
+        self.pack_start(self._usage_label, False, True, 4)
+        self._usage_label.show()
+
         close_tab_icon = Icon(icon_name='close-tab')
         button = Gtk.Button()
         button.add(close_tab_icon)
@@ -128,6 +287,76 @@ class TabLabel(Gtk.HBox):
     def set_text(self, title):
         self._label.set_text(title)
 
+    def set_usage(self, cpu, rss):
+        text = '%d%% %s' % (cpu, GLib.format_size(rss))
+        if cpu >= RUNAWAY_CPU:
+            text = '<span foreground="red"><b>%s</b></span>' % text
+        else:
+            text = '<small>%s</small>' % text
+        if text != self._usage_text:
+            self._usage_text = text
+            self._usage_label.set_markup(text)
+
+    def set_last_command(self, duration, exit_code):
+        text = '%.1fs' % duration
+        if exit_code:
+            text = '<span foreground="red">%s</span>' % text
+        self._command_label.set_markup('<small>%s</small>' % text)
+        if exit_code:
+            self._command_label.set_tooltip_text(
+                _('Last command took %(seconds).1f seconds and failed with '
+                  'status %(status)d') % {'seconds': duration,
+                                          'status': exit_code})
+        else:
+            self._command_label.set_tooltip_text(
+                _('Last command took %.1f seconds') % duration)
+
+    def set_broadcast(self, visible, active=False):
+        """Show or hide the box that includes the tab in broadcasts."""
+        self._broadcast_button.set_active(active)
+        self._broadcast_button.set_visible(visible)
+
+    def set_progress(self, fraction):
+        """Show how far an export has got, or hide it for None."""
+        if fraction is None:
+            self._progress_label.hide()
+            return
+        self._progress_label.set_markup(
+            '<small>%s</small>' % (_('Exporting %d%%') % (fraction * 100)))
+        self._progress_label.show()
+
+    def set_indicators(self, output, bell, silent):
+        """Show whether a background tab printed, rang or fell silent."""
+        marks = []
+        tooltips = []
+        if bell:
+            marks.append('<span foreground="red"><b>!</b></span>')
+            tooltips.append(_('The bell rang'))
+        if silent:
+            marks.append('\u25cb')
+            tooltips.append(_('Silent for %d seconds') % SILENCE_TIMEOUT)
+        elif output:
+            marks.append('\u25cf')
+            tooltips.append(_('New output'))
+        text = ' '.join(marks)
+        if text == self._indicator_text:
+            return
+        self._indicator_text = text
+        self._indicator_label.set_markup(text)
+        self._indicator_label.set_tooltip_text('\n'.join(tooltips))
+        self._indicator_label.set_visible(bool(text))
+
+    def set_marked(self, marked):
+        """Draw the title in bold red, to draw attention to the tab."""
+        attributes = Pango.AttrList()
+        if marked:
+            attributes.insert(Pango.attr_weight_new(Pango.Weight.BOLD))
+            attributes.insert(Pango.attr_foreground_new(0xffff, 0, 0))
+        self._label.set_attributes(attributes)
+
+    def set_recording(self, recording):
+        self._recording_icon.set_visible(recording)
+
     def update_size(self, size):
         self.set_size_request(size, -1)
 
@@ -139,3 +368,6 @@ class TabLabel(Gtk.HBox):
 
     def __button_clicked_cb(self, button):
         self.emit('tab-close', self.child)
+
+    def __broadcast_toggled_cb(self, button):
+        self.emit('broadcast-toggled', self.child, button.get_active())